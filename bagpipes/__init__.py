@@ -8,6 +8,7 @@ import sys
 
 from .config_utils import (
     set_config, 
+    load_config,
     list_available_configs, 
     get_current_config, 
     validate_config,
@@ -33,19 +34,45 @@ config = set_config(config_name, return_config=True, reload=False)
 from . import utils
 
 from . import models
-from . import fitting
 from . import filters
-from . import plotting
 from . import input
-from . import catalogue
-from . import moons
 
 from .models.model_galaxy import model_galaxy
 from .input.galaxy import galaxy
-from .fitting.fit import fit
 
-from .catalogue.fit_catalogue import fit_catalogue
-from .catalogue.fit_catalogue_old import fit_catalogue_old
+# These import large dependencies (e.g. matplotlib, pandas and the
+# samplers), so are only imported the first time they are accessed.
+_lazy_imports = {"fitting": (".fitting", None),
+                 "plotting": (".plotting", None),
+                 "catalogue": (".catalogue", None),
+                 "moons": (".moons", None),
+                 "fit": (".fitting.fit", "fit"),
+                 "fit_catalogue": (".catalogue.fit_catalogue",
+                                   "fit_catalogue"),
+                 "fit_catalogue_old": (".catalogue.fit_catalogue_old",
+                                       "fit_catalogue_old")}
 
+for _name in ["plot_corner", "plot_calibration", "plot_1d_posterior",
+              "plot_spectrum_posterior", "plot_sfh_posterior", "add_spectrum",
+              "plot_sfh", "plot_csfh_posterior", "plot_galaxy", "general",
+              "add_sfh_posterior", "add_csfh_posterior"]:
+    _lazy_imports[_name] = (".plotting", _name)
 
-from .plotting import plot_corner, plot_calibration, plot_1d_posterior, plot_spectrum_posterior, plot_sfh_posterior, add_spectrum, plot_sfh, plot_csfh_posterior, plot_galaxy, general, add_sfh_posterior, add_csfh_posterior
\ No newline at end of file
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        module_name, attr = _lazy_imports[name]
+        value = importlib.import_module(module_name, package=__name__)
+
+        if attr is not None:
+            value = getattr(value, attr)
+
+        globals()[name] = value
+        return value
+
+    raise AttributeError("module '" + __name__ + "' has no attribute '"
+                         + name + "'")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_imports))
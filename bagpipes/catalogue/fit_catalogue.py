@@ -96,6 +96,10 @@ class fit_catalogue(object):
 
     load_data_kwargs : dict - optional
         Any additional keyword arguments to be passed to load_data.
+
+    marginalise_mass : bool - optional
+        Whether to analytically marginalise over massformed in each fit,
+        see bagpipes.fit.
     """
 
     def __init__(self, IDs, fit_instructions, load_data, spectrum_exists=True,
@@ -108,6 +112,7 @@ class fit_catalogue(object):
         em_line_ratios_to_save = ["OIII_4959+OIII_5007__Hbeta", "Halpha__Hbeta", "Hbeta__Hgamma", "NII_6548+NII_6584__Halpha"],
         load_data_kwargs = {},
         plot_csfh = True,
+        marginalise_mass=False,
     ):
 
         self.IDs = np.array(IDs).astype(str)
@@ -132,6 +137,7 @@ class fit_catalogue(object):
         self.analysis_function = analysis_function
         self.save_pdf_txts = save_pdf_txts
         self.time_calls = time_calls
+        self.marginalise_mass = marginalise_mass
         self.n_posterior = n_posterior
         self.full_catalogue = full_catalogue
         self.load_indices = load_indices
@@ -345,7 +351,8 @@ class fit_catalogue(object):
         # Fit the object
         self.obj_fit = fit(self.galaxy, self.fit_instructions, run=self.run,
                            time_calls=self.time_calls,
-                           n_posterior=self.n_posterior)
+                           n_posterior=self.n_posterior,
+                           marginalise_mass=self.marginalise_mass)
 
         self.obj_fit.fit(verbose=verbose, n_live=n_live, use_MPI=use_MPI,
                          sampler=sampler, pool=pool, overwrite_h5 = overwrite_h5)
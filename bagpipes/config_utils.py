@@ -41,20 +41,8 @@ def set_config(config_name, return_config=False, reload=True):
     print(f"Using configuration: {config_name[1:] if config_name[0]=='_' else config_name}")
 
     os.environ['PIPES_CONFIG_NAME'] = config_name
-    
-    try:
-        # The module name is relative to the current package ('bagpipes')
-        if config_name != '':
-            if config_name[0] != '_':
-                config_name = '_' + config_name
-
-        module_name = '.configs.config' + config_name
-        config_module = importlib.import_module(module_name, package='bagpipes')
 
-    except ImportError:
-        # Handle cases where the specified config doesn't exist
-        print(f"Warning: Configuration '{module_name}' not found. Falling back to default.")
-        config_module = importlib.import_module('.configs.config_BC03', package='bagpipes')
+    config_module = load_config(config_name)
 
     # Update all possible config references in sys.modules to ensure consistency
     # This handles: bagpipes.config, bagpipes.configs.config
@@ -84,6 +72,99 @@ def set_config(config_name, return_config=False, reload=True):
         return config_module
 
 
+def load_config(config_name):
+    """
+    Loads a configuration module without making it the active config.
+
+    The returned module can be passed as the config argument of
+    model_galaxy, fitted_model, fit and the model component classes, so
+    models using different configurations can be used side by side in
+    one process.
+
+    Parameters
+    ----------
+    config_name : str
+        Name of the configuration to load. Can be with or without leading underscore.
+        Examples: 'BC03', '_BC03', 'bpass'
+
+    Returns
+    -------
+    module
+        The loaded configuration module.
+
+    Examples
+    --------
+    >>> from bagpipes.config_utils import load_config
+    >>> bpass_config = load_config('bpass')
+    >>> model = bagpipes.model_galaxy(model_components, config=bpass_config)
+    """
+
+    try:
+        # The module name is relative to the current package ('bagpipes')
+        if config_name != '':
+            if config_name[0] != '_':
+                config_name = '_' + config_name
+
+        module_name = '.configs.config' + config_name
+        config_module = importlib.import_module(module_name, package='bagpipes')
+
+    except ImportError:
+        # Handle cases where the specified config doesn't exist
+        print(f"Warning: Configuration '{module_name}' not found. Falling back to default.")
+        config_module = importlib.import_module('.configs.config_BC03', package='bagpipes')
+
+    return config_module
+
+
+def load_saved_config(config_used):
+    """
+    Returns the configuration module described by the config dictionary
+    saved alongside fit results, or None if it cannot be identified.
+
+    Parameters
+    ----------
+    config_used : dict
+        The dictionary saved in the "config" attribute of a fit .h5 file.
+
+    Returns
+    -------
+    module or None
+        The configuration module used for the fit.
+    """
+
+    if "name" in config_used:
+        return load_config(config_used["name"].rsplit(".", 1)[-1][6:])
+
+    if config_used.get("type") == "BPASS":
+        return load_config("bpass")
+
+    return None
+
+
+def config_summary(config_module):
+    """
+    Returns a dictionary describing a configuration module, which is
+    saved alongside fit results.
+
+    Parameters
+    ----------
+    config_module : module
+        The configuration module used for the fit.
+
+    Returns
+    -------
+    dict
+        The grid files, type and module name of the configuration.
+    """
+
+    return {"stellar_file": config_module.stellar_file,
+            "neb_cont_file": config_module.neb_cont_file,
+            "neb_line_file": config_module.neb_line_file,
+            "type": ("BPASS" if "bpass" in config_module.stellar_file
+                     else "BC03"),
+            "name": config_module.__name__}
+
+
 def list_available_configs():
     """
     List all available configuration modules.
@@ -1,12 +1,13 @@
 from __future__ import print_function,  division,  absolute_import
 
-import os
 import numpy as np
 
 from astropy.io import fits
 
+from .. import utils
 from ..utils import *
 from ..making import igm_inoue2014
+from .lazy_loading import open_grid_file, lazy_getattr
 
 """ This file contains all of the configuration variables for Bagpipes.
 This includes loading different grids of models into the code, and the
@@ -37,12 +38,12 @@ if these variables are changed. """
 
 # Sets the default age sampling for stellar models in log10(Gyr).
 # Beware: if you change this you need to recompute the nebular models.
-age_sampling = np.arange(6., np.log10(cosmo.age(0.).value) + 9., 0.1)
+age_sampling = np.arange(6., np.log10(utils.age_at_z[0]) + 9., 0.1)
 
 # Set up edge positions for age bins for stellar + nebular models.
 age_bins = 10**make_bins(age_sampling, make_rhs=True)[0]
 age_bins[0] = 0.
-age_bins[-1] = 10**9*cosmo.age(0.).value
+age_bins[-1] = 10**9*utils.age_at_z[0]
 
 # Set up widths for the age bins for the stellar + nebular models.
 age_widths = age_bins[1:] - age_bins[:-1]
@@ -54,50 +55,62 @@ age_sampling = 10**age_sampling
 sfr_timescale = 10**8  # This is 100 Myr by default
 
 """ These variables tell the code where to find the raw stellar emission
-models, as well as some of their basic properties. """
+models, as well as some of their basic properties. The grids themselves
+are only loaded from the grid files the first time they are accessed. """
 
-try:
-    # Name of the fits file storing the stellar models
-    stellar_file = "bpass_2.2.1_bin_imf135_300_stellar_grids.fits"
+# Name of the fits file storing the stellar models
+stellar_file = "bpass_2.2.1_bin_imf135_300_stellar_grids.fits"
 
-    # The metallicities of the stellar grids in units of Z_Solar
-    metallicities = np.array([10**-5, 10**-4, 0.001, 0.002, 0.003, 0.004,
-                              0.006, 0.008, 0.010, 0.014, 0.020, 0.030,
-                              0.040])/0.02
+# The metallicities of the stellar grids in units of Z_Solar
+metallicities = np.array([10**-5, 10**-4, 0.001, 0.002, 0.003, 0.004,
+                          0.006, 0.008, 0.010, 0.014, 0.020, 0.030,
+                          0.040])/0.02
 
-    # The wavelengths of the grid points in Angstroms
-    wavelengths = fits.open(grid_dir + "/" + stellar_file)[-1].data
+# Set up edge positions for metallicity bins for stellar models.
+metallicity_bins = make_bins(metallicities, make_rhs=True)[0]
+metallicity_bins[0] = 0.
+metallicity_bins[-1] = 10.
 
-    # The ages of the grid points in Gyr
-    raw_stellar_ages = fits.open(grid_dir + "/" + stellar_file)[-2].data
 
-    # The fraction of stellar mass still living (1 - return fraction).
-    # Axis 0 runs over metallicity, axis 1 runs over age.
-    live_frac = fits.open(grid_dir + "/" + stellar_file)[-3].data
+def _load_stellar_grids():
+    """ Loads the stellar grids from stellar_file. """
 
-    # The raw stellar grids, stored as a FITS HDUList.
-    # The different HDUs are the grids at different metallicities.
-    # Axis 0 of each grid runs over wavelength, axis 1 over age.
-    raw_stellar_grid = fits.open(grid_dir + "/" + stellar_file)[1:14]
+    global wavelengths, raw_stellar_ages, live_frac, raw_stellar_grid
 
-    # Set up edge positions for metallicity bins for stellar models.
-    metallicity_bins = make_bins(metallicities, make_rhs=True)[0]
-    metallicity_bins[0] = 0.
-    metallicity_bins[-1] = 10.
+    try:
+        grids = open_grid_file(stellar_file)
 
-except IOError:
-    print("Failed to load stellar grids, these should be placed in"
-          + " the bagpipes/models/grids/ directory.")
+        # The wavelengths of the grid points in Angstroms
+        wavelengths = grids[-1].data
+
+        # The ages of the grid points in Gyr
+        raw_stellar_ages = grids[-2].data
+
+        # The fraction of stellar mass still living (1 - return fraction).
+        # Axis 0 runs over metallicity, axis 1 runs over age.
+        live_frac = grids[-3].data
+
+        # The raw stellar grids, stored as a FITS HDUList.
+        # The different HDUs are the grids at different metallicities.
+        # Axis 0 of each grid runs over wavelength, axis 1 over age.
+        raw_stellar_grid = grids[1:14]
+
+    except IOError:
+        print("Failed to load stellar grids, these should be placed in"
+              + " the bagpipes/models/grids/ directory.")
 
 
 """ These variables tell the code where to find the raw nebular emission
 models, as well as some of their basic properties. """
 
-try:
-    # Names of files containing the nebular grids.
-    neb_cont_file = "bpass_2.2.1_bin_imf135_300_nebular_cont_grids.fits"
-    neb_line_file = "bpass_2.2.1_bin_imf135_300_nebular_line_grids.fits"
+# Names of files containing the nebular grids.
+neb_cont_file = "bpass_2.2.1_bin_imf135_300_nebular_cont_grids.fits"
+neb_line_file = "bpass_2.2.1_bin_imf135_300_nebular_line_grids.fits"
+
+# LogU values for the nebular emission grids.
+logU = np.arange(-4., -0.99, 0.5)
 
+try:
     # Names for the emission features to be tracked.
     line_names = np.loadtxt(grid_dir + "/cloudy_lines.txt",
                             dtype="str", delimiter="}")
@@ -105,55 +118,85 @@ try:
     # Wavelengths of these emission features in Angstroms.
     line_wavs = np.loadtxt(grid_dir + "/cloudy_linewavs.txt")
 
-    # Ages for the nebular emission grids.
-    neb_ages = fits.open(grid_dir
-                         + "/" + neb_line_file)[1].data[1:, 0]
+except IOError:
+    print("Failed to load nebular grids, these should be placed in the"
+          + " bagpipes/models/grids/ directory.")
+
 
-    # Wavelengths for the nebular continuum grids.
-    neb_wavs = fits.open(grid_dir + "/" + neb_cont_file)[1].data[0, 1:]
+def _load_nebular_line_grids():
+    """ Loads the nebular line grids from neb_line_file. """
 
-    # LogU values for the nebular emission grids.
-    logU = np.arange(-4., -0.99, 0.5)
+    global neb_ages, line_grid
 
-    # Grid of line fluxes.
-    line_grid = [fits.open(grid_dir + "/" + neb_line_file)[i].data for
-                 i in range(len(metallicities) * len(logU) + 1)]
+    try:
+        grids = open_grid_file(neb_line_file)
 
-    # Grid of nebular continuum fluxes.
-    cont_grid = [fits.open(grid_dir + "/" + neb_cont_file)[i].data for
-                 i in range(len(metallicities) * len(logU) + 1)]
-    print(np.sum(cont_grid[1:]))
+        # Ages for the nebular emission grids.
+        neb_ages = grids[1].data[1:, 0]
+
+        # Grid of line fluxes.
+        line_grid = [grids[i].data for
+                     i in range(len(metallicities) * len(logU) + 1)]
+
+    except IOError:
+        print("Failed to load nebular grids, these should be placed in the"
+              + " bagpipes/models/grids/ directory.")
 
-                 
-except IOError:
-    print("Failed to load nebular grids, these should be placed in the"
-          + " bagpipes/models/grids/ directory.")
+
+def _load_nebular_cont_grids():
+    """ Loads the nebular continuum grids from neb_cont_file. """
+
+    global neb_wavs, cont_grid
+
+    try:
+        grids = open_grid_file(neb_cont_file)
+
+        # Wavelengths for the nebular continuum grids.
+        neb_wavs = grids[1].data[0, 1:]
+
+        # Grid of nebular continuum fluxes.
+        cont_grid = [grids[i].data for
+                     i in range(len(metallicities) * len(logU) + 1)]
+
+    except IOError:
+        print("Failed to load nebular grids, these should be placed in the"
+              + " bagpipes/models/grids/ directory.")
 
 
 """ These variables tell the code where to find the raw dust emission
 models, as well as some of their basic properties. """
 
-try:
-    # Values of Umin for each of the Draine + Li (2007) dust emission grids.
-    umin_vals = np.array([0.10, 0.15, 0.20, 0.30, 0.40, 0.50, 0.70, 0.80, 1.00,
-                          1.20, 1.50, 2.00, 2.50, 3.00, 4.00, 5.00, 7.00, 8.00,
-                          10.0, 12.0, 15.0, 20.0, 25.0])
-
-    # Values of qpah for each of the Draine + Li (2007) dust emission grids.
-    qpah_vals = np.array([0.10, 0.47, 0.75, 1.12, 1.49, 1.77,
-                          2.37, 2.50, 3.19, 3.90, 4.58])
-
-    # Draine + Li (2007) dust emission grids, stored as a FITS HDUList.
-    dust_grid_umin_only = [
-        fits.open(grid_dir + "/dl07_grids_umin_only.fits")[i].data for i
-        in range(len(qpah_vals) + 1)]
-
-    dust_grid_umin_umax = [
-        fits.open(grid_dir + "/dl07_grids_umin_umax.fits")[i].data for i
-        in range(len(qpah_vals) + 1)]
-except IOError:
-    print("Failed to load dust emission grids, these should be placed in the"
-          + " bagpipes/models/grids/ directory.")
+# Values of Umin for each of the Draine + Li (2007) dust emission grids.
+umin_vals = np.array([0.10, 0.15, 0.20, 0.30, 0.40, 0.50, 0.70, 0.80, 1.00,
+                      1.20, 1.50, 2.00, 2.50, 3.00, 4.00, 5.00, 7.00, 8.00,
+                      10.0, 12.0, 15.0, 20.0, 25.0])
+
+# Values of qpah for each of the Draine + Li (2007) dust emission grids.
+qpah_vals = np.array([0.10, 0.47, 0.75, 1.12, 1.49, 1.77,
+                      2.37, 2.50, 3.19, 3.90, 4.58])
+
+# Names of files containing the Draine + Li (2007) dust emission grids.
+dust_umin_only_file = "dl07_grids_umin_only.fits"
+dust_umin_umax_file = "dl07_grids_umin_umax.fits"
+
+
+def _load_dust_grids():
+    """ Loads the Draine + Li (2007) dust emission grids. """
+
+    global dust_grid_umin_only, dust_grid_umin_umax
+
+    try:
+        # Draine + Li (2007) dust emission grids, stored as a FITS HDUList.
+        dust_grid_umin_only = [open_grid_file(dust_umin_only_file)[i].data
+                               for i in range(len(qpah_vals) + 1)]
+
+        dust_grid_umin_umax = [open_grid_file(dust_umin_umax_file)[i].data
+                               for i in range(len(qpah_vals) + 1)]
+
+    except IOError:
+        print("Failed to load dust emission grids, these should be placed in"
+              + " the bagpipes/models/grids/ directory.")
+
 
 """ These variables tell the code where to find the raw IGM attenuation
 models, as well as some of their basic properties. """
@@ -164,26 +207,33 @@ igm_redshifts = np.arange(0.0, max_redshift + 0.01, 0.01)
 # Wavelength points for the IGM grid.
 igm_wavelengths = np.arange(1.0, 1225.01, 1.0)
 
-# If the IGM grid has not yet been calculated, calculate it now.
-if not os.path.exists(grid_dir + "/d_igm_grid_inoue14.fits"):
-    igm_inoue2014.make_table(igm_redshifts, igm_wavelengths)
 
-else:
-    # Check that the wavelengths and redshifts in the igm file are right
-    igm_file = fits.open(grid_dir + "/d_igm_grid_inoue14.fits")
+def _load_igm_grid():
+    """ Loads the IGM attenuation grid, calculating it first if it does
+    not exist or has a different sampling to that above. """
 
-    if len(igm_file) != 4:
-        igm_inoue2014.make_table(igm_redshifts, igm_wavelengths)
-
-    else:
-        wav_check = np.min(igm_file[2].data == igm_wavelengths)
-        z_check = igm_file[3].data.shape[0] == igm_redshifts.shape[0]
+    global raw_igm_grid
 
-        if not wav_check or not z_check:
-            igm_inoue2014.make_table(igm_redshifts, igm_wavelengths)
+    if not igm_inoue2014.table_is_valid(igm_redshifts, igm_wavelengths):
+        igm_inoue2014.make_table(igm_redshifts, igm_wavelengths)
 
-# 2D numpy array containing the IGM attenuation grid.
-raw_igm_grid = fits.open(grid_dir + "/d_igm_grid_inoue14.fits")[1].data
+    # 2D numpy array containing the IGM attenuation grid.
+    raw_igm_grid = open_grid_file("d_igm_grid_inoue14.fits")[1].data
+
+
+# Grids are loaded by these functions when first accessed.
+__getattr__ = lazy_getattr(globals(), {
+    "wavelengths": _load_stellar_grids,
+    "raw_stellar_ages": _load_stellar_grids,
+    "live_frac": _load_stellar_grids,
+    "raw_stellar_grid": _load_stellar_grids,
+    "neb_ages": _load_nebular_line_grids,
+    "line_grid": _load_nebular_line_grids,
+    "neb_wavs": _load_nebular_cont_grids,
+    "cont_grid": _load_nebular_cont_grids,
+    "dust_grid_umin_only": _load_dust_grids,
+    "dust_grid_umin_umax": _load_dust_grids,
+    "raw_igm_grid": _load_igm_grid})
 
 
 """ These variables are alternatives to those given in the stellar
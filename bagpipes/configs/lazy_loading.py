@@ -0,0 +1,117 @@
+from __future__ import print_function, division, absolute_import
+
+import os
+import numpy as np
+
+from astropy.io import fits
+
+from ..utils import grid_dir
+
+""" Helpers which allow config modules to load their model grids lazily,
+the first time each is accessed, opening each grid file only once.
+
+Grid files can also be converted with bagpipes.making.pack_grids into a
+directory of native-endian .npy files, one per FITS HDU, which are loaded
+in preference to the FITS file when present and up to date. These are
+memory mapped without the byte swapping and HDU parsing FITS requires. """
+
+# Directory in which packed versions of the grid files are stored.
+packed_dir = grid_dir + "/packed"
+
+_open_files = {}
+
+
+class packed_hdu(object):
+    """ Stands in for a FITS HDU from a packed grid file, loading the
+    data as a memory mapped array when it is first accessed. """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None and os.path.exists(self.path):
+            self._data = np.load(self.path, mmap_mode="r")
+
+        return self._data
+
+
+def packed_path(filename):
+    """ Returns the directory holding the packed version of a grid file. """
+
+    return packed_dir + "/" + os.path.splitext(filename)[0]
+
+
+def _open_packed_file(filename):
+    """ Returns a list of packed_hdu objects for a grid file, or None if
+    there is no packed version newer than the FITS file. """
+
+    path = packed_path(filename)
+
+    if not os.path.exists(path + "/n_hdus.txt"):
+        return None
+
+    # Ignore packed files which are older than the FITS file.
+    fits_path = grid_dir + "/" + filename
+    packed_time = os.path.getmtime(path + "/n_hdus.txt")
+
+    if os.path.exists(fits_path) and os.path.getmtime(fits_path) > packed_time:
+        return None
+
+    n_hdus = int(np.loadtxt(path + "/n_hdus.txt"))
+
+    return [packed_hdu(path + "/" + str(i) + ".npy") for i in range(n_hdus)]
+
+
+def open_grid_file(filename):
+    """ Opens a grid file in the grids directory, once per process. The
+    data are memory mapped, so are only read from disk when needed. A
+    packed version of the file is used instead if one is available. """
+
+    path = grid_dir + "/" + filename
+
+    if path not in _open_files:
+        grids = _open_packed_file(filename)
+
+        if grids is None:
+            grids = fits.open(path, memmap=True)
+
+        _open_files[path] = grids
+
+    return _open_files[path]
+
+
+def lazy_getattr(module_globals, loaders):
+    """ Returns a module-level __getattr__ function (PEP 562) which, the
+    first time one of the variables in loaders is accessed, calls the
+    function which loads it.
+
+    Parameters
+    ----------
+
+    module_globals : dict
+        The globals() of the config module.
+
+    loaders : dict
+        Maps variable names to functions which set them as globals in
+        the config module. One function may set several variables.
+    """
+
+    def __getattr__(name):
+        if name in loaders:
+            loader = loaders[name]
+
+            # Only try each loader once, even if it fails.
+            for key in [k for k in list(loaders) if loaders[k] is loader]:
+                del loaders[key]
+
+            loader()
+
+            if name in module_globals:
+                return module_globals[name]
+
+        raise AttributeError("module '" + module_globals["__name__"]
+                             + "' has no attribute '" + name + "'")
+
+    return __getattr__
@@ -2,6 +2,9 @@ from __future__ import print_function, division, absolute_import
 
 import numpy as np
 
+from collections import OrderedDict
+from scipy.sparse import csr_matrix
+
 from .. import utils
 
 
@@ -17,10 +20,21 @@ class filter_set(object):
         files where filter curves are stored. The filter curve files
         should contain an array of wavelengths in Angstroms followed by
         a column of relative transmission values.
+
+    z_sampling : float - optional
+        Spacing of the redshift grid on which blueshifted filter curves
+        are cached, at multiples of z_sampling. Photometry is linearly
+        interpolated between grid points.
+
+    max_cache_size : int - optional
+        Maximum memory in bytes used by the redshift grid cache, the
+        least recently used redshifts are discarded beyond this.
     """
 
-    def __init__(self, filt_list):
+    def __init__(self, filt_list, z_sampling=0.0005, max_cache_size=10**8):
         self.filt_list = filt_list
+        self.z_sampling = z_sampling
+        self.max_cache_size = max_cache_size
         self.wavelengths = None
         self._load_filter_curves()
         self._calculate_min_max_wavelengths()
@@ -81,9 +95,20 @@ class filter_set(object):
                                        / np.sum(filt_weights
                                        / self.filt_dict[filt][:, 0]))
 
-    def resample_filter_curves(self, wavelengths):
+    def resample_filter_curves(self, wavelengths, exact_redshift=None):
         """ Resamples the filter curves onto a new set of wavelengths
-        and creates a 2D array of filter curves on this sampling. """
+        and creates a 2D array of filter curves on this sampling.
+
+        Parameters
+        ----------
+
+        wavelengths : numpy.ndarray
+            Rest-frame wavelengths of the spectra to be integrated.
+
+        exact_redshift : float - optional
+            A redshift at which photometry is calculated exactly rather
+            than interpolated, e.g. the redshift of a fixed-redshift fit.
+        """
 
         self.wavelengths = wavelengths  # Wavelengths for new sampling
 
@@ -100,6 +125,77 @@ class filter_set(object):
                                               self.filt_dict[filt][:, 1],
                                               left=0, right=0)
 
+        # Exact filter matrix for exact_redshift, plus a cache of
+        # matrices on a grid of redshifts at multiples of z_sampling.
+        self.exact_redshift = exact_redshift
+        self.exact_matrix = None
+        self.z_cache = OrderedDict()
+        self.z_cache_size = 0
+
+    def _calculate_filter_matrix(self, redshift):
+        """ Returns a sparse matrix of shape (n_filters, n_wavelengths)
+        containing the filter curves blueshifted by (1+z), multiplied
+        by the widths and wavelengths of each bin and normalised, such
+        that its product with a spectrum gives photometric fluxes. """
+
+        redshifted_wavs = self.wavelengths*(1. + redshift)
+
+        # Array containing blueshifted filter curves
+        filters_z = np.zeros_like(self.filt_array)
+
+        # blueshift filter curves to sample right bit of rest frame spec
+        for i in range(len(self.filt_list)):
+            filters_z[:, i] = np.interp(redshifted_wavs, self.wavelengths,
+                                        self.filt_array[:, i],
+                                        left=0, right=0)
+
+        weights = filters_z*np.expand_dims(self.widths*self.wavelengths, axis=1)
+        weights /= np.sum(weights, axis=0)
+
+        return csr_matrix(weights.T)
+
+    def _z_position(self, redshift):
+        """ Returns the index of the redshift grid point at or below
+        redshift and the fractional distance to the next one. """
+
+        z_pos = redshift/self.z_sampling
+        z_ind = int(np.floor(z_pos))
+
+        return z_ind, z_pos - z_ind
+
+    def _get_exact_filter_matrix(self):
+        """ Returns the filter matrix at exact_redshift, calculating it
+        the first time it is needed. """
+
+        if self.exact_matrix is None:
+            self.exact_matrix = self._calculate_filter_matrix(
+                self.exact_redshift)
+
+        return self.exact_matrix
+
+    def _get_cached_filter_matrix(self, z_ind):
+        """ Returns the filter matrix at the z_ind-th point of the
+        redshift grid, calculating it and adding it to the cache if
+        necessary. """
+
+        if z_ind in self.z_cache:
+            self.z_cache.move_to_end(z_ind)
+            return self.z_cache[z_ind]
+
+        matrix = self._calculate_filter_matrix(z_ind*self.z_sampling)
+
+        self.z_cache[z_ind] = matrix
+        self.z_cache_size += (matrix.data.nbytes + matrix.indices.nbytes
+                              + matrix.indptr.nbytes)
+
+        while self.z_cache_size > self.max_cache_size and len(self.z_cache) > 2:
+            old_matrix = self.z_cache.popitem(last=False)[1]
+            self.z_cache_size -= (old_matrix.data.nbytes
+                                  + old_matrix.indices.nbytes
+                                  + old_matrix.indptr.nbytes)
+
+        return matrix
+
     def get_photometry(self, spectrum, redshift, unit_conv=None):
         """ Calculates photometric fluxes. The filters are first re-
         sampled onto the same wavelength grid with transmission values
@@ -115,34 +211,36 @@ class filter_set(object):
         T(lambda*(1+z)):   transmission of blueshifted filters
         dlambda:           width of each wavelength bin
 
-        The integrals over all filters are done in one array operation
-        to improve the speed of the code.
+        The integrals over all filters are done in one sparse matrix
+        product to improve the speed of the code. Matrices are cached
+        on a grid of redshifts at multiples of z_sampling, and the
+        photometry is linearly interpolated between the two nearest grid
+        points, so it does not depend on the order of calls. At the
+        exact_redshift passed to resample_filter_curves one exact matrix
+        is used instead, which makes fixed-redshift fitting fast.
         """
 
         if self.wavelengths is None:
             raise ValueError("Please use resample_filter_curves method to set"
                              + " wavelengths before calculating photometry.")
 
-        redshifted_wavs = self.wavelengths*(1. + redshift)
+        spectrum = np.asarray(spectrum).T
 
-        # Array containing blueshifted filter curves
-        filters_z = np.zeros_like(self.filt_array)
+        if redshift == self.exact_redshift:
+            photometry = self._get_exact_filter_matrix().dot(spectrum)
+            z_frac = 0.
 
-        # blueshift filter curves to sample right bit of rest frame spec
-        for i in range(len(self.filt_list)):
-            filters_z[:, i] = np.interp(redshifted_wavs, self.wavelengths,
-                                        self.filt_array[:, i],
-                                        left=0, right=0)
+        else:
+            z_ind, z_frac = self._z_position(redshift)
+            photometry = self._get_cached_filter_matrix(z_ind).dot(spectrum)
 
-        # Calculate numerator of expression
-        flux = np.expand_dims(spectrum*self.widths*self.wavelengths, axis=1)
-        flux = np.sum(flux*filters_z, axis=0)
+        if z_frac > 0.:
+            photometry = ((1. - z_frac)*photometry
+                          + z_frac*self._get_cached_filter_matrix(z_ind+1).dot(spectrum))
 
-        # Calculate denominator of expression
-        norm = filters_z*np.expand_dims(self.widths*self.wavelengths, axis=1)
-        norm = np.sum(norm, axis=0)
+        photometry = photometry.T
 
-        photometry = np.squeeze(flux/norm)
+        photometry = np.squeeze(photometry)
 
         # This is a little dodgy as pointed out by Ivo, it should depend
         # on the spectral shape however only currently used for UVJ mags
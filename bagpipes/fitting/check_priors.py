@@ -5,7 +5,7 @@ import numpy as np
 from copy import deepcopy
 
 from ..models.star_formation_history import star_formation_history
-from ..models.model_galaxy import model_galaxy
+from ..models.model_galaxy import model_galaxy, fit_beta_C94_batch
 
 from .prior import prior, dirichlet
 
@@ -48,10 +48,7 @@ class check_priors:
                 )
 
         self.samples = {}
-        self.samples2d = np.zeros((self.n_draws, self.ndim))
-
-        for i in range(self.n_draws):
-            self.samples2d[i, :] = self.prior.sample()
+        self.samples2d = self.prior.sample_batch(self.n_draws)
 
         for i in range(self.ndim):
             self.samples[self.params[i]] = self.samples2d[:, i]
@@ -218,6 +215,9 @@ class check_priors:
         for line in self.model_galaxy.lines_to_save:
             all_names.append(f"{line}_cont")
 
+        # beta_C94 is fitted to all of the draws at once below, rather
+        # than in each update.
+        self.model_galaxy.calculate_beta_C94 = False
         self.model_galaxy.update(self.model_components, extra_model_components = True)
 
         if getattr(self.model_galaxy, 'lines_to_save', None) is not None:
@@ -241,4 +241,13 @@ class check_priors:
                     self.samples[q][i] = spectrum
                     continue
 
+                if q == "beta_C94":
+                    continue
+
                 self.samples[q][i] = getattr(self.model_galaxy, q)
+
+        self.model_galaxy.calculate_beta_C94 = True
+
+        if "beta_C94" in quantity_names:
+            self.samples["beta_C94"][:, 0] = fit_beta_C94_batch(
+                self.samples["spectrum_full_cont"], self.model_galaxy)
@@ -8,8 +8,6 @@ import warnings
 import h5py
 import contextlib
 
-from bagpipes import config
-
 from copy import deepcopy
 
 try:
@@ -40,6 +38,7 @@ except ImportError:
     rank = 0
 
 from .. import utils
+from .. import config_utils
 from .. import plotting
 
 from .fitted_model import fitted_model
@@ -110,10 +109,21 @@ class fit(object):
     n_posterior : int - optional
         How many equally weighted samples should be generated from the
         posterior once fitting is complete. Default is 500.
+
+    config : module - optional
+        The config to use, e.g. from bagpipes.config_utils.load_config.
+        Defaults to the config saved with existing results if this can be
+        identified, otherwise the currently active config.
+
+    marginalise_mass : bool - optional
+        Whether to analytically marginalise over the massformed parameter
+        rather than sampling it, which is possible for models with one
+        star-formation history component. The mass posterior is drawn
+        afterwards, so the saved samples include massformed as usual.
     """
 
     def __init__(self, galaxy, fit_instructions, run=".", time_calls=False,
-                 n_posterior=500):
+                 n_posterior=500, config=None, marginalise_mass=False):
 
         self.run = run
         self.galaxy = galaxy
@@ -134,23 +144,25 @@ class fit(object):
         if os.path.exists(self.fname[:-1] + ".h5"):
             file = h5py.File(self.fname[:-1] + ".h5", "r")
 
+            try:
+                self.config_used = eval(file.attrs["config"])
+                if config is None:
+                    config = config_utils.load_saved_config(self.config_used)
+
+            except KeyError:
+                pass
+
+            if config is None:
+                from bagpipes import config
+
             self.posterior = posterior(self.galaxy, run=run,
-                                       n_samples=n_posterior)
+                                       n_samples=n_posterior, config=config)
 
             fit_info_str = file.attrs["fit_instructions"]
             fit_info_str = fit_info_str.replace("array", "np.array")
             fit_info_str = fit_info_str.replace("float", "np.float")
             fit_info_str = fit_info_str.replace("np.np.", "np.")
             self.fit_instructions = eval(fit_info_str)
-            try:
-                self.config_used = eval(file.attrs["config"])
-                if self.config_used['type'] == 'BPASS':
-                    os.environ['use_bpass'] = str(int(True))
-                elif self.config_used['type'] == 'BC03':
-                    os.environ['use_bpass'] = str(int(False))
-
-            except KeyError:
-                pass
 
             for k in file.keys():
                 self.results[k] = np.array(file[k])
@@ -160,9 +172,16 @@ class fit(object):
             if rank == 0:
                 print("\nResults loaded from " + self.fname[:-1] + ".h5\n")
 
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
+
         # Set up the model which is to be fitted to the data.
         self.fitted_model = fitted_model(galaxy, self.fit_instructions,
-                                         time_calls=time_calls)
+                                         time_calls=time_calls,
+                                         config=self.config,
+                                         marginalise_mass=marginalise_mass)
 
 
     def add_quantities_to_h5(self, get_advanced=False):
@@ -195,7 +214,7 @@ class fit(object):
 
     def fit(self, verbose=False, n_live=400, use_MPI=True,
             sampler="multinest", n_eff=0, discard_exploration=False,
-            n_networks=4, pool=1, overwrite_h5=False):
+            n_networks=4, pool=1, overwrite_h5=False, vectorized=False):
         """ Fit the specified model to the input galaxy data.
 
         Parameters
@@ -226,6 +245,11 @@ class fit(object):
             Pool size used for parallelization. Only used by nautilus.
             MultiNest is parallelized with MPI.
 
+        vectorized : bool - optional
+            Whether to pass batches of parameter vectors to the prior
+            transform and likelihood, which evaluates the models with
+            model_galaxy.update_batch. Only used by nautilus.
+
         """
         if "lnz" in list(self.results) and not overwrite_h5:
             if rank == 0:
@@ -261,24 +285,43 @@ class fit(object):
 
                 start_time = time.time()
 
+            # The sampler explores all parameters, except massformed if
+            # this is marginalised over.
+            n_dim = self.fitted_model.prior.ndim
+
+            if self.fitted_model.marginalise_mass:
+                lnlike = self.fitted_model.lnlike_marginalised
+                lnlike_batch = self.fitted_model.lnlike_marginalised_batch
+
+            else:
+                lnlike = self.fitted_model.lnlike
+                lnlike_batch = self.fitted_model.lnlike_batch
+
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore")
                 os.environ["PYTHONWARNINGS"] = "ignore"
 
                 if sampler == "multinest":
-                    pmn.run(self.fitted_model.lnlike,
+                    pmn.run(lnlike,
                             self.fitted_model.prior.transform,
-                            self.fitted_model.ndim, n_live_points=n_live,
+                            n_dim, n_live_points=n_live,
                             importance_nested_sampling=False, verbose=verbose,
                             sampling_efficiency="model",
                             outputfiles_basename=self.fname, use_MPI=use_MPI)
 
                 elif sampler == "nautilus":
-                    n_sampler = Sampler(self.fitted_model.prior.transform,
-                                        self.fitted_model.lnlike, n_live=n_live,
+                    if vectorized:
+                        transform = self.fitted_model.prior.transform_batch
+                        lnlike = lnlike_batch
+
+                    else:
+                        transform = self.fitted_model.prior.transform
+
+                    n_sampler = Sampler(transform, lnlike, n_live=n_live,
                                         n_networks=n_networks, pool=pool,
-                                        n_dim=self.fitted_model.ndim,
-                                        filepath=self.fname + ".h5")
+                                        n_dim=n_dim,
+                                        filepath=self.fname + ".h5",
+                                        vectorized=vectorized)
 
                     n_sampler.run(verbose=verbose, n_eff=n_eff,
                                 discard_exploration=discard_exploration)
@@ -321,7 +364,7 @@ class fit(object):
                 self.results["lnz_err"] = float(lnz_line[-1])
 
             elif sampler == "nautilus":
-                samples2d = np.zeros((0, self.fitted_model.ndim))
+                samples2d = np.zeros((0, n_dim))
                 log_l = np.zeros(0)
                 while len(samples2d) < self.n_posterior:
                     result = n_sampler.posterior(equal_weight=True)
@@ -332,28 +375,18 @@ class fit(object):
                 self.results["lnz"] = n_sampler.log_z
                 self.results["lnz_err"] = 1.0 / np.sqrt(n_sampler.n_eff)
 
+            # Draw massformed for each sample if it was marginalised over.
+            if self.fitted_model.marginalise_mass:
+                samples2d = self.results["samples2d"]
+                samples2d = self.fitted_model.draw_massformed(samples2d)
+                self.results["samples2d"] = samples2d
+
             self.results["median"] = np.median(samples2d, axis=0)
             self.results["conf_int"] = np.percentile(self.results["samples2d"],
                                                     (16, 84), axis=0)
             
             fit_instructions = str(self.fit_instructions)
-            try:
-                use_bpass = bool(int(os.environ['use_bpass']))
-            except KeyError:
-                use_bpass = False
-
-                if use_bpass:
-                    #print('Setup to use BPASS')
-                    mtype = 'BPASS'
-                    from bagpipes import config_bpass as config
-                else:
-                    from bagpipes import config
-                    mtype = 'BC03'
-
-            try:
-                config_dict = str({'stellar_file':config.stellar_file, 'neb_cont_file':config.neb_cont_file, 'neb_line_file':config.neb_line_file, 'type':mtype})
-            except:
-                config_dict = str({})
+            config_dict = str(config_utils.config_summary(self.config))
             os.system("rm " + self.fname + "*")
 
         else:
@@ -391,7 +424,8 @@ class fit(object):
 
         # Create a posterior object to hold the results of the fit.
         self.posterior = posterior(self.galaxy, run=self.run,
-                                    n_samples=self.n_posterior)
+                                    n_samples=self.n_posterior,
+                                    config=self.config)
         self.results['basic_quantities'] = {i:j for i, j in self.posterior.samples.items() if i in self.posterior.basic_quantity_names}
         # Get quantities
         try:
@@ -4,6 +4,7 @@ import numpy as np
 import time
 
 from copy import deepcopy
+from scipy.special import logsumexp
 
 from .prior import prior, dirichlet
 from .calibration import calib_model
@@ -28,10 +29,26 @@ class fitted_model(object):
     time_calls : bool - optional
         Whether to print information on the average time taken for
         likelihood calls.
+
+    config : module - optional
+        The config to use, e.g. from bagpipes.config_utils.load_config.
+        Defaults to the currently active config.
+
+    marginalise_mass : bool - optional
+        Whether to analytically marginalise over the massformed parameter
+        of a single star-formation history component, which the model
+        fluxes scale linearly with. The sampler then only explores the
+        other parameters, through prior and lnlike_marginalised, and
+        draw_massformed recovers the mass posterior afterwards.
     """
 
-    def __init__(self, galaxy, fit_instructions, time_calls=False):
+    def __init__(self, galaxy, fit_instructions, time_calls=False,
+                 config=None, marginalise_mass=False):
 
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
         self.galaxy = galaxy
         self.fit_instructions = deepcopy(fit_instructions)
         self.model_components = deepcopy(fit_instructions)
@@ -39,8 +56,17 @@ class fitted_model(object):
 
         self._set_constants()
         self._process_fit_instructions()
+        self._compile_update_plan()
+        self.redshift_range = self._get_redshift_range()
+
+        self.marginalise_mass = marginalise_mass
+
+        if self.marginalise_mass:
+            self._set_up_mass_marginalisation()
+
+        else:
+            self.prior = prior(self.limits, self.pdfs, self.hyper_params)
 
-        self.prior = prior(self.limits, self.pdfs, self.hyper_params)
         self.model_galaxy = None
 
         if self.time_calls:
@@ -117,6 +143,29 @@ class fitted_model(object):
             #print("Check if you used lists instead of tuples for parameter ranges in fit_instructions.")
             raise ValueError("No parameters to fit.")
 
+    def _get_redshift_range(self):
+        """ Find the range of redshifts allowed by fit_instructions, the
+        model wavelength sampling only needs to cover this range. """
+
+        if "redshift" not in list(self.fit_instructions):
+            return (0., self.config.max_redshift)
+
+        redshift = self.fit_instructions["redshift"]
+
+        if isinstance(redshift, (tuple, list)):
+            z_min, z_max = redshift[0], redshift[1]
+
+        elif isinstance(redshift, str):
+            return (0., self.config.max_redshift)
+
+        else:
+            z_min = z_max = redshift
+
+        z_min = np.max([float(z_min), 0.])
+        z_max = np.min([float(z_max), self.config.max_redshift])
+
+        return (z_min, z_max)
+
     def _set_constants(self):
         """ Calculate constant factors used in the lnlike function. """
 
@@ -151,31 +200,13 @@ class fitted_model(object):
             extra_model_components = False
 
         # Update the model_galaxy with the parameters from the sampler.
-        self._update_model_components(x)
-        if self.model_galaxy is None:
-            self.model_galaxy = model_galaxy(self.model_components,
-                                             filt_list=self.galaxy.filt_list,
-                                             spec_wavs=self.galaxy.spec_wavs,
-                                             index_list=self.galaxy.index_list)
-        
-        self.model_galaxy.update(self.model_components, extra_model_components = extra_model_components)
+        self._update_model_galaxy(x, extra_model_components)
+
         # Return zero likelihood if SFH is older than the universe.
         if self.model_galaxy.sfh.unphysical:
             return -9.99*10**99
 
-        lnlike = 0.
-
-        if self.galaxy.spectrum_exists and self.galaxy.index_list is None:
-            lnlike += self._lnlike_spec()
-
-        if self.galaxy.photometry_exists:
-            lnlike += self._lnlike_phot()
-
-        if self.galaxy.index_list is not None:
-            lnlike += self._lnlike_indices()
-
-        if self.galaxy.line_labels is not None:
-            lnlike += self._lnlike_line_fluxes()
+        lnlike = self._lnlike_data()
 
         # Return zero likelihood if lnlike = nan (something went wrong).
         if np.isnan(lnlike):
@@ -200,15 +231,394 @@ class fitted_model(object):
          
         return lnlike
 
-    def _lnlike_phot(self):
-        """ Calculates the log-likelihood for photometric data. """
+    def _lnlike_data(self, scale=1.):
+        """ Returns the sum of the log-likelihoods for each type of data
+        given the current model_galaxy, with the model fluxes multiplied
+        by scale. """
+
+        lnlike = 0.
+
+        if self.galaxy.spectrum_exists and self.galaxy.index_list is None:
+            spectrum = self.model_galaxy.spectrum
+            if scale != 1.:
+                spectrum = np.c_[spectrum[:, 0], scale*spectrum[:, 1]]
+
+            lnlike += self._lnlike_spec(spectrum)
+
+        if self.galaxy.photometry_exists:
+            lnlike += self._lnlike_phot(scale*self.model_galaxy.photometry)
+
+        if self.galaxy.index_list is not None:
+            lnlike += self._lnlike_indices(self.model_galaxy.indices)
+
+        if self.galaxy.line_labels is not None:
+            line_fluxes = self.model_galaxy.line_fluxes
+            if scale != 1.:
+                line_fluxes = {k: scale*line_fluxes[k] for k in line_fluxes}
+
+            lnlike += self._lnlike_line_fluxes(line_fluxes)
+
+        return lnlike
+
+    def _update_model_galaxy(self, x, extra_model_components=False):
+        """ Updates model_galaxy, creating it if necessary, to match the
+        parameter vector x. """
+
+        self._update_model_components(x)
+        if self.model_galaxy is None:
+            self.model_galaxy = model_galaxy(self.model_components,
+                                             filt_list=self.galaxy.filt_list,
+                                             spec_wavs=self.galaxy.spec_wavs,
+                                             index_list=self.galaxy.index_list,
+                                             config=self.config,
+                                             redshift_range=self.redshift_range)
+        
+        self.model_galaxy.update(self.model_components, extra_model_components = extra_model_components)
+
+    def lnlike_batch(self, x, ndim=0, nparam=0):
+        """ Returns the log-likelihoods for a 2D array of parameter
+        vectors with shape (n_models, ndim), as passed by vectorised
+        samplers. The models are evaluated using update_batch. """
+
+        model_comps = self._update_model_galaxy_batch(x)
+
+        lnlike = self._lnlike_data_batch(model_comps)
+
+        # Return zero likelihood for unphysical or failed models.
+        lnlike[self.model_galaxy.unphysical_batch] = -9.99*10**99
+        lnlike[~np.isfinite(lnlike)] = -9.99*10**99
+
+        return lnlike
+
+    def _update_model_galaxy_batch(self, x):
+        """ Updates model_galaxy with update_batch for a 2D array of
+        parameter vectors, returning their model_components. """
+
+        x = np.atleast_2d(x)
+        n_models = x.shape[0]
+
+        # Build a model_components dictionary for each parameter vector.
+        model_comps = []
+        for i in range(n_models):
+            self._update_model_components(x[i])
+            model_comps.append(deepcopy(self.model_components))
+
+        if self.model_galaxy is None:
+            self.model_galaxy = model_galaxy(model_comps[0],
+                                             filt_list=self.galaxy.filt_list,
+                                             spec_wavs=self.galaxy.spec_wavs,
+                                             index_list=self.galaxy.index_list,
+                                             config=self.config,
+                                             redshift_range=self.redshift_range)
+
+        self.model_galaxy.update_batch(model_comps)
+
+        return model_comps
+
+    def _lnlike_data_batch(self, model_comps, scale=1.):
+        """ Batch version of _lnlike_data, for the models calculated by
+        _update_model_galaxy_batch. """
+
+        n_models = len(model_comps)
+        lnlike = np.zeros(n_models)
+
+        if self.galaxy.photometry_exists:
+            photometry = scale*self.model_galaxy.photometry_batch
+            lnlike += self._lnlike_phot(photometry)
+
+        if self.galaxy.index_list is not None:
+            lnlike += self._lnlike_indices(self.model_galaxy.indices_batch)
+
+        for i in range(n_models):
+            self.model_components = model_comps[i]
+
+            if self.galaxy.spectrum_exists and self.galaxy.index_list is None:
+                spectrum = np.c_[self.model_galaxy.spec_wavs,
+                                 scale*self.model_galaxy.spectrum_batch[i]]
+
+                lnlike[i] += self._lnlike_spec(spectrum)
+
+            if self.galaxy.line_labels is not None:
+                line_fluxes = self.model_galaxy.line_fluxes_batch[i]
+                if scale != 1.:
+                    line_fluxes = {k: scale*line_fluxes[k]
+                                   for k in line_fluxes}
+
+                lnlike[i] += self._lnlike_line_fluxes(line_fluxes)
+
+        return lnlike
+
+    def _set_up_mass_marginalisation(self):
+        """ Checks that the model fluxes scale linearly with massformed,
+        and sets up the prior over the other parameters and the tables
+        used to integrate over massformed. """
+
+        fit_info = self.fit_instructions
+
+        mass_comps = [k for k in list(fit_info) if isinstance(fit_info[k], dict)
+                      and "massformed" in list(fit_info[k])]
+
+        if (len(mass_comps) != 1
+                or mass_comps[0] + ":massformed" not in self.params):
+            raise ValueError("Bagpipes: marginalise_mass requires a single "
+                             "star-formation history component with a "
+                             "fitted massformed parameter.")
+
+        if "agn" in list(fit_info):
+            raise ValueError("Bagpipes: marginalise_mass cannot be used with "
+                             "an AGN component, which does not scale with "
+                             "massformed.")
+
+        if ("calib" in list(fit_info)
+                and "max_like" in fit_info["calib"]["type"]):
+            raise ValueError("Bagpipes: marginalise_mass cannot be used with "
+                             "a maximum-likelihood calibration model.")
+
+        use_spectrum = (self.galaxy.spectrum_exists
+                        and self.galaxy.index_list is None)
+
+        if not (self.galaxy.photometry_exists or use_spectrum
+                or self.galaxy.line_labels is not None):
+            raise ValueError("Bagpipes: marginalise_mass requires photometry,"
+                             " a spectrum or line fluxes to be fitted.")
+
+        self.mass_index = self.params.index(mass_comps[0] + ":massformed")
+        self.sampled_indices = [i for i in range(self.ndim)
+                                if i != self.mass_index]
+
+        # The sampler only explores the other parameters.
+        ind = self.sampled_indices
+        self.prior = prior([self.limits[i] for i in ind],
+                           [self.pdfs[i] for i in ind],
+                           [self.hyper_params[i] for i in ind])
+
+        # Models are calculated at a reference mass then rescaled.
+        limits = self.limits[self.mass_index]
+        self.mass_limits = (float(limits[0]), float(limits[1]))
+        self.mass_ref = (self.mass_limits[0] + self.mass_limits[1])/2.
+
+        # Tabulate the log prior density in massformed from its transform.
+        self.mass_prior = prior([limits], [self.pdfs[self.mass_index]],
+                                [self.hyper_params[self.mass_index]])
+
+        # The table is evenly spaced in mass so it also resolves the
+        # tails of the prior, the cube values are found by bisection.
+        mass = np.linspace(self.mass_limits[0], self.mass_limits[1], 4097)
+        cube_min = np.zeros_like(mass)
+        cube_max = np.ones_like(mass)
+
+        for i in range(64):
+            cube = (cube_min + cube_max)/2.
+            values = self.mass_prior.transform_batch(cube[:, np.newaxis])
+            below = values[:, 0] < mass
 
-        diff = (self.galaxy.photometry[:, 1] - self.model_galaxy.photometry)**2
-        self.chisq_phot = np.sum(diff*self.inv_sigma_sq_phot)
+            cube_min = np.where(below, cube, cube_min)
+            cube_max = np.where(below, cube_max, cube)
+
+        cube = (cube_min + cube_max)/2.
+        cube[0], cube[-1] = 0., 1.
+
+        self.mass_table = mass
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.ln_mass_prior_table = np.log(np.gradient(cube, mass,
+                                                          edge_order=2))
+
+        # Zero prior density where the cube values cannot be separated.
+        bad = ~np.isfinite(self.ln_mass_prior_table)
+        self.ln_mass_prior_table[bad] = -9.99*10**99
+
+        # Gauss-Legendre nodes and weights for integrating over mass.
+        self.mass_nodes, self.mass_weights = np.polynomial.legendre.leggauss(64)
+
+    def _insert_reference_mass(self, x):
+        """ Returns full parameter vectors, with massformed set to the
+        reference mass, from vectors of the sampled parameters. """
+
+        x = np.atleast_2d(x)
+        param = np.zeros((x.shape[0], self.ndim))
+        param[:, self.sampled_indices] = x
+        param[:, self.mass_index] = self.mass_ref
+
+        return param
+
+    def _get_lnlike_coefs(self, lnlike_function):
+        """ Returns c0, c1 and c2 where lnlike = c0 + c1*a + c2*a**2 and a
+        is the factor the current model fluxes are multiplied by. This
+        is exact as the model is linear in a, so the coefficients are
+        found from three evaluations of lnlike_function(scale). """
+
+        lnlike_zero = lnlike_function(0.)
+        lnlike_minus = lnlike_function(-1.)
+        lnlike_plus = lnlike_function(1.)
+
+        c1 = (lnlike_plus - lnlike_minus)/2.
+        c2 = (lnlike_plus + lnlike_minus)/2. - lnlike_zero
+
+        return lnlike_zero, c1, c2
+
+    def _get_mass_window(self, c1, c2):
+        """ Returns the range of massformed over which the likelihood,
+        lnlike = c0 + c1*a + c2*a**2 with a = 10**(massformed - mass_ref),
+        is significant within the prior limits. The likelihood is
+        Gaussian in a with the peak and variance also returned. """
+
+        var = -0.5/c2
+        a_peak = c1*var
+        width = 10*np.sqrt(var)
+
+        a_lo = 10**(self.mass_limits[0] - self.mass_ref)
+        a_hi = 10**(self.mass_limits[1] - self.mass_ref)
+
+        a_min = np.clip(a_peak - width, a_lo, a_hi)
+        a_max = np.clip(a_peak + width, a_lo, a_hi)
+
+        # If the peak is outside the prior use the range next to the
+        # nearest limit over which the likelihood falls by e**40.
+        distance = np.abs(a_peak - np.clip(a_peak, a_lo, a_hi))
+
+        with np.errstate(divide="ignore"):
+            tail = np.minimum(width, 40*var/distance)
+
+        a_max = np.where(a_peak < a_lo, np.minimum(a_lo + tail, a_hi), a_max)
+        a_min = np.where(a_peak > a_hi, np.maximum(a_hi - tail, a_lo), a_min)
+
+        mass_min = np.log10(a_min) + self.mass_ref
+        mass_max = np.log10(a_max) + self.mass_ref
+
+        return mass_min, mass_max, a_peak, var
+
+    def _marginalise_lnlike(self, c0, c1, c2):
+        """ Integrates the likelihood, lnlike = c0 + c1*a + c2*a**2 with
+        a = 10**(massformed - mass_ref), over the prior in massformed.
+        Accepts arrays of coefficients for several models. """
+
+        c0, c1, c2 = np.atleast_1d(c0, c1, c2)
+        lnlike = np.full(c0.shape, -9.99*10**99)
+
+        # The likelihood must fall away from its peak in a.
+        good = (c2 < 0.) & np.isfinite(c0 + c1 + c2)
+
+        if not np.any(good):
+            return lnlike
+
+        c0, c1, c2 = c0[good], c1[good], c2[good]
+
+        mass_min, mass_max, a_peak, var = self._get_mass_window(c1, c2)
+
+        half_range = np.expand_dims((mass_max - mass_min)/2., axis=1)
+        mass = (np.expand_dims((mass_max + mass_min)/2., axis=1)
+                + half_range*self.mass_nodes)
+
+        a = 10**(mass - self.mass_ref)
+
+        ln_integrand = (-0.5*(a - np.expand_dims(a_peak, axis=1))**2
+                        / np.expand_dims(var, axis=1)
+                        + np.interp(mass, self.mass_table,
+                                    self.ln_mass_prior_table))
+
+        with np.errstate(divide="ignore"):
+            ln_weights = np.log(half_range*self.mass_weights)
+
+        lnlike_max = c0 + 0.5*c1*a_peak
+        lnlike[good] = lnlike_max + logsumexp(ln_integrand + ln_weights,
+                                              axis=1)
+
+        lnlike[~np.isfinite(lnlike)] = -9.99*10**99
+
+        return lnlike
+
+    def lnlike_marginalised(self, x, ndim=0, nparam=0):
+        """ Returns the log-likelihood for a vector of the sampled
+        parameters, marginalised over massformed. Only available if
+        marginalise_mass was set. """
+
+        x = [x[i] for i in range(self.prior.ndim)]
+        self._update_model_galaxy(self._insert_reference_mass(x)[0])
+
+        # Return zero likelihood if SFH is older than the universe.
+        if self.model_galaxy.sfh.unphysical:
+            return -9.99*10**99
+
+        coefs = self._get_lnlike_coefs(self._lnlike_data)
+
+        return self._marginalise_lnlike(*coefs)[0]
+
+    def lnlike_marginalised_batch(self, x, ndim=0, nparam=0):
+        """ Batch version of lnlike_marginalised for a 2D array of
+        sampled parameter vectors with shape (n_models, ndim). """
+
+        param = self._insert_reference_mass(x)
+        model_comps = self._update_model_galaxy_batch(param)
+
+        def lnlike_function(scale):
+            return self._lnlike_data_batch(model_comps, scale=scale)
+
+        lnlike = self._marginalise_lnlike(*self._get_lnlike_coefs(lnlike_function))
+
+        # Return zero likelihood for unphysical models.
+        lnlike[self.model_galaxy.unphysical_batch] = -9.99*10**99
+
+        return lnlike
+
+    def draw_massformed(self, samples2d, n_grid=1025):
+        """ Draws a value of massformed for each posterior sample of the
+        other parameters from its conditional posterior, returning the
+        full 2D array of samples with massformed inserted.
+
+        parameters
+        ----------
+
+        samples2d : numpy.ndarray
+            Posterior samples of the sampled parameters with shape
+            (n_samples, ndim - 1).
+
+        n_grid : int - optional
+            Number of points used to sample massformed within the range
+            where the likelihood is significant.
+        """
+
+        param = self._insert_reference_mass(samples2d)
+
+        for i in range(param.shape[0]):
+            self._update_model_galaxy(param[i])
+
+            coefs = self._get_lnlike_coefs(self._lnlike_data)
+            c0, c1, c2 = np.atleast_1d(*coefs)
+
+            # Fall back on the prior if the likelihood is not defined.
+            if self.model_galaxy.sfh.unphysical or not c2[0] < 0.:
+                cube = np.random.rand(1, 1)
+                param[i, self.mass_index] = self.mass_prior.transform_batch(cube)[0, 0]
+                continue
+
+            mass_min, mass_max, a_peak, var = self._get_mass_window(c1, c2)
+            mass = np.linspace(mass_min[0], mass_max[0], n_grid)
+            a = 10**(mass - self.mass_ref)
+
+            ln_post = (-0.5*(a - a_peak[0])**2/var[0]
+                       + np.interp(mass, self.mass_table,
+                                   self.ln_mass_prior_table))
+
+            # Sample from the cumulative distribution across the grid.
+            post = np.exp(ln_post - np.max(ln_post))
+            cdf = np.cumsum((post[1:] + post[:-1])/2.)
+            cdf = np.r_[0., cdf]/cdf[-1]
+
+            param[i, self.mass_index] = np.interp(np.random.rand(), cdf, mass)
+
+        return param
+
+    def _lnlike_phot(self, photometry):
+        """ Calculates the log-likelihood for photometric data. Also
+        accepts a 2D array of model photometry, one row per model. """
+
+        diff = (self.galaxy.photometry[:, 1] - photometry)**2
+        self.chisq_phot = np.sum(diff*self.inv_sigma_sq_phot, axis=-1)
 
         return self.K_phot - 0.5*self.chisq_phot
 
-    def _lnlike_spec(self):
+    def _lnlike_spec(self, spectrum):
         """ Calculates the log-likelihood for spectroscopic data. This
         includes options for fitting flexible spectral calibration and
         covariant noise models. """
@@ -216,13 +626,12 @@ class fitted_model(object):
         # Optionally divide the model by a polynomial for calibration.
         if "calib" in list(self.fit_instructions):
             self.calib = calib_model(self.model_components["calib"],
-                                     self.galaxy.spectrum,
-                                     self.model_galaxy.spectrum)
+                                     self.galaxy.spectrum, spectrum)
 
-            model = self.model_galaxy.spectrum[:, 1]/self.calib.model
+            model = spectrum[:, 1]/self.calib.model
 
         else:
-            model = self.model_galaxy.spectrum[:, 1]
+            model = spectrum[:, 1]
 
         # Calculate differences between model and observed spectrum
         diff = (self.galaxy.spectrum[:, 1] - model)
@@ -263,19 +672,20 @@ class fitted_model(object):
 
             return K_spec - 0.5*self.chisq_spec
 
-    def _lnlike_indices(self):
-        """ Calculates the log-likelihood for spectral indices. """
+    def _lnlike_indices(self, indices):
+        """ Calculates the log-likelihood for spectral indices. Also
+        accepts a 2D array of model indices, one row per model. """
 
-        diff = (self.galaxy.indices[:, 0] - self.model_galaxy.indices)**2
-        self.chisq_ind = np.sum(diff*self.inv_sigma_sq_ind)
+        diff = (self.galaxy.indices[:, 0] - indices)**2
+        self.chisq_ind = np.sum(diff*self.inv_sigma_sq_ind, axis=-1)
 
         return self.K_ind - 0.5*self.chisq_ind
 
-    def _lnlike_line_fluxes(self):
+    def _lnlike_line_fluxes(self, line_fluxes):
         """ Calculates the log-likelihood for spectral line fluxes. """
 
         labels = self.galaxy.line_labels
-        model_line_fluxes = [self.model_galaxy.line_fluxes[l] for l in labels]
+        model_line_fluxes = [line_fluxes[l] for l in labels]
         model_line_fluxes = np.array(model_line_fluxes)
 
         diff = (self.galaxy.line_fluxes[:, 0] - model_line_fluxes)**2
@@ -283,52 +693,104 @@ class fitted_model(object):
 
         return self.K_lines - 0.5*self.chisq_lines
 
-    def _update_model_components(self, param):
-        """ Generates a model object with the current parameters. """
+    def _split_param_name(self, name):
+        """ Splits a parameter name into the model component it belongs
+        to, or None for top-level parameters, and its key. """
 
-        dirichlet_comps = []
+        split = name.split(":")
+
+        if len(split) == 1:
+            return None, name
+
+        return split[0], split[1]
+
+    def _compile_update_plan(self):
+        """ Works out once where each value in a parameter vector needs
+        to go in model_components, so that _update_model_components does
+        no string handling. Mirror parameters are traced back to the
+        fitted parameter, or fixed value, they ultimately follow. """
+
+        # (component, key, index in param) for fitted and mirror params.
+        self.update_plan = []
+
+        # (component, key, value) for params which mirror fixed values.
+        self.update_constants = []
+
+        # Component and param indices for any Dirichlet parameters.
+        self.dirichlet_comp = None
+        self.dirichlet_indices = []
 
-        # Substitute values of fit params from param into model_comp.
         for i in range(len(self.params)):
-            # print(param[i])
-            split = self.params[i].split(":")
-            if len(split) == 1:
-                self.model_components[self.params[i]] = param[i]
+            comp, key = self._split_param_name(self.params[i])
+
+            if comp is not None and "dirichlet" in key:
+                if self.dirichlet_comp is None:
+                    self.dirichlet_comp = comp
+
+                if comp == self.dirichlet_comp:
+                    self.dirichlet_indices.append(i)
+
+            else:
+                self.update_plan.append((comp, key, i))
+
+        for name in list(self.mirror_pars):
+            comp, key = self._split_param_name(name)
 
-            elif len(split) == 2:
-                if "dirichlet" in split[1]:
-                    if split[0] not in dirichlet_comps:
-                        dirichlet_comps.append(split[0])
+            source = self.mirror_pars[name]
+            followed = [name]
+            while source in list(self.mirror_pars) and source not in followed:
+                followed.append(source)
+                source = self.mirror_pars[source]
+
+            if source in self.params:
+                self.update_plan.append((comp, key, self.params.index(source)))
+
+            else:
+                source_comp, source_key = self._split_param_name(source)
+
+                if source_comp is None:
+                    value = self.fit_instructions[source_key]
 
                 else:
-                    self.model_components[split[0]][split[1]] = param[i]
+                    value = self.fit_instructions[source_comp][source_key]
+
+                self.update_constants.append((comp, key, value))
+
+        self.plan_components = None
 
-        # Set any mirror params to the value of the relevant fit param.
-        for key in list(self.mirror_pars):
-            split_par = key.split(":")
-            split_val = self.mirror_pars[key].split(":")
-            fit_val = self.model_components[split_val[0]][split_val[1]]
-            self.model_components[split_par[0]][split_par[1]] = fit_val
+    def _bind_update_plan(self):
+        """ Resolves the dictionaries in model_components which each
+        entry of the update plan writes to. This needs redoing whenever
+        model_components is replaced, e.g. by lnlike_batch. """
+
+        def target(comp):
+            if comp is None:
+                return self.model_components
+
+            return self.model_components[comp]
+
+        self.bound_plan = [(target(comp), key, i)
+                           for comp, key, i in self.update_plan]
+
+        for comp, key, value in self.update_constants:
+            target(comp)[key] = value
+
+        self.plan_components = self.model_components
+
+    def _update_model_components(self, param):
+        """ Generates a model object with the current parameters. """
+
+        if self.plan_components is not self.model_components:
+            self._bind_update_plan()
+
+        # Substitute values of fit params from param into model_comp.
+        for target, key, i in self.bound_plan:
+            target[key] = param[i]
 
         # Deal with any Dirichlet distributed parameters.
-        if len(dirichlet_comps) > 0:
-            comp = dirichlet_comps[0]
-            n_bins = 0
-            for i in range(len(self.params)):
-                split = self.params[i].split(":")
-                if (split[0] == comp) and ("dirichlet" in split[1]):
-                    n_bins += 1
-
-            self.model_components[comp]["r"] = np.zeros(n_bins)
-
-            j = 0
-            for i in range(len(self.params)):
-                split = self.params[i].split(":")
-                if (split[0] == comp) and "dirichlet" in split[1]:
-                    self.model_components[comp]["r"][j] = param[i]
-                    j += 1
-
-            tx = dirichlet(self.model_components[comp]["r"],
-                           self.model_components[comp]["alpha"])
-
-            self.model_components[comp]["tx"] = tx
+        if self.dirichlet_comp is not None:
+            comp = self.model_components[self.dirichlet_comp]
+            comp["r"] = np.array([param[i] for i in self.dirichlet_indices],
+                                 dtype=float)
+
+            comp["tx"] = dirichlet(comp["r"], comp["alpha"])
@@ -13,6 +13,7 @@ from .prior import dirichlet
 
 
 from .. import utils
+from .. import config_utils
 
 
 class posterior(object):
@@ -32,9 +33,14 @@ class posterior(object):
 
     n_samples : float - optional
         The number of posterior samples to generate for each quantity.
+
+    config : module - optional
+        The config to use. Defaults to the config saved with the fit
+        results if this can be identified, otherwise the currently
+        active config.
     """
 
-    def __init__(self, galaxy, run=".", n_samples=500):
+    def __init__(self, galaxy, run=".", n_samples=500, config=None):
 
         self.galaxy = galaxy
         self.run = run
@@ -71,15 +77,18 @@ class posterior(object):
             #self.fit_instructions = file['fit_instructions']
         try:
             self.config_used = eval(file.attrs["config"])
-            if self.config_used['type'] == 'BPASS':
-                os.environ['use_bpass'] = str(int(True))
-                print('Read BPASS from .h5. Attempting to set config, experimental.')
-            elif self.config_used['type'] == 'BC03':
-                os.environ['use_bpass'] = str(int(False))
+            if config is None:
+                config = config_utils.load_saved_config(self.config_used)
         except KeyError:
             pass
 
-        self.fitted_model = fitted_model(self.galaxy, self.fit_instructions)
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
+
+        self.fitted_model = fitted_model(self.galaxy, self.fit_instructions,
+                                         config=self.config)
 
         # 2D array of samples for the fitted parameters only.
         self.samples2d = np.array(file["samples2d"])
@@ -136,13 +145,11 @@ class posterior(object):
 
             r_values = np.c_[r_samples].T
             self.samples[comp + ":r"] = r_values
-            self.samples[comp + ":tx"] = np.zeros_like(r_values)
 
-            # Convert the fitted "r" params into tx values.
-            for i in range(self.samples2d.shape[0]):
-                alpha = self.fit_instructions[comp]["alpha"]
-                r = self.samples[comp + ":r"][i, :]
-                self.samples[comp + ":tx"][i, :] = dirichlet(r, alpha)[:-1]
+            # Convert the fitted "r" params into tx values. This is done
+            # for all rows of samples2d, which the corner plot uses.
+            alpha = self.fit_instructions[comp]["alpha"]
+            self.samples[comp + ":tx"] = dirichlet(r_values, alpha)[:, :-1]
 
             # Get the age of the Universe to convert tx into Gyr.
             if "redshift" in self.fitted_model.params:
@@ -164,7 +171,8 @@ class posterior(object):
 
         self.fitted_model._update_model_components(self.samples2d[0, :])
 
-        self.sfh = star_formation_history(self.fitted_model.model_components)
+        self.sfh = star_formation_history(self.fitted_model.model_components,
+                                          config=self.config)
 
         quantity_names = ["stellar_mass", "formed_mass", "sfr", "ssfr", "nsfr",
                           "sfr_10myr","ssfr_10myr", "nsfr_10myr", "burstiness",
@@ -207,7 +215,10 @@ class posterior(object):
                                          index_list=self.galaxy.index_list,
                                          extra_model_components = True, 
                                          lines_to_save = self.lines_to_save,
-                                         line_ratios_to_save = self.line_ratios_to_save)
+                                         line_ratios_to_save = self.line_ratios_to_save,
+                                         config=self.config,
+                                         redshift_range=self.fitted_model.redshift_range,
+                                         calculate_beta_C94=False)
         # Moved from above to enusre a model_galaxy is created
             
         all_names = ["photometry", "spectrum", "spectrum_full", "spectrum_full_cont", "uvj", 'beta_C94', "m_UV", "M_UV", "indices", "burstiness", "D4000", "xi_ion_caseB", "Ndot_ion_caseB"]
@@ -256,6 +267,13 @@ class posterior(object):
                 size = self.model_galaxy.spectrum.shape[0]
                 self.samples["noise"] = np.zeros((self.n_samples, size))
 
+        # beta_C94 is fitted to all of the samples at once below, rather
+        # than in each update.
+        if self.fitted_model.model_galaxy is None:
+            self.fitted_model._update_model_galaxy(self.samples2d[0, :])
+
+        self.fitted_model.model_galaxy.calculate_beta_C94 = False
+
         for i in range(self.n_samples):
             param = self.samples2d[self.indices[i], :]
             self.fitted_model._update_model_components(param)
@@ -281,8 +299,20 @@ class posterior(object):
                     spectrum = getattr(self.fitted_model.model_galaxy, q)[:, 1]
                     self.samples[q][i] = spectrum
                     continue
+                if q == "beta_C94":
+                    continue
                 self.samples[q][i] = getattr(self.fitted_model.model_galaxy, q)
 
+        self.fitted_model.model_galaxy.calculate_beta_C94 = True
+
+        # Fit the UV slopes of all of the samples at once.
+        if "beta_C94" in quantity_names:
+            from ..models.model_galaxy import fit_beta_C94_batch
+
+            self.samples["beta_C94"][:, 0] = fit_beta_C94_batch(
+                self.samples["spectrum_full_cont"],
+                self.fitted_model.model_galaxy)
+
     def predict(self, filt_list=None, spec_wavs=None, spec_units="ergscma",
                 phot_units="ergscma", index_list=None):
         """Obtain posterior predictions for new observables not included
@@ -297,7 +327,10 @@ class posterior(object):
                              filt_list=filt_list, phot_units=phot_units,
                              spec_wavs=spec_wavs, index_list=index_list,
                              lines_to_save = self.lines_to_save,
-                             line_ratios_to_save = self.line_ratios_to_save)
+                             line_ratios_to_save = self.line_ratios_to_save,
+                             config=self.config,
+                             redshift_range=self.fitted_model.redshift_range,
+                             save_continuum=True)
 
         all_names = ["photometry", "spectrum", "spectrum_full", "spectrum_full_cont", "uvj", 'beta_C94', "m_UV", "M_UV", "indices", "burstiness", "D4000", "xi_ion_caseB", "Ndot_ion_caseB"]
         for frame in ["rest", "obs"]:
@@ -306,7 +339,7 @@ class posterior(object):
                 all_names.append(f"{line}_EW_{frame}")
         for ratio in self.line_ratios_to_save:
             all_names.append(ratio)
-        for line in self.model_galaxy.lines_to_save:
+        for line in model.lines_to_save:
             all_names.append(f"{line}_cont")
 
         all_model_keys = dir(model)
@@ -319,7 +352,7 @@ class posterior(object):
         for i in range(self.n_samples):
             param = self.samples2d[self.indices[i], :]
             self.fitted_model._update_model_components(param)
-            model.update(self.fitted_model.model_components, extra_model_components = True)
+            model.update(self.fitted_model.model_components)
 
             for q in quantity_names:
                 if q == "spectrum":
@@ -342,7 +375,8 @@ class posterior(object):
         #    return
 
         self.fitted_model._update_model_components(self.samples2d[0, :])
-        self.sfh = star_formation_history(self.fitted_model.model_components)
+        self.sfh = star_formation_history(self.fitted_model.model_components,
+                                          config=self.config)
 
         quantity_names = ["stellar_mass", "formed_mass", "sfr", "ssfr", "nsfr",
                           "sfr_10myr","ssfr_10myr", "nsfr_10myr", "burstiness",
@@ -2,34 +2,40 @@ from __future__ import print_function, division, absolute_import
 
 import numpy as np
 
-from scipy.special import erf, erfinv
+from scipy.special import erf, erfinv, stdtrit, betaincinv
 from scipy.stats import beta, t, expon
 
 
 def dirichlet(r, alpha):
     """ This function samples from a Dirichlet distribution based on N-1
     independent random variables (r) in the range (0, 1). The method is
-    that of http://www.arxiv.org/abs/1010.3436 by Michael Betancourt."""
+    that of http://www.arxiv.org/abs/1010.3436 by Michael Betancourt.
 
-    n = r.shape[0]+1
-    x = np.zeros(n)
-    z = np.zeros(n-1)
-    alpha_tilda = np.zeros(n-1)
+    r can also be a 2D array with one set of N-1 variables per row, in
+    which case the samples are returned as rows of a 2D array. """
+
+    r = np.asarray(r, dtype=float)
+    n = r.shape[-1]+1
 
     if isinstance(alpha, (float, int)):
         alpha = np.repeat(alpha, n)
 
-    for i in range(n-1):
-        alpha_tilda[i] = np.sum(alpha[i+1:])
+    alpha = np.asarray(alpha, dtype=float)
+
+    # Sum of the alpha values after each position.
+    alpha_tilda = np.cumsum(alpha[::-1])[::-1][1:]
 
-        z[i] = beta.ppf(r[i], alpha_tilda[i], alpha[i])
+    z = betaincinv(alpha_tilda, alpha[:-1], r)
 
-    for i in range(n-1):
-        x[i] = np.prod(z[:i])*(1-z[i])
+    # Stick-breaking, x[i] = prod(z[:i])*(1 - z[i]) and x[-1] = prod(z).
+    z_prod = np.cumprod(z, axis=-1)
 
-    x[-1] = np.prod(z)
+    x = np.zeros(r.shape[:-1] + (n,))
+    x[..., 0] = 1 - z[..., 0]
+    x[..., 1:-1] = z_prod[..., :-1]*(1 - z[..., 1:])
+    x[..., -1] = z_prod[..., -1]
 
-    return np.cumsum(x)
+    return np.cumsum(x, axis=-1)
 
 
 class prior(object):
@@ -59,6 +65,63 @@ class prior(object):
         self.hyper_params = hyper_params
         self.ndim = len(limits)
 
+        self._compile_plan()
+
+    def _compile_plan(self):
+        """ Groups the parameters by prior type and calculates the
+        constants each prior needs, e.g. the bounds and normalisation of
+        a truncated distribution, so that transforms only need to apply
+        one vectorised function per prior type. Prior types without a
+        vectorised version fall back on the functions below.
+
+        The same functions are applied to single points with the
+        constants for each parameter as floats, which avoids the array
+        indexing needed for batches. """
+
+        groups = {}
+        for i in range(self.ndim):
+            groups.setdefault(self.pdfs[i], []).append(i)
+
+        self.plan = []
+        self.scalar_plan = []
+        for pdf, indices in groups.items():
+            limits = np.array([self.limits[i] for i in indices], dtype=float)
+            hyper_params = [self.hyper_params[i] for i in indices]
+
+            if hasattr(self, "_" + pdf + "_constants"):
+                get_constants = getattr(self, "_" + pdf + "_constants")
+                constants = get_constants(limits[:, 0], limits[:, 1],
+                                          hyper_params)
+
+                batch_function = getattr(self, "_" + pdf + "_batch")
+
+            else:
+                prior_function = getattr(self, pdf)
+                constants = (limits, hyper_params, prior_function)
+                batch_function = self._scalar_batch
+
+            self.plan.append((np.array(indices), batch_function, constants))
+
+            for j in range(len(indices)):
+                if batch_function == self._scalar_batch:
+                    self.scalar_plan.append((indices[j], self._scalar_value,
+                                             (limits[j], hyper_params[j],
+                                              prior_function)))
+
+                else:
+                    self.scalar_plan.append((indices[j], batch_function,
+                                             self._select(constants, j)))
+
+        self.scalar_plan.sort(key=lambda step: step[0])
+
+    def _select(self, constants, j):
+        """ Returns the constants for the j-th parameter of a group. """
+
+        if isinstance(constants, tuple):
+            return tuple(float(c[j]) for c in constants)
+
+        return float(constants[j])
+
     def sample(self):
         """ Sample from the prior distribution. """
 
@@ -66,17 +129,134 @@ class prior(object):
 
         return self.transform(cube)
 
+    def sample_batch(self, n_samples):
+        """ Draw n_samples from the prior distribution, returned with
+        shape (n_samples, ndim). """
+
+        cubes = np.random.rand(n_samples, self.ndim)
+
+        return self.transform_batch(cubes)
+
     def transform(self, cube, ndim=0, nparam=0):
-        """ Transform numbers on the unit cube to the prior volume. """
+        """ Transform numbers on the unit cube to the prior volume. The
+        cube is modified in place, as required by MultiNest. """
 
-        # Call the relevant prior functions to draw random values.
-        for i in range(self.ndim):
-            prior_function = getattr(self, self.pdfs[i])
-            cube[i] = prior_function(cube[i], self.limits[i],
-                                     self.hyper_params[i])
+        for i, function, constants in self.scalar_plan:
+            cube[i] = function(cube[i], constants)
 
         return cube
 
+    def transform_batch(self, cubes, ndim=0, nparam=0):
+        """ Transform a 2D array of points on the unit cube, with shape
+        (n_points, ndim), to the prior volume. """
+
+        cubes = np.array(cubes, dtype=float, ndmin=2)
+        values = np.empty_like(cubes)
+
+        for indices, batch_function, constants in self.plan:
+            values[:, indices] = batch_function(cubes[:, indices], constants)
+
+        return values
+
+    def _scalar_value(self, value, constants):
+        """ Applies a prior function to a single value. """
+
+        limits, hyper_params, prior_function = constants
+
+        return prior_function(value, limits, hyper_params)
+
+    def _scalar_batch(self, values, constants):
+        """ Applies a prior function to each value in turn. """
+
+        limits, hyper_params, prior_function = constants
+
+        values = np.copy(values)
+        for i in range(values.shape[0]):
+            for j in range(values.shape[1]):
+                values[i, j] = prior_function(values[i, j], limits[j],
+                                              hyper_params[j])
+
+        return values
+
+    # Constants and vectorised transforms for each prior type, these
+    # give the same results as the prior functions below.
+
+    def _uniform_constants(self, lower, upper, hyper_params):
+        return lower, upper - lower
+
+    def _uniform_batch(self, values, constants):
+        lower, width = constants
+        return lower + width*values
+
+    def _log_10_constants(self, lower, upper, hyper_params):
+        return np.log10(upper/lower), np.log10(lower)
+
+    def _log_10_batch(self, values, constants):
+        slope, intercept = constants
+        return 10**(slope*values + intercept)
+
+    def _exponential_constants(self, lower, upper, hyper_params):
+        return np.array([h["scale"] for h in hyper_params], dtype=float)
+
+    def _exponential_batch(self, values, constants):
+        return -np.log1p(-values)*constants
+
+    def _log_e_constants(self, lower, upper, hyper_params):
+        return np.log(upper/lower), np.log(lower)
+
+    def _log_e_batch(self, values, constants):
+        slope, intercept = constants
+        return np.exp(slope*values + intercept)
+
+    def _pow_10_constants(self, lower, upper, hyper_params):
+        return 10**upper - 10**lower, 10**lower
+
+    def _pow_10_batch(self, values, constants):
+        slope, intercept = constants
+        return np.log10(slope*values + intercept)
+
+    def _recip_constants(self, lower, upper, hyper_params):
+        return 1./upper - 1./lower, 1./lower
+
+    def _recip_batch(self, values, constants):
+        slope, intercept = constants
+        return 1./(slope*values + intercept)
+
+    def _recipsq_constants(self, lower, upper, hyper_params):
+        return 1./upper**2 - 1./lower**2, 1./lower**2
+
+    def _recipsq_batch(self, values, constants):
+        slope, intercept = constants
+        return 1./np.sqrt(slope*values + intercept)
+
+    def _Gaussian_constants(self, lower, upper, hyper_params):
+        mu = np.array([h["mu"] for h in hyper_params], dtype=float)
+        sigma = np.array([h["sigma"] for h in hyper_params], dtype=float)
+
+        uniform_max = erf((upper - mu)/np.sqrt(2)/sigma)
+        uniform_min = erf((lower - mu)/np.sqrt(2)/sigma)
+
+        return mu, sigma, uniform_max - uniform_min, uniform_min
+
+    def _Gaussian_batch(self, values, constants):
+        mu, sigma, width, uniform_min = constants
+        return sigma*np.sqrt(2)*erfinv(width*values + uniform_min) + mu
+
+    def _student_t_constants(self, lower, upper, hyper_params):
+        df = np.array([h.get("df", 2.0) for h in hyper_params], dtype=float)
+        loc = np.array([h.get("loc", 0.0) for h in hyper_params], dtype=float)
+        scale = np.array([h.get("scale", 0.3) for h in hyper_params],
+                         dtype=float)
+
+        uniform_min = t.cdf(lower, df=df, loc=loc, scale=scale)
+        uniform_max = t.cdf(upper, df=df, loc=loc, scale=scale)
+
+        return df, loc, scale, uniform_max - uniform_min, uniform_min
+
+    def _student_t_batch(self, values, constants):
+        df, loc, scale, width, uniform_min = constants
+        return stdtrit(df, width*values + uniform_min)*scale + loc
+
     def uniform(self, value, limits, hyper_params):
         """ Uniform prior in x where x is the parameter. """
 
@@ -3,7 +3,6 @@ from __future__ import print_function, division, absolute_import
 import numpy as np
 import os
 
-from .. import plotting
 from .. import filters
 
 from .spectral_indices import measure_index
@@ -245,6 +244,8 @@ class galaxy:
         return spec
 
     def plot(self, show=True, return_y_scale=False, y_scale_spec=None):
+        from .. import plotting
+
         return plotting.plot_galaxy(self, show=show,
                                     return_y_scale=return_y_scale,
                                     y_scale_spec=y_scale_spec)
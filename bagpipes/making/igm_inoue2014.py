@@ -1,11 +1,12 @@
 from __future__ import print_function, division, absolute_import
 
+import multiprocessing
 import numpy as np
 import os
 
 from astropy.io import fits
 
-""" This code is called once when Bagpipes is first installed in order
+""" This code is called the first time the IGM model is used in order
 to generate the IGM absorption table which is subsequently used for
 all IGM calculations. """
 
@@ -14,224 +15,190 @@ coefs = np.loadtxt(path + "/lyman_series_coefs_inoue_2014_table2.txt")
 
 
 def get_Inoue14_trans(rest_wavs, z_obs):
-    """ Calculate IGM transmission using Inoue et al. (2014) model. """
+    """ Calculate IGM transmission using Inoue et al. (2014) model.
+
+    parameters
+    ----------
+
+    rest_wavs : float or numpy.ndarray
+        Rest-frame wavelengths in Angstroms.
+
+    z_obs : float or numpy.ndarray
+        Redshift or 1D array of redshifts. If an array is passed the
+        transmission is returned with shape (n_redshifts, n_wavelengths).
+    """
 
     if isinstance(rest_wavs, float):
         rest_wavs = np.array([rest_wavs])
 
-    tau_LAF_LS = np.zeros((39, rest_wavs.shape[0]))
-    tau_DLA_LS = np.zeros((39, rest_wavs.shape[0]))
-    tau_LAF_LC = np.zeros(rest_wavs.shape[0])
-    tau_DLA_LC = np.zeros(rest_wavs.shape[0])
+    scalar_z = np.ndim(z_obs) == 0
+    z_obs = np.atleast_1d(np.array(z_obs, dtype=float))
 
-    # Populate tau_LAF_LS
-    for j in range(39):
+    # Observed wavelengths, axis 0 runs over redshift.
+    zp1 = np.expand_dims(1. + z_obs, axis=1)
+    obs_wavs = rest_wavs*zp1
 
-        if z_obs < 1.2:
-            wav_slice = ((rest_wavs*(1.+z_obs) > coefs[j, 1])
-                         & (rest_wavs*(1.+z_obs)
-                            < (1+z_obs)*coefs[j, 1]))
+    tau = np.zeros_like(obs_wavs)
 
-            tau_LAF_LS[j, wav_slice] = (coefs[j, 2]
-                                        * (rest_wavs[wav_slice]
-                                           * (1.+z_obs)/coefs[j, 1])**1.2)
+    # Lyman series, the piecewise power laws in observed wavelength are
+    # the same at all redshifts, up to the wavelength of each line at
+    # the source.
+    for j in range(39):
+        x = obs_wavs/coefs[j, 1]
+        in_range = (obs_wavs > coefs[j, 1]) & (obs_wavs < zp1*coefs[j, 1])
 
-        elif z_obs < 4.7:
-            wav_slice_1 = ((rest_wavs*(1.+z_obs) > coefs[j, 1])
-                           & (rest_wavs*(1.+z_obs) < 2.2*coefs[j, 1]))
-            wav_slice_2 = ((rest_wavs*(1.+z_obs) > 2.2*coefs[j, 1])
-                           & (rest_wavs*(1.+z_obs)
-                              < (1+z_obs)*coefs[j, 1]))
+        # Lyman alpha forest component
+        wav_slice_1 = in_range & (obs_wavs < 2.2*coefs[j, 1])
+        wav_slice_2 = (in_range & (obs_wavs > 2.2*coefs[j, 1])
+                       & (obs_wavs < 5.7*coefs[j, 1]))
+        wav_slice_3 = in_range & (obs_wavs > 5.7*coefs[j, 1])
 
-            tau_LAF_LS[j, wav_slice_1] = (coefs[j, 2]
-                                          * (rest_wavs[wav_slice_1]
-                                             * (1.+z_obs)/coefs[j, 1])**1.2)
+        tau[wav_slice_1] += coefs[j, 2]*x[wav_slice_1]**1.2
+        tau[wav_slice_2] += coefs[j, 3]*x[wav_slice_2]**3.7
+        tau[wav_slice_3] += coefs[j, 4]*x[wav_slice_3]**5.5
 
-            tau_LAF_LS[j, wav_slice_2] = (coefs[j, 3]
-                                          * (rest_wavs[wav_slice_2]
-                                             * (1.+z_obs)/coefs[j, 1])**3.7)
+        # Damped Lyman alpha system component
+        wav_slice_1 = in_range & (obs_wavs < 3.0*coefs[j, 1])
+        wav_slice_2 = in_range & (obs_wavs > 3.0*coefs[j, 1])
 
-        else:
-            wav_slice_1 = ((rest_wavs*(1.+z_obs) > coefs[j, 1])
-                           & (rest_wavs*(1.+z_obs) < 2.2*coefs[j, 1]))
+        tau[wav_slice_1] += coefs[j, 5]*x[wav_slice_1]**2.0
+        tau[wav_slice_2] += coefs[j, 6]*x[wav_slice_2]**3.0
 
-            wav_slice_2 = ((rest_wavs*(1.+z_obs) > 2.2*coefs[j, 1])
-                           & (rest_wavs*(1.+z_obs) < 5.7*coefs[j, 1]))
+    # Lyman continuum, the coefficients depend on the source redshift.
+    x = obs_wavs/911.8
+    zp1 = zp1*np.ones_like(obs_wavs)
+    in_range = (obs_wavs > 911.8) & (obs_wavs < 911.8*zp1)
 
-            wav_slice_3 = ((rest_wavs*(1.+z_obs) > 5.7*coefs[j, 1])
-                           & (rest_wavs*(1.+z_obs)
-                              < (1+z_obs)*coefs[j, 1]))
+    # Populate tau_LAF_LC
+    z_obs = np.expand_dims(z_obs, axis=1)
+    low_z = np.broadcast_to(z_obs < 1.2, obs_wavs.shape)
+    mid_z = np.broadcast_to((z_obs >= 1.2) & (z_obs < 4.7), obs_wavs.shape)
+    high_z = np.broadcast_to(z_obs >= 4.7, obs_wavs.shape)
+
+    wav_slice = in_range & low_z
+    tau[wav_slice] += 0.325*(x[wav_slice]**1.2
+                             - zp1[wav_slice]**-0.9*x[wav_slice]**2.1)
+
+    wav_slice_1 = in_range & mid_z & (obs_wavs < 911.8*2.2)
+    wav_slice_2 = in_range & mid_z & (obs_wavs > 911.8*2.2)
+
+    tau[wav_slice_1] += ((2.55*10**-2)*zp1[wav_slice_1]**1.6
+                         * x[wav_slice_1]**2.1
+                         + 0.325*x[wav_slice_1]**1.2
+                         - 0.25*x[wav_slice_1]**2.1)
+
+    tau[wav_slice_2] += ((2.55*10**-2)
+                         * (zp1[wav_slice_2]**1.6*x[wav_slice_2]**2.1
+                            - x[wav_slice_2]**3.7))
+
+    wav_slice_1 = in_range & high_z & (obs_wavs < 911.8*2.2)
+    wav_slice_2 = (in_range & high_z & (obs_wavs > 911.8*2.2)
+                   & (obs_wavs < 911.8*5.7))
+    wav_slice_3 = in_range & high_z & (obs_wavs > 911.8*5.7)
+
+    tau[wav_slice_1] += ((5.22*10**-4)*zp1[wav_slice_1]**3.4
+                         * x[wav_slice_1]**2.1
+                         + 0.325*x[wav_slice_1]**1.2
+                         - (3.14*10**-2)*x[wav_slice_1]**2.1)
+
+    tau[wav_slice_2] += ((5.22*10**-4)*zp1[wav_slice_2]**3.4
+                         * x[wav_slice_2]**2.1
+                         + 0.218*x[wav_slice_2]**2.1
+                         - (2.55*10**-2)*x[wav_slice_2]**3.7)
+
+    tau[wav_slice_3] += ((5.22*10**-4)
+                         * (zp1[wav_slice_3]**3.4*x[wav_slice_3]**2.1
+                            - x[wav_slice_3]**5.5))
 
-            tau_LAF_LS[j, wav_slice_1] = (coefs[j, 2]
-                                          * (rest_wavs[wav_slice_1]
-                                             * (1.+z_obs)/coefs[j, 1])**1.2)
+    # Populate tau_DLA_LC
+    low_z = np.broadcast_to(z_obs < 2.0, obs_wavs.shape)
 
-            tau_LAF_LS[j, wav_slice_2] = (coefs[j, 3]
-                                          * (rest_wavs[wav_slice_2]
-                                             * (1.+z_obs)/coefs[j, 1])**3.7)
+    wav_slice = in_range & low_z
+    tau[wav_slice] += (0.211*zp1[wav_slice]**2.
+                       - (7.66*10**-2)*zp1[wav_slice]**2.3
+                       * x[wav_slice]**-0.3
+                       - 0.135*x[wav_slice]**2.0)
 
-            tau_LAF_LS[j, wav_slice_3] = (coefs[j, 4]
-                                          * (rest_wavs[wav_slice_3]
-                                             * (1.+z_obs)/coefs[j, 1])**5.5)
+    wav_slice_1 = in_range & ~low_z & (obs_wavs < 911.8*3.0)
+    wav_slice_2 = in_range & ~low_z & (obs_wavs > 911.8*3.0)
 
-    # Populate tau_DLA_LS
-    for j in range(39):
+    tau[wav_slice_1] += (0.634 + (4.7*10**-2)*zp1[wav_slice_1]**3.
+                         - (1.78*10**-2)*zp1[wav_slice_1]**3.3
+                         * x[wav_slice_1]**-0.3
+                         - 0.135*x[wav_slice_1]**2.0
+                         - 0.291*x[wav_slice_1]**-0.3)
 
-        if z_obs < 2.0:
-            wav_slice = ((rest_wavs*(1.+z_obs) > coefs[j, 1])
-                         & (rest_wavs*(1.+z_obs)
-                            < (1+z_obs)*coefs[j, 1]))
+    tau[wav_slice_2] += ((4.7*10**-2)*zp1[wav_slice_2]**3.
+                         - (1.78*10**-2)*zp1[wav_slice_2]**3.3
+                         * x[wav_slice_2]**-0.3
+                         - (2.92*10**-2)*x[wav_slice_2]**3.0)
 
-            tau_DLA_LS[j, wav_slice] = (coefs[j, 5]
-                                        * (rest_wavs[wav_slice]
-                                           * (1.+z_obs)/coefs[j, 1])**2.0)
+    trans = np.exp(-tau)
 
-        else:
-            wav_slice_1 = ((rest_wavs*(1.+z_obs) > coefs[j, 1])
-                           & (rest_wavs*(1.+z_obs) < 3.0*coefs[j, 1]))
+    if scalar_z:
+        return trans[0, :]
 
-            wav_slice_2 = ((rest_wavs*(1.+z_obs) > 3.0*coefs[j, 1])
-                           & (rest_wavs*(1.+z_obs) < (1+z_obs)
-                              * coefs[j, 1]))
+    return trans
 
-            tau_DLA_LS[j, wav_slice_1] = (coefs[j, 5]
-                                          * (rest_wavs[wav_slice_1]
-                                             * (1.+z_obs)/coefs[j, 1])**2.0)
 
-            tau_DLA_LS[j, wav_slice_2] = (coefs[j, 6]
-                                          * (rest_wavs[wav_slice_2]
-                                             * (1.+z_obs)/coefs[j, 1])**3.0)
+def table_is_valid(z_array, rest_wavs):
+    """ Checks whether the IGM absorption table exists and has the
+    requested wavelength and redshift sampling. """
 
-    # Populate tau_LAF_LC
-    if z_obs < 1.2:
-        wav_slice = ((rest_wavs*(1.+z_obs) > 911.8)
-                     & (rest_wavs*(1.+z_obs) < 911.8*(1.+z_obs)))
-
-        tau_LAF_LC[wav_slice] = (0.325*((rest_wavs[wav_slice]
-                                         * (1.+z_obs)/911.8)**1.2
-                                        - (((1+z_obs)**-0.9)
-                                           * (rest_wavs[wav_slice]
-                                           * (1.+z_obs)/911.8)**2.1)))
-
-    elif z_obs < 4.7:
-        wav_slice_1 = ((rest_wavs*(1.+z_obs) > 911.8)
-                       & (rest_wavs*(1.+z_obs) < 911.8*2.2))
-
-        wav_slice_2 = ((rest_wavs*(1.+z_obs) > 911.8*2.2)
-                       & (rest_wavs*(1.+z_obs) < 911.8*(1.+z_obs)))
-
-        tau_LAF_LC[wav_slice_1] = (((2.55*10**-2)*((1+z_obs)**1.6)
-                                    * (rest_wavs[wav_slice_1]
-                                    * (1.+z_obs)/911.8)**2.1)
-                                   + (0.325*((rest_wavs[wav_slice_1]
-                                      * (1.+z_obs)/911.8)**1.2))
-                                   - (0.25*((rest_wavs[wav_slice_1]
-                                             * (1.+z_obs)/911.8)**2.1)))
-
-        tau_LAF_LC[wav_slice_2] = ((2.55*10**-2)
-                                   * (((1.+z_obs)**1.6)
-                                      * ((rest_wavs[wav_slice_2]
-                                          * (1.+z_obs)/911.8)**2.1)
-                                      - ((rest_wavs[wav_slice_2]
-                                          * (1.+z_obs)/911.8)**3.7)))
+    if not os.path.exists(path + "/d_igm_grid_inoue14.fits"):
+        return False
 
-    else:
-        wav_slice_1 = ((rest_wavs*(1.+z_obs) > 911.8)
-                       & (rest_wavs*(1.+z_obs) < 911.8*2.2))
-
-        wav_slice_2 = ((rest_wavs*(1.+z_obs) > 911.8*2.2)
-                       & (rest_wavs*(1.+z_obs) < 911.8*5.7))
-
-        wav_slice_3 = ((rest_wavs*(1.+z_obs) > 911.8*5.7)
-                       & (rest_wavs*(1.+z_obs) < 911.8*(1.+z_obs)))
-
-        tau_LAF_LC[wav_slice_1] = (((5.22*10**-4)*((1+z_obs)**3.4)
-                                    * (rest_wavs[wav_slice_1]
-                                       * (1.+z_obs)/911.8)**2.1)
-                                   + (0.325*(rest_wavs[wav_slice_1]
-                                      * (1.+z_obs)/911.8)**1.2)
-                                   - ((3.14*10**-2)*((rest_wavs[wav_slice_1]
-                                      * (1.+z_obs)/911.8)**2.1)))
-
-        tau_LAF_LC[wav_slice_2] = (((5.22*10**-4)*((1+z_obs)**3.4)
-                                    * (rest_wavs[wav_slice_2]
-                                       * (1.+z_obs)/911.8)**2.1)
-                                   + (0.218*((rest_wavs[wav_slice_2]
-                                             * (1.+z_obs)/911.8)**2.1))
-                                   - ((2.55*10**-2)*((rest_wavs[wav_slice_2]
-                                                      * (1.+z_obs)
-                                                      / 911.8)**3.7)))
-
-        tau_LAF_LC[wav_slice_3] = ((5.22*10**-4)
-                                   * (((1+z_obs)**3.4)
-                                      * (rest_wavs[wav_slice_3]
-                                         * (1.+z_obs)/911.8)**2.1
-                                      - (rest_wavs[wav_slice_3]
-                                         * (1.+z_obs)/911.8)**5.5))
+    with fits.open(path + "/d_igm_grid_inoue14.fits") as igm_file:
+        if len(igm_file) != 4:
+            return False
 
-    # Populate tau_DLA_LC
-    if z_obs < 2.0:
-        wav_slice = ((rest_wavs*(1.+z_obs) > 911.8)
-                     & (rest_wavs*(1.+z_obs) < 911.8*(1.+z_obs)))
+        wav_check = np.array_equal(igm_file[2].data, rest_wavs)
+        z_check = igm_file[3].data.shape[0] == z_array.shape[0]
 
-        tau_DLA_LC[wav_slice] = (0.211*((1+z_obs)**2.)
-                                 - (7.66*10**-2)*(((1+z_obs)**2.3)
-                                                  * (rest_wavs[wav_slice]
-                                                     * (1.+z_obs)/911.8)**-0.3)
-                                 - 0.135*((rest_wavs[wav_slice]
-                                           * (1.+z_obs)/911.8)**2.0))
+    return wav_check and z_check
 
-    else:
-        wav_slice_1 = ((rest_wavs*(1.+z_obs) > 911.8)
-                       & (rest_wavs*(1.+z_obs) < 911.8*3.0))
 
-        wav_slice_2 = ((rest_wavs*(1.+z_obs) > 911.8*3.0)
-                       & (rest_wavs*(1.+z_obs) < 911.8*(1.+z_obs)))
+def make_table(z_array, rest_wavs, n_proc=1, chunk_size=100):
+    """ Make up the igm absorption table used by bagpipes.
+
+    parameters
+    ----------
 
-        tau_DLA_LC[wav_slice_1] = (0.634 + (4.7*10**-2)*(1.+z_obs)**3.
-                                   - ((1.78*10**-2)*((1.+z_obs)**3.3)
-                                      * (rest_wavs[wav_slice_1]
-                                         * (1.+z_obs)/911.8)**-0.3)
-                                   - (0.135*(rest_wavs[wav_slice_1]
-                                             * (1.+z_obs)/911.8)**2.0)
-                                   - 0.291*(rest_wavs[wav_slice_1]
-                                            * (1.+z_obs)/911.8)**-0.3)
+    z_array : numpy.ndarray
+        Redshifts at which to calculate the transmission.
 
-        tau_DLA_LC[wav_slice_2] = ((4.7*10**-2)*(1.+z_obs)**3.
-                                   - ((1.78*10**-2)*((1.+z_obs)**3.3)
-                                      * (rest_wavs[wav_slice_2]
-                                         * (1.+z_obs)/911.8)**-0.3)
-                                   - ((2.92*10**-2)
-                                      * (rest_wavs[wav_slice_2]
-                                         * (1.+z_obs)/911.8)**3.0))
+    rest_wavs : numpy.ndarray
+        Rest-frame wavelengths at which to calculate the transmission.
 
-    tau_LAF_LS_sum = np.sum(tau_LAF_LS, axis=0)
-    tau_DLA_LS_sum = np.sum(tau_DLA_LS, axis=0)
+    n_proc : int - optional
+        Number of processes to split the calculation between.
 
-    tau = tau_LAF_LS_sum + tau_DLA_LS_sum + tau_LAF_LC + tau_DLA_LC
+    chunk_size : int - optional
+        Number of redshifts calculated together in each block.
+    """
 
-    return np.exp(-tau)
+    print("BAGPIPES: Generating IGM absorption table.")
 
+    z_chunks = [z_array[i:i + chunk_size]
+                for i in range(0, z_array.shape[0], chunk_size)]
 
-def make_table(z_array, rest_wavs):
-    """ Make up the igm absorption table used by bagpipes. """
+    args = [(rest_wavs, z_chunk) for z_chunk in z_chunks]
 
-    print("BAGPIPES: Generating IGM absorption table.")
+    if n_proc > 1:
+        with multiprocessing.Pool(n_proc) as pool:
+            d_IGM_chunks = pool.starmap(get_Inoue14_trans, args)
 
-    d_IGM_grid = np.zeros((z_array.shape[0], rest_wavs.shape[0]))
+    else:
+        d_IGM_chunks = [get_Inoue14_trans(*a) for a in args]
 
-    for i in range(z_array.shape[0]):
-        d_IGM_grid[i, :] = get_Inoue14_trans(rest_wavs, z_array[i])
+    d_IGM_grid = np.concatenate(d_IGM_chunks, axis=0)
 
     hdulist = fits.HDUList(hdus=[fits.PrimaryHDU(),
                                  fits.ImageHDU(name="trans", data=d_IGM_grid),
                                  fits.ImageHDU(name="wavs", data=rest_wavs),
                                  fits.ImageHDU(name="zred", data=z_array)])
 
-    if os.path.exists(path + "/d_igm_grid_inoue14.fits"):
-        os.system("rm " + path + "/d_igm_grid_inoue14.fits")
-
-    hdulist.writeto(path + "/d_igm_grid_inoue14.fits")
+    hdulist.writeto(path + "/d_igm_grid_inoue14.fits", overwrite=True)
 
 
 def test():
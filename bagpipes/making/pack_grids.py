@@ -0,0 +1,125 @@
+from __future__ import print_function, division, absolute_import
+
+import argparse
+import importlib
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from astropy.io import fits
+
+""" Converts the FITS grid files used by a config into directories of
+native-endian .npy files, one per HDU, which the config modules then load
+in preference to the FITS files. Run with e.g.
+
+    python -m bagpipes.making.pack_grids --config BC03_v1_3
+"""
+
+
+def config_grid_files(config):
+    """ Returns the names of the grid files used by a config module. """
+
+    names = ["stellar_file", "neb_cont_file", "neb_line_file",
+             "dust_umin_only_file", "dust_umin_umax_file"]
+
+    grid_files = [getattr(config, n) for n in names if hasattr(config, n)]
+    grid_files.append("d_igm_grid_inoue14.fits")
+
+    return grid_files
+
+
+def pack_grid_file(filename, overwrite=False):
+    """ Writes a packed version of one FITS file in the grids directory.
+
+    parameters
+    ----------
+
+    filename : str
+        Name of the FITS file in bagpipes/models/grids/.
+
+    overwrite : bool - optional
+        Whether to replace an existing packed version of the file.
+    """
+
+    from ..configs.lazy_loading import packed_dir, packed_path
+    from ..utils import grid_dir
+
+    path = packed_path(filename)
+
+    if os.path.exists(path):
+        if not overwrite:
+            print("Bagpipes: " + path + " already exists, skipping.")
+            return
+
+        shutil.rmtree(path)
+
+    os.makedirs(packed_dir, exist_ok=True)
+
+    # Write to a temporary directory first so a partly packed file is
+    # never picked up by the configs.
+    tmp_path = tempfile.mkdtemp(dir=packed_dir)
+
+    with fits.open(grid_dir + "/" + filename) as hdulist:
+        for i in range(len(hdulist)):
+            data = hdulist[i].data
+
+            if data is None:
+                continue
+
+            data = np.ascontiguousarray(data,
+                                        dtype=data.dtype.newbyteorder("="))
+
+            np.save(tmp_path + "/" + str(i) + ".npy", data)
+
+        np.savetxt(tmp_path + "/n_hdus.txt", [len(hdulist)], fmt="%d")
+
+    os.rename(tmp_path, path)
+
+
+def pack_grids(config_name=None, overwrite=False):
+    """ Writes packed versions of all of the grid files used by a config.
+
+    parameters
+    ----------
+
+    config_name : str - optional
+        Name of the config, e.g. "BC03_v1_3". Defaults to the currently
+        active config.
+
+    overwrite : bool - optional
+        Whether to replace existing packed files.
+    """
+
+    from ..utils import grid_dir
+
+    if config_name is None:
+        from bagpipes import config
+
+    else:
+        config = importlib.import_module(".configs.config_"
+                                         + config_name.lstrip("_"),
+                                         package="bagpipes")
+
+    for filename in config_grid_files(config):
+        if not os.path.exists(grid_dir + "/" + filename):
+            print("Bagpipes: " + filename + " not found, skipping.")
+            continue
+
+        pack_grid_file(filename, overwrite=overwrite)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the FITS grid"
+                                     + " files for a Bagpipes config into"
+                                     + " packed .npy files.")
+
+    parser.add_argument("--config", default=None,
+                        help="Config name, defaults to the active config.")
+
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Replace existing packed files.")
+
+    args = parser.parse_args()
+
+    pack_grids(config_name=args.config, overwrite=args.overwrite)
@@ -3,12 +3,14 @@ from __future__ import print_function, division, absolute_import
 import numpy as np
 import os
 
-from bagpipes import config
-
 
 class chemical_enrichment_history(object):
 
-    def __init__(self, model_comp, sfh_weights):
+    def __init__(self, model_comp, sfh_weights, config=None):
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
 
         self.zmet_vals = config.metallicities
         self.zmet_lims = config.metallicity_bins
@@ -25,6 +27,8 @@ class chemical_enrichment_history(object):
                 self.grid += self.grid_comp[comp]
 
     def metallicity_bins(self, comp, sfh):
+        config = self.config
+
         bin_edges = np.array(comp["bin_edges"])[::-1]*10**6
         n_bins = len(bin_edges) - 1
         ages = config.age_sampling
@@ -55,6 +59,8 @@ class chemical_enrichment_history(object):
         return grid*sfh
 
     def metallicity_bins_continuity(self, comp, sfh):
+        config = self.config
+
         bin_edges = np.array(comp["bin_edges"])[::-1]*10**6
         n_bins = len(bin_edges) - 1
         ages = config.age_sampling
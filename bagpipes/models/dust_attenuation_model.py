@@ -4,8 +4,6 @@ import numpy as np
 
 import os
 
-from bagpipes import config
-
 
 class dust_attenuation(object):
     """ Allows access to and maniuplation of dust attenuation models.
@@ -27,9 +25,18 @@ class dust_attenuation(object):
 
     type : str
         The type of dust model.
+
+    config : module - optional
+        The config to use, e.g. from bagpipes.config_utils.load_config.
+        Defaults to the currently active config.
     """
 
-    def __init__(self, wavelengths, param):
+    def __init__(self, wavelengths, param, config=None):
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
+
         self.wavelengths = wavelengths
         self.type = param["type"]
 
@@ -69,12 +76,16 @@ class dust_attenuation(object):
     def CF00(self, param):
         """ Modified Charlot + Fall (2000) model of Carnall et al.
         (2018) and Carnall et al. (2019b). """
+
+        config = self.config
         A_cont = (5500./self.wavelengths)**param["n"]
         A_line = (5500./config.line_wavs)**param["n"]
 
         return A_cont, A_line
 
     def Salim(self, param):
+        config = self.config
+
         delta = param["delta"]
         B = param["B"]
         Rv_m = 4.05/((4.05+1)*(4400./5500.)**delta - 4.05)
@@ -100,6 +111,8 @@ class dust_attenuation(object):
         For details, see Wild et al. 2007
         (https://ui.adsabs.harvard.edu/abs/2007MNRAS.381..543W)
         """
+
+        config = self.config
         A_cont = (5500./self.wavelengths)**0.7
         A_cont_bc = (5500./self.wavelengths)**1.3
         A_line_bc = (5500./config.line_wavs)**1.3
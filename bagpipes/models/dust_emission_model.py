@@ -3,27 +3,73 @@ from __future__ import print_function, division, absolute_import
 import numpy as np
 import os
 
-from bagpipes import config
+from .grid_cache import cached_grid
 
 
 class dust_emission(object):
     """ Allows access to and maniuplation of the dust emission models
-    of Draine + Li (2007). Currently very simple, possibly could be sped
-    up in some circumstances by pre-interpolating to the input wavs.
+    of Draine + Li (2007). The grids are pre-interpolated onto the input
+    wavelengths, which is exact as the model is a linear combination of
+    the grid spectra.
 
     Parameters
     ----------
 
     wavelengths : np.ndarray
         1D array of wavelength values desired for the DL07 models.
+
+    config : module - optional
+        The config to use, e.g. from bagpipes.config_utils.load_config.
+        Defaults to the currently active config.
     """
 
-    def __init__(self, wavelengths):
+    def __init__(self, wavelengths, config=None):
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
+
         self.wavelengths = wavelengths
 
+        grids = cached_grid("dust_emission", wavelengths,
+                            self._resample_in_wavelength,
+                            grid_files=[config.dust_umin_only_file,
+                                        config.dust_umin_umax_file],
+                            config=config)
+
+        self.grid_umin_only, self.grid_umin_umax = grids
+
+    def _resample_in_wavelength(self):
+        """ Resamples both sets of raw grids to the input wavelengths,
+        keeping the same qpah and umin column indices. The first HDU
+        of each file holds no data, so grid[0] is left as zeros. """
+
+        config = self.config
+
+        raw_wavs = config.dust_grid_umin_only[1][:, 0]
+        grids = []
+
+        for raw_grids in [config.dust_grid_umin_only,
+                          config.dust_grid_umin_umax]:
+
+            grid = np.zeros((len(raw_grids), self.wavelengths.shape[0],
+                             raw_grids[1].shape[1]))
+
+            for i in range(1, len(raw_grids)):
+                for j in range(1, raw_grids[1].shape[1]):
+                    grid[i, :, j] = np.interp(self.wavelengths, raw_wavs,
+                                              raw_grids[i][:, j],
+                                              left=0., right=0.)
+
+            grids.append(grid)
+
+        return tuple(grids)
+
     def spectrum(self, qpah, umin, gamma):
         """ Get the 1D spectrum for a given set of model parameters. """
 
+        config = self.config
+
         qpah_ind = config.qpah_vals[config.qpah_vals < qpah].shape[0]
         umin_ind = config.umin_vals[config.umin_vals < umin].shape[0]
 
@@ -37,23 +83,19 @@ class dust_emission(object):
 
         umin_w = np.array([(1 - umin_fact), umin_fact])
 
-        lqpah_only = config.dust_grid_umin_only[qpah_ind]
-        hqpah_only = config.dust_grid_umin_only[qpah_ind+1]
+        lqpah_only = self.grid_umin_only[qpah_ind]
+        hqpah_only = self.grid_umin_only[qpah_ind+1]
         tqpah_only = (qpah_fact*hqpah_only[:, umin_ind:umin_ind+2]
                       + (1-qpah_fact)*lqpah_only[:, umin_ind:umin_ind+2])
 
-        lqpah_umax = config.dust_grid_umin_umax[qpah_ind]
-        hqpah_umax = config.dust_grid_umin_umax[qpah_ind+1]
+        lqpah_umax = self.grid_umin_umax[qpah_ind]
+        hqpah_umax = self.grid_umin_umax[qpah_ind+1]
         tqpah_umax = (qpah_fact*hqpah_umax[:, umin_ind:umin_ind+2]
                       + (1-qpah_fact)*lqpah_umax[:, umin_ind:umin_ind+2])
 
         interp_only = np.sum(umin_w*tqpah_only, axis=1)
         interp_umax = np.sum(umin_w*tqpah_umax, axis=1)
 
-        model = gamma*interp_umax + (1 - gamma)*interp_only
-
-        spectrum = np.interp(self.wavelengths,
-                             config.dust_grid_umin_only[1][:, 0],
-                             model, left=0., right=0.)
+        spectrum = gamma*interp_umax + (1 - gamma)*interp_only
 
         return spectrum
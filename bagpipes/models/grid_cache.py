@@ -0,0 +1,211 @@
+""" A process-wide cache of model grids which have been resampled onto
+a particular wavelength sampling, so that these can be shared between
+model_galaxy objects with the same setup, e.g. when fitting catalogues.
+Cached arrays are set to be read only.
+
+Grids which are built from files in utils.grid_dir can also be written
+to a versioned cache directory on disk as .npy files. These are then
+memory mapped by later processes, which skips the resampling and lets
+processes on the same node share the memory. The disk cache is keyed on
+checksums of the grid files and the config file, so it is invalidated
+if either changes. """
+
+from __future__ import print_function, division, absolute_import
+
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from collections import OrderedDict
+
+from bagpipes import config
+
+from .. import utils
+
+# Maximum total size in bytes of the cached grids, the least recently
+# used grids are discarded beyond this.
+max_cache_size = 2*10**9
+
+_cache = OrderedDict()
+_cache_size = 0
+
+# Whether to use the on-disk cache, and where to put it. Incrementing
+# cache_version invalidates all existing on-disk grids.
+use_disk_cache = True
+cache_version = 1
+cache_dir = utils.cache_dir
+
+_file_checksums = {}
+
+
+def wavelength_hash(wavelengths):
+    """ Returns a hash identifying a wavelength sampling. """
+
+    wavelengths = np.ascontiguousarray(wavelengths, dtype=float)
+
+    return hashlib.sha1(wavelengths.tobytes()).hexdigest()
+
+
+def file_checksum(path):
+    """ Returns the sha1 checksum of a file, computed once per process. """
+
+    if path not in _file_checksums:
+        sha1 = hashlib.sha1()
+
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(2**24), b""):
+                sha1.update(chunk)
+
+        _file_checksums[path] = sha1.hexdigest()
+
+    return _file_checksums[path]
+
+
+def _disk_cache_path(key, grid_files, config):
+    """ Returns the directory in which a grid is stored on disk. """
+
+    checksums = [file_checksum(utils.grid_dir + "/" + f) for f in grid_files]
+    checksums.append(file_checksum(config.__file__))
+
+    disk_key = hashlib.sha1(repr(key + tuple(checksums)).encode()).hexdigest()
+
+    return (cache_dir + "/v" + str(cache_version) + "/" + key[1] + "_"
+            + disk_key)
+
+
+def _load_from_disk(path):
+    """ Memory maps a grid stored by _save_to_disk, or returns None. """
+
+    if not os.path.exists(path + "/n_arrays.txt"):
+        return None
+
+    n_arrays = int(np.loadtxt(path + "/n_arrays.txt"))
+
+    arrays = tuple(np.load(path + "/" + str(i) + ".npy", mmap_mode="r")
+                   for i in range(n_arrays))
+
+    return arrays if n_arrays > 1 else arrays[0]
+
+
+def _save_to_disk(path, value):
+    """ Saves an array or tuple of arrays as .npy files. The files are
+    written to a temporary directory which is then renamed, so other
+    processes never see a partly written grid. """
+
+    arrays = _arrays(value)
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+        os.chmod(tmp_path, 0o755)  # mkdtemp makes owner-only directories.
+
+        for i in range(len(arrays)):
+            np.save(tmp_path + "/" + str(i) + ".npy", arrays[i])
+
+        np.savetxt(tmp_path + "/n_arrays.txt", [len(arrays)], fmt="%d")
+
+        try:
+            os.rename(tmp_path, path)
+
+        except OSError:  # Another process got there first.
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    except OSError:
+        pass  # The cache directory is not writeable.
+
+
+def _arrays(value):
+    """ Returns the arrays held by a cached value. """
+
+    if isinstance(value, np.ndarray):
+        return [value]
+
+    if isinstance(value, tuple):
+        return [v for v in value if isinstance(v, np.ndarray)]
+
+    return [v for v in vars(value).values() if isinstance(v, np.ndarray)]
+
+
+def cached_grid(name, wavelengths, make_grid, *args, **kwargs):
+    """ Returns the grid called name for the input wavelengths and
+    config, calling make_grid to create it if it is not already cached.
+
+    Parameters
+    ----------
+
+    name : str
+        Name of the grid, e.g. "stellar".
+
+    wavelengths : numpy.ndarray
+        The wavelength sampling the grid is resampled onto.
+
+    make_grid : function
+        Function taking no arguments which creates the grid. This can
+        return an array, a tuple of arrays or an object.
+
+    args : hashable - optional
+        Any further values on which the grid depends.
+
+    grid_files : list - optional
+        Names of the files in utils.grid_dir the grid is built from. If
+        set, and make_grid returns an array or tuple of arrays, the grid
+        is also cached on disk.
+
+    config : module - optional
+        The config the grid is made from, defaults to the currently
+        active config.
+    """
+
+    global _cache_size
+
+    grid_files = kwargs.get("grid_files", None)
+    grid_config = kwargs.get("config", None)
+
+    if grid_config is None:
+        grid_config = config
+
+    key = (grid_config.__name__, name, wavelength_hash(wavelengths)) + args
+
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key][0]
+
+    value = None
+
+    if use_disk_cache and grid_files is not None:
+        path = _disk_cache_path(key, grid_files, grid_config)
+        value = _load_from_disk(path)
+
+    if value is None:
+        value = make_grid()
+
+        if use_disk_cache and grid_files is not None:
+            _save_to_disk(path, value)
+
+    # Grids returned directly are shared, so must not be modified.
+    if isinstance(value, (np.ndarray, tuple)):
+        for array in _arrays(value):
+            array.flags.writeable = False
+
+    # Memory mapped grids are not counted towards the size limit.
+    size = np.sum([array.nbytes for array in _arrays(value)
+                   if not isinstance(array, np.memmap)])
+
+    _cache[key] = (value, size)
+    _cache_size += size
+
+    while _cache_size > max_cache_size and len(_cache) > 1:
+        _cache_size -= _cache.popitem(last=False)[1][1]
+
+    return value
+
+
+def clear_cache():
+    """ Empties the grid cache. """
+
+    global _cache_size
+
+    _cache.clear()
+    _cache_size = 0
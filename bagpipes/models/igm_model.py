@@ -3,7 +3,7 @@ from __future__ import print_function, division, absolute_import
 import numpy as np
 import os
 
-from bagpipes import config
+from .grid_cache import cached_grid
 
 
 def interp_discont(x, xp, fp, xdiscont, left=None, right=None):
@@ -18,54 +18,114 @@ def interp_discont(x, xp, fp, xdiscont, left=None, right=None):
 
 class igm(object):
     """ Allows access to and maniuplation of the IGM attenuation models
-    of Inoue (2014).
+    of Inoue (2014). Only the wavelengths which are attenuated, those
+    blueward of Lyman alpha, are stored.
 
     Parameters
     ----------
 
     wavelengths : np.ndarray
         1D array of wavelength values desired for the DL07 models.
+
+    redshift_range : tuple - optional
+        Minimum and maximum redshifts at which the transmission will
+        be requested. If set, only this part of the grid is stored.
+
+    config : module - optional
+        The config to use, e.g. from bagpipes.config_utils.load_config.
+        Defaults to the currently active config.
     """
 
-    def __init__(self, wavelengths):
+    def __init__(self, wavelengths, redshift_range=None, config=None):
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
+
         self.wavelengths = wavelengths
 
-        self.grid = self._resample_in_wavelength()
+        self.z_start = config.igm_redshifts[0]
+        self.z_step = config.igm_redshifts[1] - config.igm_redshifts[0]
+
+        # Indices of the first and last redshifts to be stored.
+        self.z_ind_min = 0
+        self.z_ind_max = config.igm_redshifts.shape[0] - 1
+
+        if redshift_range is not None:
+            z_ind_min = int(np.floor(self._z_position(redshift_range[0])))
+            z_ind_max = int(np.ceil(self._z_position(redshift_range[1]))) + 1
+
+            self.z_ind_min = int(np.clip(z_ind_min, 0, self.z_ind_max - 1))
+            self.z_ind_max = int(np.clip(z_ind_max, self.z_ind_min + 1,
+                                         self.z_ind_max))
+
+        # The IGM table is calculated the first time it is accessed, so
+        # make sure it exists before the grid files are checksummed.
+        config.raw_igm_grid
+
+        self.grid = cached_grid("igm", wavelengths,
+                                self._resample_in_wavelength,
+                                self.z_ind_min, self.z_ind_max,
+                                grid_files=["d_igm_grid_inoue14.fits"],
+                                config=config)
+        self.n_attenuated = self.grid.shape[1]
+
+    def _z_position(self, redshift):
+        """ Position of a redshift on the config.igm_redshifts grid. """
+        return (redshift - self.z_start)/self.z_step
 
     def _resample_in_wavelength(self):
-        """ Resample the raw grid to the input wavelengths. """
+        """ Resample the raw grid to the input wavelengths. The grid is
+        stored with shape (n_redshifts, n_attenuated_wavelengths). """
+
+        config = self.config
+
+        n_wavs = np.searchsorted(self.wavelengths, config.igm_wavelengths[-1],
+                                 side="right")
+
+        lya_ind = np.abs(self.wavelengths - 1215.67).argmin()
+        n_wavs = np.max([n_wavs, lya_ind + 1])
 
-        grid = np.zeros((self.wavelengths.shape[0],
-                         config.igm_redshifts.shape[0]))
+        wavelengths = self.wavelengths[:n_wavs]
+        z_inds = np.arange(self.z_ind_min, self.z_ind_max + 1)
 
-        for i in range(config.igm_redshifts.shape[0]):
-            grid[:, i] = interp_discont(self.wavelengths,
+        grid = np.zeros((z_inds.shape[0], n_wavs))
+
+        for i in range(z_inds.shape[0]):
+            grid[i, :] = interp_discont(wavelengths,
                                         config.igm_wavelengths,
-                                        config.raw_igm_grid[i, :], 1215.67,
-                                        left=0., right=1.)
+                                        config.raw_igm_grid[z_inds[i], :],
+                                        1215.67, left=0., right=1.)
 
         # Make sure the pixel containing Lya is always IGM attenuated
-        lya_ind = np.abs(self.wavelengths - 1215.67).argmin()
         if self.wavelengths[lya_ind] > 1215.67:
-            grid[lya_ind, :] = grid[lya_ind-1, :]
+            grid[:, lya_ind] = grid[:, lya_ind-1]
 
-        return grid
+        # Transmission is one at all longer wavelengths.
+        attenuated = np.flatnonzero(np.any(grid != 1., axis=0))
+        n_attenuated = 0 if attenuated.shape[0] == 0 else attenuated[-1] + 1
+
+        return np.ascontiguousarray(grid[:, :n_attenuated])
 
     def trans(self, redshift):
         """ Get the IGM transmission at a given redshift. """
 
-        redshift_mask = (config.igm_redshifts < redshift)
-        zred_ind = config.igm_redshifts[redshift_mask].shape[0]
+        z_pos = self._z_position(redshift)
+        zred_ind = int(np.floor(z_pos))
+
+        if (z_pos < self.z_ind_min - 10**-6
+                or zred_ind > self.z_ind_max):
+            raise ValueError("Bagpipes: redshift " + str(redshift)
+                             + " is outside the range stored by the IGM"
+                             + " model.")
 
-        zred_fact = ((redshift - config.igm_redshifts[zred_ind-1])
-                     / (config.igm_redshifts[zred_ind]
-                        - config.igm_redshifts[zred_ind-1]))
+        zred_ind = np.clip(zred_ind, self.z_ind_min, self.z_ind_max - 1)
+        zred_fact = np.clip(z_pos - zred_ind, 0., 1.)
 
-        if zred_ind == 0:
-            zred_ind += 1
-            zred_fact = 0.
+        zred_ind -= self.z_ind_min
 
-        weights = np.array([1. - zred_fact, zred_fact])
-        igm_trans = np.sum(weights*self.grid[:, zred_ind-1:zred_ind+1], axis=1)
+        igm_trans = np.ones_like(self.wavelengths)
+        igm_trans[:self.n_attenuated] = ((1. - zred_fact)*self.grid[zred_ind]
+                                         + zred_fact*self.grid[zred_ind + 1])
 
         return igm_trans
@@ -2,21 +2,16 @@ from __future__ import print_function, division, absolute_import
 
 import numpy as np
 import warnings
-import spectres
 
 from copy import deepcopy
 from numpy.polynomial.chebyshev import chebval, chebfit
-#added by austind 14/11/23
-from scipy.optimize import curve_fit
+from scipy.sparse import csr_matrix
 import astropy.units as u
 import astropy.constants as const
 import os
 from .. import utils
 
-from bagpipes import config
-
 from .. import filters
-from .. import plotting
 
 from .stellar_model import stellar
 from .dust_emission_model import dust_emission
@@ -26,8 +21,23 @@ from .igm_model import igm
 from .dla_model import dla_trans
 from .agn_model import agn
 from .star_formation_history import star_formation_history
+from .grid_cache import cached_grid
+from .spectral_resampler import spectral_resampler, resampling_matrix
 from ..input.spectral_indices import measure_index
 import importlib
+import functools
+
+# Constants used to calculate derived quantities with plain floats.
+L_sun = 3.826*10**33  # Solar luminosity in erg/s.
+c_AA = const.c.to(u.AA/u.s).value  # Speed of light in Angstroms/s.
+pc_cm = const.pc.to(u.cm).value  # Parsec in cm.
+
+
+@functools.lru_cache(maxsize=None)
+def _unit_conversion(from_unit, to_unit):
+    """ Returns the factor which converts values from from_unit to
+    to_unit, calculated once for each pair of units. """
+    return from_unit.to(to_unit)
 
 
 class model_galaxy(object):
@@ -66,6 +76,29 @@ class model_galaxy(object):
 
     index_list : list - optional
         list of dicts containining definitions for spectral indices.
+
+    config : module - optional
+        The config to use, e.g. from bagpipes.config_utils.load_config.
+        Defaults to the currently active config.
+
+    redshift_range : tuple - optional
+        Minimum and maximum redshifts at which the model will be
+        evaluated. The wavelength sampling and IGM model only cover this
+        range. Defaults to zero to config.max_redshift, in which case
+        the model is exact at the redshift in model_components and
+        interpolated on a fine redshift grid elsewhere. If the minimum
+        and maximum are equal the model is exact at that redshift.
+
+    save_continuum : bool - optional
+        Whether to calculate spectrum_full_cont, the spectrum without
+        emission lines, in every update. This is always done when
+        extra_model_components is set.
+
+    calculate_beta_C94 : bool - optional
+        Whether to fit beta_C94 in each update with extra model
+        components. Set to False if beta_C94 will be fitted to the
+        spectrum_full_cont of many models at once with fit_beta_C94,
+        beta_C94 is then nan.
     """
 
     def __init__(
@@ -79,18 +112,49 @@ class model_galaxy(object):
         extra_model_components=False, 
         lines_to_save = ['Halpha', 'Hbeta', 'Hgamma', 'OIII_5007', 'OIII_4959', 'NII_6548', 'NII_6584'],
         line_ratios_to_save = ["OIII_4959+OIII_5007__Hbeta", "Halpha__Hbeta", "Hbeta__Hgamma", "NII_6548+NII_6584__Halpha"],
+        config=None,
+        redshift_range=None,
+        save_continuum=False,
+        calculate_beta_C94=True,
     ):
 
         if (spec_wavs is not None) and (index_list is not None):
             raise ValueError("Cannot specify both spec_wavs and index_list.")
 
-        from bagpipes import config
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
 
         if model_components["redshift"] > config.max_redshift:
             raise ValueError("Bagpipes attempted to create a model with too "
                              "high redshift. Please increase max_redshift in "
                              "bagpipes/config.py before making this model.")
 
+        # Spectra and photometry are calculated exactly at one redshift,
+        # that of a fixed-redshift range or, if no range is given, that
+        # of model_components. Others are interpolated in redshift.
+        if redshift_range is None:
+            redshift_range = (0., config.max_redshift)
+            self.exact_redshift = model_components["redshift"]
+
+        elif redshift_range[0] == redshift_range[1]:
+            self.exact_redshift = redshift_range[0]
+
+        else:
+            self.exact_redshift = None
+
+        if redshift_range[1] > config.max_redshift:
+            raise ValueError("Bagpipes: redshift_range extends above "
+                             "max_redshift in bagpipes/config.py.")
+
+        if not (redshift_range[0] <= model_components["redshift"]
+                <= redshift_range[1]):
+            raise ValueError("Bagpipes: model redshift is outside the "
+                             "redshift_range of the model.")
+
+        self.redshift_range = redshift_range
+
         self.spec_wavs = spec_wavs
         self.filt_list = filt_list
         self.spec_units = spec_units
@@ -109,19 +173,32 @@ class model_galaxy(object):
 
         # Resample the filter curves onto wavelengths.
         if filt_list is not None:
-            self.filter_set.resample_filter_curves(self.wavelengths)
+            self.filter_set.resample_filter_curves(
+                self.wavelengths, exact_redshift=self.exact_redshift)
 
-        # Set up a filter_set for calculating rest-frame UVJ magnitudes.
-        uvj_filt_list = np.loadtxt(utils.install_dir
-                                   + "/filters/UVJ.filt_list", dtype="str")
+        # Set up the resampling of model spectra onto spec_wavs.
+        if self.spec_wavs is not None:
+            self.spec_resampler = spectral_resampler(
+                self.spec_wavs, self.wavelengths,
+                exact_redshift=self.exact_redshift)
 
-        self.uvj_filter_set = filters.filter_set(uvj_filt_list)
-        self.uvj_filter_set.resample_filter_curves(self.wavelengths)
+        # Resampler used if a resolution curve is supplied, this is
+        # remade if the resolution curve changes.
+        self.R_curve_key = None
+
+        # The last velocity dispersion kernel used.
+        self.veldisp_kernel = None
+
+        # Set up a filter_set for calculating rest-frame UVJ magnitudes.
+        self.uvj_filter_set = cached_grid("uvj_filters", self.wavelengths,
+                                          self._make_uvj_filter_set,
+                                          config=config)
 
         # Create relevant physical models.
-        self.sfh = star_formation_history(model_components)
-        self.stellar = stellar(self.wavelengths)
-        self.igm = igm(self.wavelengths)
+        self.sfh = star_formation_history(model_components, config=config)
+        self.stellar = stellar(self.wavelengths, config=config)
+        self.igm = igm(self.wavelengths, redshift_range=self.redshift_range,
+                       config=config)
         self.nebular = False
         self.dust_atten = False
         self.agn_dust_atten = False
@@ -130,37 +207,62 @@ class model_galaxy(object):
 
         self.lines_to_save = lines_to_save
         self.line_ratios_to_save = line_ratios_to_save
+        self.save_continuum = save_continuum
+        self.calculate_beta_C94 = calculate_beta_C94
+
+        # Pixels and design matrix used to fit the UV slope, beta_C94.
+        self.C94_mask, self.C94_design = get_C94_design(self.wavelengths)
 
         if "nebular" in list(model_components):
             if "velshift" not in model_components["nebular"]:
                 model_components["nebular"]["velshift"] = 0.
 
             self.nebular = nebular(self.wavelengths,
-                                   model_components["nebular"]["velshift"])
+                                   model_components["nebular"]["velshift"],
+                                   config=config)
 
             if "metallicity" in list(model_components["nebular"]):
-                self.neb_sfh = star_formation_history(model_components)
+                self.neb_sfh = star_formation_history(model_components,
+                                                      config=config)
 
         if "dust" in list(model_components):
-            self.dust_emission = dust_emission(self.wavelengths)
+            self.dust_emission = dust_emission(self.wavelengths,
+                                               config=config)
             self.dust_atten = dust_attenuation(self.wavelengths,
-                                               model_components["dust"])
+                                               model_components["dust"],
+                                               config=config)
 
         if "agn_dust" in list(model_components):
             self.agn_dust_atten = dust_attenuation(self.wavelengths,
-                                                   model_components["agn_dust"])
+                                                   model_components["agn_dust"],
+                                                   config=config)
 
         if "agn" in list(model_components):
             self.agn = agn(self.wavelengths)
 
         self.update(model_components, extra_model_components = extra_model_components)
 
+    def _make_uvj_filter_set(self):
+        """ Creates a filter_set for the rest-frame UVJ filters. """
+
+        uvj_filt_list = np.loadtxt(utils.install_dir
+                                   + "/filters/UVJ.filt_list", dtype="str")
+
+        uvj_filter_set = filters.filter_set(uvj_filt_list)
+        uvj_filter_set.resample_filter_curves(self.wavelengths)
+
+        return uvj_filter_set
+
     def _get_wavelength_sampling(self):
         """ Calculate the optimal wavelength sampling for the model
         given the required resolution values specified in the config
         file. The way this is done is key to the speed of the code. """
 
-        max_z = config.max_redshift
+        config = self.config
+
+        # Only the bluest wavelengths needed at the highest redshift the
+        # model will be evaluated at have to be covered.
+        max_z = self.redshift_range[1]
 
         if self.spec_wavs is None and self.filt_list is None:
             self.max_wavs = [10**8]
@@ -219,55 +321,129 @@ class model_galaxy(object):
 
                 self.R = [config.R_other, config.R_spec, config.R_other]
 
-        # Generate the desired wavelength sampling.
-        x = [1.]
+        # Generate the desired wavelength sampling, a geometric sequence
+        # with ratio 1 + 0.5/R in each region.
+        x = np.array([1.])
 
         for i in range(len(self.R)):
+            ratio = 1. + 0.5/self.R[i]
+            n_max = np.log(self.max_wavs[i]/x[-1])/np.log(ratio)
+            n_max = int(np.max([np.ceil(n_max), 0])) + 2
+
+            # Accumulate the products in the same order as repeated
+            # multiplication so the points do not depend on n_max.
+            new_x = np.cumprod(np.r_[x[-1], np.full(n_max, ratio)])[1:]
+            n_below = np.searchsorted(new_x, self.max_wavs[i], side="left")
+
+            # Regions end on the first point beyond max_wavs if followed
+            # by a lower resolution region, or before it if not.
             if i == len(self.R)-1 or self.R[i] > self.R[i+1]:
-                while x[-1] < self.max_wavs[i]:
-                    x.append(x[-1]*(1.+0.5/self.R[i]))
+                if x[-1] < self.max_wavs[i]:
+                    n_below += 1
 
-            else:
-                while x[-1]*(1.+0.5/self.R[i]) < self.max_wavs[i]:
-                    x.append(x[-1]*(1.+0.5/self.R[i]))
+            x = np.concatenate((x, new_x[:n_below]))
 
-        return np.array(x)
+        return x
 
-    def _get_R_curve_wav_sampling(self, oversample=4):
+    def _get_R_curve_wav_sampling(self, R_curve, oversample=4):
         """ Calculate wavelength sampling for the model to be resampled
         onto in order to apply variable spectral broadening. Only used
-        if a resolution curve is supplied in model_components. Has to
-        be re-run when a model is updated as it depends on redshift.
+        if a resolution curve is supplied in model_components.
+
+        The sampling has oversample points per FWHM, the spacing between
+        points is lambda/R/oversample. It is found by inverting the
+        cumulative number of points per unit log wavelength.
 
         Parameters
         ----------
 
+        R_curve : numpy.ndarray
+            Array of wavelengths and R = lambda/dlambda values.
+
         oversample : float
             Number of spectral samples per full width at half maximum.
         """
 
-        R_curve = np.copy(self.model_comp["R_curve"])
+        wav_min = 0.95*self.spec_wavs[0]
+        wav_max = 1.05*self.spec_wavs[-1]
 
-        if "resolution_p0" in list(self.model_comp):
+        # Fine grid in log wavelength for the cumulative integral.
+        R_max = np.max(R_curve[:, 1])
+        dlog_wav = np.log(1. + 1./R_max/oversample)
+        log_wavs = np.arange(np.log(wav_min), np.log(wav_max) + 3*dlog_wav,
+                             dlog_wav)
+
+        R_vals = np.interp(np.exp(log_wavs), R_curve[:, 0], R_curve[:, 1])
+        density = 1./np.log(1. + 1./R_vals/oversample)
+
+        n_points = np.zeros_like(log_wavs)
+        n_points[1:] = np.cumsum((density[1:] + density[:-1])/2.*dlog_wav)
+
+        # Include the first point beyond wav_max.
+        n_max = np.interp(np.log(wav_max), log_wavs, n_points)
+        n = np.arange(int(np.ceil(n_max)) + 1)
+
+        return np.exp(np.interp(n, n_points, log_wavs))
+
+    def _get_R_curve_resampler(self, model_comp, oversample=4):
+        """ Returns a spectral_resampler which takes the model spectrum
+        straight to spec_wavs, applying the spectral broadening described
+        by the R_curve in model_comp on the way. The resampling onto a
+        grid with oversample points per FWHM, the Gaussian convolution on
+        that grid and the final resampling onto spec_wavs are combined
+        into one sparse matrix. This is kept until R_curve or any fitted
+        resolution_p Chebyshev coefficients change. """
+
+        R_curve = np.copy(model_comp["R_curve"])
+
+        coefs = []
+        while "resolution_p" + str(len(coefs)) in list(model_comp):
+            coefs.append(model_comp["resolution_p" + str(len(coefs))])
+
+        key = (R_curve.shape, R_curve.tobytes(), tuple(coefs))
+
+        if self.R_curve_key == key:
+            return self.R_curve_resampler
+
+        if len(coefs) > 0:
             x = R_curve[:, 0]
             x = 2.*(x - (x[0] + (x[-1] - x[0])/2.))/(x[-1] - x[0])
 
-            coefs = []
-            while "resolution_p" + str(len(coefs)) in list(self.model_comp):
-                coefs.append(self.model_comp["resolution_p" + str(len(coefs))])
+            R_curve[:, 1] *= chebval(x, coefs)
 
-            poly_coefs = np.array(coefs)
+        new_wavs = self._get_R_curve_wav_sampling(R_curve,
+                                                  oversample=oversample)
 
-            R_curve[:, 1] *= chebval(x, coefs)
+        sigma_pix = oversample/2.35  # sigma width of kernel in pixels
+        k_size = 4*int(sigma_pix+1)
+        x_kernel_pix = np.arange(-k_size, k_size+1)
+
+        kernel = np.exp(-(x_kernel_pix**2)/(2*sigma_pix**2))
+        kernel /= np.trapz(kernel)  # Explicitly normalise kernel
+
+        # Disperse non-uniformly sampled spectrum, a "valid" convolution.
+        n_conv = new_wavs.shape[0] - 2*k_size
+        rows = np.repeat(np.arange(n_conv), kernel.shape[0])
+        cols = rows + np.tile(np.arange(kernel.shape[0]), n_conv)
+        data = np.tile(kernel[::-1], n_conv)
+
+        convolution = csr_matrix((data, (rows, cols)),
+                                 shape=(n_conv, new_wavs.shape[0]))
+
+        # Resample the broadened spectrum onto spec_wavs.
+        matrix, col_min = resampling_matrix(self.spec_wavs,
+                                            new_wavs[k_size:-k_size])
 
-        x = [0.95*self.spec_wavs[0]]
+        resampling = csr_matrix((matrix.data, matrix.indices + col_min,
+                                 matrix.indptr),
+                                shape=(self.spec_wavs.shape[0], n_conv))
 
-        while x[-1] < 1.05*self.spec_wavs[-1]:
-            R_val = np.interp(x[-1], R_curve[:, 0], R_curve[:, 1])
-            dwav = x[-1]/R_val/oversample
-            x.append(x[-1] + dwav)
+        self.R_curve_key = key
+        self.R_curve_resampler = spectral_resampler(
+            new_wavs, self.wavelengths, exact_redshift=self.exact_redshift,
+            post_matrix=csr_matrix(resampling.dot(convolution)))
 
-        return np.array(x)
+        return self.R_curve_resampler
 
     def _get_index_spec_wavs(self, model_components):
         """ Generate an appropriate spec_wavs array for covering the
@@ -301,7 +477,7 @@ class model_galaxy(object):
         max = np.round(1.05*max, 2)
         sampling = np.round(np.mean([min, max])/5000., 2)
 
-        return np.arange(min, max*(1. + config.max_redshift), sampling)
+        return np.arange(min, max*(1. + self.redshift_range[1]), sampling)
 
     def update(self, model_components, extra_model_components=False):
         """ Update the model outputs to reflect new parameter values in
@@ -318,13 +494,112 @@ class model_galaxy(object):
 
         self.model_comp = model_components
         self.sfh.update(model_components)
+
+        self._calculate_observables(model_components, self.sfh.unphysical,
+                                    extra_model_components)
+
+    def update_batch(self, model_components_list):
+        """ Update the model outputs for a list of model_components
+        dictionaries at once. The star-formation histories are evaluated
+        for each model in turn, then the stellar and nebular grids are
+        collapsed for all models in a single matrix product, before the
+        remaining steps are applied to each model.
+
+        The outputs are stored with one row per model as
+        photometry_batch, spectrum_batch (fluxes at spec_wavs),
+        spectrum_full_batch and indices_batch, along with the list
+        line_fluxes_batch and the boolean array unphysical_batch. The
+        usual single-model attributes are left holding the last model.
+
+        Parameters
+        ----------
+        model_components_list : list
+            A list of model_components dictionaries, all with the same
+            structure as the one used to create the model.
+        """
+
+        n_models = len(model_components_list)
+
+        sfh_cehs = np.zeros((n_models,) + self.sfh.ceh.grid.shape)
+        unphysical = np.zeros(n_models, dtype=bool)
+        t_bcs = np.zeros(n_models) + 0.01
+
+        if self.nebular:
+            neb_sfh_cehs = np.zeros_like(sfh_cehs)
+            logUs = np.zeros(n_models)
+
+        # Evaluate the star-formation history of each model.
+        for i in range(n_models):
+            model_comp = model_components_list[i]
+            self.sfh.update(model_comp)
+
+            sfh_cehs[i] = self.sfh.ceh.grid
+            unphysical[i] = self.sfh.unphysical
+
+            if "t_bc" in list(model_comp):
+                t_bcs[i] = model_comp["t_bc"]
+
+            if self.nebular:
+                neb_sfh_cehs[i] = self._get_nebular_sfh_ceh(model_comp)
+                logUs[i] = model_comp["nebular"]["logU"]
+
+        # Collapse the stellar and nebular grids for all models at once.
+        spectra_bc, spectra = self.stellar.spectrum_batch(sfh_cehs, t_bcs)
+
+        if self.nebular:
+            neb_lines = self.nebular.line_fluxes_batch(neb_sfh_cehs, t_bcs,
+                                                       logUs)
+
+            neb_spectra = self.nebular.spectrum_batch(neb_sfh_cehs, t_bcs,
+                                                      logUs)
+
+        outputs = {"photometry": [], "spectrum": [], "spectrum_full": [],
+                   "indices": [], "line_fluxes": []}
+
+        for i in range(n_models):
+            collapsed = {"stellar": (spectra_bc[i], spectra[i])}
+
+            if self.nebular:
+                collapsed["nebular"] = (neb_lines[i], [neb_spectra[i]])
+
+            self.model_comp = model_components_list[i]
+            self._calculate_observables(self.model_comp, unphysical[i],
+                                        collapsed=collapsed)
+
+            outputs["spectrum_full"].append(self.spectrum_full)
+            outputs["line_fluxes"].append(self.line_fluxes)
+
+            if self.filt_list is not None:
+                outputs["photometry"].append(self.photometry)
+
+            if self.spec_wavs is not None:
+                outputs["spectrum"].append(self.spectrum[:, 1])
+
+            if self.index_list is not None:
+                outputs["indices"].append(self.indices)
+
+        self.photometry_batch = np.array(outputs["photometry"])
+        self.spectrum_batch = np.array(outputs["spectrum"])
+        self.spectrum_full_batch = np.array(outputs["spectrum_full"])
+        self.indices_batch = np.array(outputs["indices"])
+        self.line_fluxes_batch = outputs["line_fluxes"]
+        self.unphysical_batch = unphysical
+
+    def _calculate_observables(self, model_components, unphysical,
+                               extra_model_components=False, collapsed=None):
+        """ Calculates the full spectrum and all requested observables
+        once the star-formation history has been updated. """
+
+        # Intermediate results shared between derived quantities.
+        self.derived_cache = {}
+
         if self.dust_atten:
             self.dust_atten.update(model_components["dust"])
         if self.agn_dust_atten:
             self.agn_dust_atten.update(model_components["agn_dust"])
 
         # If the SFH is unphysical do not caclulate the full spectrum
-        if self.sfh.unphysical:
+        if unphysical:
             warnings.warn("The requested model includes stars which formed "
                           "before the Big Bang, no spectrum generated.",
                           RuntimeWarning)
@@ -333,8 +608,10 @@ class model_galaxy(object):
             self.uvj = np.zeros(3)
 
         else:
-            self._calculate_full_spectrum(model_components)
-            self._calculate_full_continuum_spectrum(model_components)
+            self._calculate_full_spectrum(model_components,
+                                          add_continuum=(extra_model_components
+                                                         or self.save_continuum),
+                                          collapsed=collapsed)
 
         if self.spec_wavs is not None:
             self._calculate_spectrum(model_components)
@@ -361,18 +638,9 @@ class model_galaxy(object):
         if self.filt_list is not None:
             self._calculate_photometry(model_components["redshift"])
 
-        if not self.sfh.unphysical:
+        if not unphysical:
             if extra_model_components:
-                self._calculate_uvj_mags()
-                self._calculate_beta_C94(model_components)
-                self._calculate_M_UV(model_components)
-                self._calculate_D4000(model_components)
-                self._calculate_xi_ion_caseB(model_components)
-                self._calculate_Ndot_ion_caseB(model_components, out_units = u.Hz)
-                for frame in ["rest", "obs"]:
-                    self._save_emission_line_fluxes(model_components, lines = self.lines_to_save, frame = frame)
-                    self._save_emission_line_EWs(model_components, lines = self.lines_to_save, frame = frame)
-                self._save_line_ratios(model_components, line_ratios = self.line_ratios_to_save)
+                self._calculate_derived_quantities(model_components)
 
         # Deal with any spectral index calculations.
         if self.index_list is not None:
@@ -384,46 +652,86 @@ class model_galaxy(object):
                                                 self.spectrum,
                                                 model_components["redshift"])
 
-    def _calculate_full_spectrum(self, model_comp, add_lines = True):
+    def _get_nebular_sfh_ceh(self, model_comp):
+        """ Returns the star-formation and chemical enrichment history
+        used for nebular emission, which differs from the stellar one
+        if a separate nebular metallicity has been specified. """
+
+        if "metallicity" in list(model_comp["nebular"]):
+            nebular_metallicity = model_comp["nebular"]["metallicity"]
+            neb_comp = deepcopy(model_comp)
+            for comp in list(neb_comp):
+                if isinstance(neb_comp[comp], dict):
+                    neb_comp[comp]["metallicity"] = nebular_metallicity
+
+            self.neb_sfh.update(neb_comp)
+            return self.neb_sfh.ceh.grid
+
+        return np.copy(self.sfh.ceh.grid)
+
+    def _calculate_full_spectrum(self, model_comp, add_continuum=False,
+                                 collapsed=None):
         """ This method combines the models for the various emission
         and absorption processes to generate the internal full galaxy
         spectrum held within the class. The _calculate_photometry and
         _calculate_spectrum methods generate observables using this
-        internal full spectrum. """
+        internal full spectrum.
+
+        If add_continuum is True the line-free continuum is carried
+        through the same pass as a second row, sharing the stellar,
+        dust, IGM and distance calculations, and is saved as
+        spectrum_full_cont.
+
+        The stellar and nebular grids may instead be collapsed in
+        advance and passed in through collapsed, see update_batch. """
+
+        config = self.config
 
         t_bc = 0.01
         if "t_bc" in list(model_comp):
             t_bc = model_comp["t_bc"]
 
-        spectrum_bc, spectrum = self.stellar.spectrum(self.sfh.ceh.grid, t_bc)
-        if add_lines:
-            em_lines = np.zeros(config.line_wavs.shape)
+        if collapsed is None:
+            spectrum_bc, spectrum = self.stellar.spectrum(self.sfh.ceh.grid,
+                                                          t_bc)
+        else:
+            spectrum_bc, spectrum = collapsed["stellar"]
+
+        em_lines = np.zeros(config.line_wavs.shape)
+
+        # Row 0 holds the spectrum with lines, row 1 the continuum only.
+        n_rows = 2 if add_continuum else 1
 
         if self.nebular:
-            grid = np.copy(self.sfh.ceh.grid)
+            logU = model_comp["nebular"]["logU"]
+            fesc_fact = (1 - model_comp["nebular"].get("fesc", 0))
 
-            if "metallicity" in list(model_comp["nebular"]):
-                nebular_metallicity = model_comp["nebular"]["metallicity"]
-                neb_comp = deepcopy(model_comp)
-                for comp in list(neb_comp):
-                    if isinstance(neb_comp[comp], dict):
-                        neb_comp[comp]["metallicity"] = nebular_metallicity
+            if collapsed is None:
+                grid = self._get_nebular_sfh_ceh(model_comp)
 
-                self.neb_sfh.update(neb_comp)
-                grid = self.neb_sfh.ceh.grid
+                outputs = self.nebular.line_fluxes_and_spectra(grid, t_bc, logU,
+                                                               add_continuum)
+
+                neb_lines, spectrum_neb = outputs[0], outputs[1:]
+
+            else:
+                neb_lines, spectrum_neb = collapsed["nebular"]
 
             # All stellar emission below 912A goes into nebular emission
             spectrum_bc[self.wavelengths < 912.] = 0.
-            if add_lines:
-                em_lines += self.nebular.line_fluxes(grid, t_bc,
-                    model_comp["nebular"]["logU"]) * (1 - model_comp["nebular"].get("fesc", 0))
-                self.spectrum_neb = self.nebular.spectrum(grid, t_bc,
-                    model_comp["nebular"]["logU"]) * (1 - model_comp["nebular"].get("fesc", 0))
-                spectrum_bc += self.spectrum_neb
-            else:
-                self.spectrum_neb_cont = self.nebular.continuum_spectrum(grid, t_bc,
-                    model_comp["nebular"]["logU"]) * (1 - model_comp["nebular"].get("fesc", 0))
-                spectrum_bc += self.spectrum_neb_cont
+
+            em_lines += neb_lines*fesc_fact
+            spectrum_neb = np.array(spectrum_neb)*fesc_fact
+            spectrum_bc = spectrum_bc + spectrum_neb
+
+        else:
+            spectrum_bc = np.repeat(np.expand_dims(spectrum_bc, axis=0),
+                                    n_rows, axis=0)
+
+        # Keep the dust-free emission for the derived quantities.
+        if add_continuum:
+            self.derived_cache["intrinsic"] = (spectrum + spectrum_bc,
+                                               np.copy(em_lines))
 
         # Add attenuation due to stellar birth clouds.
         if self.dust_atten:
@@ -446,19 +754,19 @@ class model_galaxy(object):
                 spectrum_bc = spectrum_bc_dust
 
             # Attenuate emission line fluxes.
-            if self.dust_atten.type == "VW07" and add_lines:
+            if self.dust_atten.type == "VW07":
                 Av = model_comp["dust"]["Av"]
                 # Apply birth cloud attenuation first
-                if add_lines:    
-                    em_lines *= 10**(-bc_Av_reduced*self.dust_atten.A_line_bc/2.5)
-                    # Then apply general ISM attenuation
-                    em_lines *= 10**(-Av*self.dust_atten.A_line_ism/2.5)
+                em_lines *= 10**(-bc_Av_reduced*self.dust_atten.A_line_bc/2.5)
+                # Then apply general ISM attenuation
+                em_lines *= 10**(-Av*self.dust_atten.A_line_ism/2.5)
 
             else:
                 bc_Av = eta*model_comp["dust"]["Av"]
-                if add_lines:
-                    em_lines *= 10**(-bc_Av*self.dust_atten.A_line/2.5)
-        spectrum += spectrum_bc  # Add birth cloud spectrum to spectrum.
+                em_lines *= 10**(-bc_Av*self.dust_atten.A_line/2.5)
+
+        spectrum = spectrum + spectrum_bc  # Add birth cloud spectrum.
+
         # Add attenuation due to the diffuse ISM.
         if self.dust_atten:
             trans = 10**(-model_comp["dust"]["Av"]*self.dust_atten.A_cont/2.5)
@@ -466,14 +774,9 @@ class model_galaxy(object):
             dust_flux += np.trapz(spectrum - dust_spectrum, x=self.wavelengths)
 
             spectrum = dust_spectrum
-            if add_lines:
-                self.spectrum_bc = spectrum_bc*trans
-                if self.nebular:
-                    self.spectrum_neb *= trans
-            else:
-                self.spectrum_bc_cont = spectrum_bc*trans
-                if self.nebular:
-                    self.spectrum_neb_cont *= trans
+            spectrum_bc = spectrum_bc*trans
+            if self.nebular:
+                spectrum_neb *= trans
 
             # Add dust emission.
             qpah, umin, gamma = 2., 1., 0.01
@@ -486,10 +789,11 @@ class model_galaxy(object):
             if "gamma" in list(model_comp["dust"]):
                 gamma = model_comp["dust"]["gamma"]
 
-            spectrum += dust_flux*self.dust_emission.spectrum(qpah, umin,
-                                                              gamma)
+            dust_emission = self.dust_emission.spectrum(qpah, umin, gamma)
+            spectrum += np.expand_dims(dust_flux, axis=1)*dust_emission
 
-        spectrum *= self.igm.trans(model_comp["redshift"])
+        igm_trans = self.igm.trans(model_comp["redshift"])
+        spectrum *= igm_trans
 
         if "dla" in list(model_comp):
             if "redshift" in list(model_comp["dla"]):
@@ -502,24 +806,14 @@ class model_galaxy(object):
                                         b_turb=model_comp["dla"]["b_turb"] if "b_turb" in list(model_comp["dla"]) else 0.0)
             spectrum *= self.dla_trans
             if self.dust_atten:
-                if add_lines:
-                    self.spectrum_bc *= self.dla_trans
-                    if self.nebular:
-                        self.spectrum_neb *= self.dla_trans
-                else:
-                    self.spectrum_bc_cont *= self.dla_trans
-                    if self.nebular:
-                        self.spectrum_neb_cont *= self.dla_trans
+                spectrum_bc *= self.dla_trans
+                if self.nebular:
+                    spectrum_neb *= self.dla_trans
 
         if self.dust_atten:
-            if add_lines:
-                self.spectrum_bc *= self.igm.trans(model_comp["redshift"])
-                if self.nebular:
-                    self.spectrum_neb *= self.igm.trans(model_comp["redshift"])
-            else:
-                self.spectrum_bc_cont *= self.igm.trans(model_comp["redshift"])
-                if self.nebular:
-                    self.spectrum_neb_cont *= self.igm.trans(model_comp["redshift"])
+            spectrum_bc *= igm_trans
+            if self.nebular:
+                spectrum_neb *= igm_trans
 
         # Convert from luminosity to observed flux at redshift z.
         self.lum_flux = 1.
@@ -533,43 +827,45 @@ class model_galaxy(object):
         spectrum /= self.lum_flux*(1. + model_comp["redshift"])
 
         if self.dust_atten:
-            if add_lines:
-                if self.nebular:
-                    self.spectrum_neb /= self.lum_flux*(1. + model_comp["redshift"])
-                self.spectrum_bc /= self.lum_flux*(1. + model_comp["redshift"])
-            else:
-                if self.nebular:
-                    self.spectrum_neb_cont /= self.lum_flux*(1. + model_comp["redshift"])
-                self.spectrum_bc_cont /= self.lum_flux*(1. + model_comp["redshift"])
-        if add_lines:
-            em_lines /= self.lum_flux
+            if self.nebular:
+                spectrum_neb /= self.lum_flux*(1. + model_comp["redshift"])
+            spectrum_bc /= self.lum_flux*(1. + model_comp["redshift"])
+
+        em_lines /= self.lum_flux
 
         # convert to erg/s/A/cm^2, or erg/s/A if redshift = 0.
         spectrum *= 3.826*10**33
 
         if self.dust_atten:
-            if add_lines:
-                if self.nebular:
-                    self.spectrum_neb *= 3.826*10**33
-                self.spectrum_bc *= 3.826*10**33
-            else:
-                if self.nebular:
-                    self.spectrum_neb_cont *= 3.826*10**33
-                self.spectrum_bc_cont *= 3.826*10**33
-        if add_lines:
-            em_lines *= 3.826*10**33
-            self.line_fluxes = dict(zip(config.line_names, em_lines))
-
-        if add_lines:
-            self.spectrum_full = spectrum
-        else:
-            self.spectrum_full_cont = spectrum
+            if self.nebular:
+                spectrum_neb *= 3.826*10**33
+            spectrum_bc *= 3.826*10**33
+
+        em_lines *= 3.826*10**33
+        self.line_fluxes = dict(zip(config.line_names, em_lines))
+
+        self.spectrum_full = spectrum[0]
+
+        if self.dust_atten:
+            self.spectrum_bc = spectrum_bc[0]
+
+        if self.nebular:
+            self.spectrum_neb = spectrum_neb[0]
+
+        if add_continuum:
+            self.spectrum_full_cont = spectrum[1]
+
+            if self.dust_atten:
+                self.spectrum_bc_cont = spectrum_bc[1]
+
+            if self.nebular:
+                self.spectrum_neb_cont = spectrum_neb[1]
 
     def _calculate_full_continuum_spectrum(self, model_comp):
         """ This method combines the models for the various emission
         and absorption processes to generate the internal full galaxy
         continuum spectrum held within the class """
-        self._calculate_full_spectrum(model_comp, add_lines = False)
+        self._calculate_full_spectrum(model_comp, add_continuum=True)
 
     def _calculate_photometry(self, redshift, uvj=False):
         """ This method generates predictions for observed photometry.
@@ -596,56 +892,75 @@ class model_galaxy(object):
 
         self.photometry = phot
 
+    def _get_veldisp_kernel(self, veldisp):
+        """ Returns the half width in pixels and the normalised Gaussian
+        kernel for a velocity dispersion, which is kept for reuse as long
+        as veldisp does not change. The R_spec part of the wavelength
+        sampling is uniform in log wavelength, so the kernel is the same
+        at all wavelengths. """
+
+        if (self.veldisp_kernel is not None
+                and self.veldisp_kernel[0] == veldisp):
+            return self.veldisp_kernel[1:]
+
+        vres = 3*10**5/self.config.R_spec/2.
+        sigma_pix = veldisp/vres
+        k_size = 4*int(sigma_pix+1)
+        x_kernel_pix = np.arange(-k_size, k_size+1)
+
+        kernel = np.exp(-(x_kernel_pix**2)/(2*sigma_pix**2))
+        kernel /= np.trapz(kernel)  # Explicitly normalise kernel
+
+        self.veldisp_kernel = (veldisp, k_size, kernel)
+
+        return k_size, kernel
+
     def _calculate_spectrum(self, model_comp):
         """ This method generates predictions for observed spectroscopy.
         It optionally applies a Gaussian velocity dispersion then
         resamples onto the specified set of observed wavelengths. """
 
-        zplusone = model_comp["redshift"] + 1.
+        redshift = model_comp["redshift"]
 
-        if "veldisp" in list(model_comp):
-            vres = 3*10**5/config.R_spec/2.
-            sigma_pix = model_comp["veldisp"]/vres
-            k_size = 4*int(sigma_pix+1)
-            x_kernel_pix = np.arange(-k_size, k_size+1)
+        if "R_curve" in list(model_comp):
+            resampler = self._get_R_curve_resampler(model_comp)
 
-            kernel = np.exp(-(x_kernel_pix**2)/(2*sigma_pix**2))
-            kernel /= np.trapz(kernel)  # Explicitly normalise kernel
+        else:
+            resampler = self.spec_resampler
 
-            spectrum = np.convolve(self.spectrum_full, kernel, mode="valid")
-            redshifted_wavs = zplusone*self.wavelengths[k_size:-k_size]
+        if "veldisp" in list(model_comp):
+            k_size, kernel = self._get_veldisp_kernel(model_comp["veldisp"])
 
-        else:
-            spectrum = self.spectrum_full
-            redshifted_wavs = zplusone*self.wavelengths
+            # Only convolve the part of the spectrum which is resampled
+            # onto the observed wavelengths.
+            start, stop = resampler.window(redshift)
+            start = np.max([start, k_size])
+            stop = np.min([stop, self.wavelengths.shape[0] - k_size])
 
-        if "R_curve" in list(model_comp):
-            oversample = 4  # Number of samples per FWHM at resolution R
-            new_wavs = self._get_R_curve_wav_sampling(oversample=oversample)
+            spectrum = self.spectrum_full[start-k_size:stop+k_size]
 
-            # spectrum = np.interp(new_wavs, redshifted_wavs, spectrum)
-            spectrum = spectres.spectres(new_wavs, redshifted_wavs,
-                                         spectrum, fill=0)
-            redshifted_wavs = new_wavs
+            # Direct convolution is faster unless the kernel is wide.
+            if kernel.shape[0] > 200:
+                from scipy.signal import oaconvolve
+                spectrum = oaconvolve(spectrum, kernel, mode="valid")
 
-            sigma_pix = oversample/2.35  # sigma width of kernel in pixels
-            k_size = 4*int(sigma_pix+1)
-            x_kernel_pix = np.arange(-k_size, k_size+1)
+            else:
+                spectrum = np.convolve(spectrum, kernel, mode="valid")
 
-            kernel = np.exp(-(x_kernel_pix**2)/(2*sigma_pix**2))
-            kernel /= np.trapz(kernel)  # Explicitly normalise kernel
+            offset = start
 
-            # Disperse non-uniformly sampled spectrum
-            spectrum = np.convolve(spectrum, kernel, mode="valid")
-            redshifted_wavs = redshifted_wavs[k_size:-k_size]
+        else:
+            spectrum = self.spectrum_full
+            offset = 0
 
         # Converted to using spectres in response to issue with interp,
         # see https://github.com/ACCarnall/bagpipes/issues/15
         # fluxes = np.interp(self.spec_wavs, redshifted_wavs,
         #                    spectrum, left=0, right=0)
 
-        fluxes = spectres.spectres(self.spec_wavs, redshifted_wavs,
-                                   spectrum, fill=0)
+        # The spectres resampling, plus any broadening from R_curve, is
+        # done as a sparse matrix product.
+        fluxes = resampler.resample(spectrum, redshift, offset=offset)
 
         if self.spec_units == "mujy":
             fluxes /= ((10**-29*2.9979*10**18/self.spec_wavs**2))
@@ -667,11 +982,109 @@ class model_galaxy(object):
     def _calculate_beta_C94(self, model_comp):
         """ This method calculates the UV continuum slope (beta) 
         in the 10 Calzetti+1994 filters from the full spectrum """
+
+        if not self.calculate_beta_C94:
+            self.beta_C94 = np.array([np.nan])
+            return
+
         # constrain to Calzetti filters
-        #print(np.min(self.wavelengths), np.max(self.wavelengths))
-        self._calculate_full_continuum_spectrum(model_comp)
-        wav_obs_C94, f_lambda_obs_C94 = crop_to_C94_filters(self.wavelengths, self.spectrum_full_cont, model_comp)
-        self.beta_C94 = np.array([curve_fit(beta_slope_power_law_func, wav_obs_C94, f_lambda_obs_C94, maxfev = 10_000)[0][1]])
+        f_lambda_C94 = self.spectrum_full_cont[self.C94_mask]
+        self.beta_C94 = fit_beta_C94(f_lambda_C94, self.C94_design)
+
+    def _calculate_derived_quantities(self, model_comp):
+        """ Calculates the extra quantities saved when
+        extra_model_components is set. The intermediate results these
+        share, e.g. the dust-corrected spectra and line fluxes, are
+        calculated once per update and held in derived_cache. """
+
+        self._calculate_uvj_mags()
+        self._calculate_beta_C94(model_comp)
+        self._calculate_M_UV(model_comp)
+        self._calculate_D4000(model_comp)
+        self._calculate_xi_ion_caseB(model_comp)
+
+        for frame in ["rest", "obs"]:
+            self._save_emission_line_fluxes(model_comp,
+                                            lines=self.lines_to_save,
+                                            frame=frame)
+
+            self._save_emission_line_EWs(model_comp,
+                                         lines=self.lines_to_save,
+                                         frame=frame)
+
+        self._save_line_ratios(model_comp,
+                               line_ratios=self.line_ratios_to_save)
+
+    def _get_ldist_pc(self, model_comp):
+        """ Returns the luminosity distance in pc, interpolated from the
+        same table used to calculate the model fluxes. """
+
+        if "ldist_pc" not in self.derived_cache:
+            ldist = np.interp(model_comp["redshift"], utils.z_array,
+                              utils.ldist_at_z, left=0, right=0)
+
+            self.derived_cache["ldist_pc"] = 10**6*ldist
+
+        return self.derived_cache["ldist_pc"]
+
+    def _get_lum_flux(self, model_comp):
+        """ Returns the factor converting luminosity to observed flux,
+        calculated in the same way as for the full spectrum. """
+
+        if "lum_flux" not in self.derived_cache:
+            lum_flux = 1.
+            if model_comp["redshift"] > 0.:
+                ldist_cm = 3.086*10**24*np.interp(model_comp["redshift"],
+                                                  utils.z_array,
+                                                  utils.ldist_at_z,
+                                                  left=0, right=0)
+
+                lum_flux = 4*np.pi*ldist_cm**2
+
+            self.derived_cache["lum_flux"] = lum_flux
+
+        return self.derived_cache["lum_flux"]
+
+    def _get_intrinsic_emission(self, model_comp):
+        """ Returns the dust-free rest-frame spectrum, with lines in row
+        0 and without in row 1, and the dust-free line luminosities. These
+        are kept from _calculate_full_spectrum if it was run with
+        add_continuum, otherwise they are calculated here. """
+
+        if "intrinsic" in self.derived_cache:
+            return self.derived_cache["intrinsic"]
+
+        config = self.config
+
+        t_bc = 0.01
+        if "t_bc" in list(model_comp):
+            t_bc = model_comp["t_bc"]
+
+        spectrum_bc, spectrum = self.stellar.spectrum(self.sfh.ceh.grid, t_bc)
+
+        em_lines = np.zeros(config.line_wavs.shape)
+
+        if self.nebular:
+            logU = model_comp["nebular"]["logU"]
+            fesc_fact = (1 - model_comp["nebular"].get("fesc", 0))
+
+            grid = self._get_nebular_sfh_ceh(model_comp)
+            outputs = self.nebular.line_fluxes_and_spectra(grid, t_bc, logU,
+                                                           True)
+
+            # All stellar emission below 912A goes into nebular emission
+            spectrum_bc[self.wavelengths < 912.] = 0.
+
+            em_lines += outputs[0]*fesc_fact
+            spectrum_bc = spectrum_bc + np.array(outputs[1:])*fesc_fact
+
+        else:
+            spectrum_bc = np.repeat(np.expand_dims(spectrum_bc, axis=0),
+                                    2, axis=0)
+
+        self.derived_cache["intrinsic"] = (spectrum + spectrum_bc, em_lines)
+
+        return self.derived_cache["intrinsic"]
 
     def _calculate_D4000(self, model_comp):
         """ This method calculates the D4000 spectral index from the full spectrum. 
@@ -679,35 +1092,43 @@ class model_galaxy(object):
         # constrain to D4000 filters
         blue_mask = (self.wavelengths >= 3400. ) & (self.wavelengths <= 3600.)
         red_mask = (self.wavelengths >= 4150.) & (self.wavelengths <= 4250.)
-        blue_fluxes = ((self.spectrum_full_cont[blue_mask]  * u.erg / (u.s * (u.cm ** 2) * u.AA)) * ((self.wavelengths[blue_mask] * (1 + model_comp["redshift"]) * u.AA) ** 2) / const.c).to(u.Jy).value
-        red_fluxes = ((self.spectrum_full_cont[red_mask] * u.erg / (u.s * (u.cm ** 2) * u.AA)) * ((self.wavelengths[red_mask] * (1 + model_comp["redshift"]) * u.AA) ** 2) / const.c).to(u.Jy).value
+        zplusone = 1. + model_comp["redshift"]
+        # convert f_lambda in erg/s/cm^2/A to f_nu in Jy
+        blue_fluxes = (self.spectrum_full_cont[blue_mask]
+                       * (self.wavelengths[blue_mask]*zplusone)**2
+                       / c_AA*10**23)
+        red_fluxes = (self.spectrum_full_cont[red_mask]
+                      * (self.wavelengths[red_mask]*zplusone)**2
+                      / c_AA*10**23)
         # calculate D4000
         self.D4000 = np.array([2.5*np.log10(np.median(red_fluxes) / np.median(blue_fluxes))])
 
     def _calculate_m_UV(self, model_comp):
         """This method calculates the UV apparent magnitude from the full spectrum in a top-hat filter between 1450<wav_rest<1550 Angstrom. 
         Only gives correctly normalized values when model spectrum has already been fitted."""
-        f_lambda_1500 = np.mean(self.spectrum_full[((self.wavelengths > 1_450.) & (self.wavelengths < 1_550.))]) * u.erg / (u.s * (u.cm ** 2) * u.AA)
-        self.m_UV = np.array([-2.5 * np.log10((f_lambda_1500 * ((1_500. * (1 + model_comp["redshift"]) * u.AA) ** 2) / const.c).to(u.Jy).value) + 8.9]) # observed frame
+        f_lambda_1500 = np.mean(self.spectrum_full[((self.wavelengths > 1_450.) & (self.wavelengths < 1_550.))])
+        f_Jy_1500 = f_lambda_1500*(1_500.*(1 + model_comp["redshift"]))**2/c_AA*10**23
+        self.m_UV = np.array([-2.5 * np.log10(f_Jy_1500) + 8.9]) # observed frame
     
     def _calculate_M_UV(self, model_comp):
         """This method calculates the UV absolute magnitude from the full spectrum in a top-hat filter between 1450<wav_rest<1550 Angstrom. 
         Only gives correctly normalized values when model spectrum has already been fitted."""
         self._calculate_m_UV(model_comp)
-        d_L = utils.cosmo.luminosity_distance(model_comp["redshift"]).to(u.pc)
-        self.M_UV = np.array([self.m_UV - 5 * np.log10(d_L.value / 10) \
+        d_L = self._get_ldist_pc(model_comp)
+        self.M_UV = np.array([self.m_UV - 5 * np.log10(d_L / 10) \
             + 2.5 * np.log10(1 + model_comp["redshift"])])
 
     def _calculate_L_UV_dustcorr(self, model_comp, out_units = u.erg):
         dustcorr_spectrum = self._calculate_full_dustcorr_spectrum(model_comp)
-        d_L = utils.cosmo.luminosity_distance(model_comp["redshift"]).to(u.pc)
-        # calculate observed frame flux at 1500 Angstrom rest frame
+        d_L_cm = self._get_ldist_pc(model_comp)*pc_cm
+        # calculate observed frame flux at 1500 Angstrom rest frame in Jy
         f_Jy_1500 = (np.mean(dustcorr_spectrum[((self.wavelengths > 1_450.) & \
-            (self.wavelengths < 1_550.))]) * u.erg / (u.s * (u.cm ** 2) * u.AA) * \
-            ((1_500. * (1. + self.model_comp["redshift"]) * u.AA) ** 2) / const.c).to(u.Jy)
-        # calculate L_UV
-        L_UV = np.array([(4 * np.pi * f_Jy_1500 * d_L ** 2 / (1. + model_comp["redshift"])).to(out_units).value])
-        setattr(self, "L_UV_dustcorr", L_UV)
+            (self.wavelengths < 1_550.))]) * \
+            (1_500. * (1. + model_comp["redshift"])) ** 2 / c_AA*10**23)
+        # calculate L_UV in erg/s/Hz, Jy = 10^-23 erg/s/cm^2/Hz
+        L_UV = 4 * np.pi * f_Jy_1500*10**-23 * d_L_cm ** 2 / (1. + model_comp["redshift"])
+        L_UV *= _unit_conversion(u.erg, out_units)
+        setattr(self, "L_UV_dustcorr", np.array([L_UV]))
 
     def _calculate_Halpha_EWrest(self, model_comp, line_wav = 6563., delta_wav = 100.):
         # calculate Halpha continuum flux
@@ -726,8 +1147,7 @@ class model_galaxy(object):
         lines = ['Halpha', 'Hbeta', 'Hgamma', 'OIII_5007', 'OIII_4959', 'NII_6548', 'NII_6584'],
         frame = "rest",
     ):
-        if not hasattr(self, f"line_fluxes_dustcorr_{frame}"):
-            self._calculate_dustcorr_em_lines(model_comp, frame = frame)
+        self._calculate_dustcorr_em_lines(model_comp, frame = frame)
         
         line_names = []
         for line in lines:
@@ -765,10 +1185,9 @@ class model_galaxy(object):
             if line_key:
                 line_wav_str = line_key.split(" ")[-1]
                 if line_wav_str[-1] == "A":
-                    units = u.AA
+                    line_wav = float(line_wav_str[:-1])
                 elif line_wav_str[-1] == "m":
-                    units = u.um
-                line_wav = (float(line_wav_str[:-1]) * units).to(u.AA).value
+                    line_wav = float(line_wav_str[:-1])*10**4  # microns
             else:
                 raise ValueError("The line %s is not in the lines_dict" % line)
 
@@ -782,15 +1201,15 @@ class model_galaxy(object):
             line_index = abs(self.wavelengths - line_wav).argmin()
             f_cont_line = dustcorr_cont_spectrum[line_index] # observed frame f_lambda
             
-            # save continuum flux in f_nu
-            f_cont_line_Jy = (f_cont_line * u.erg / (u.s * u.cm ** 2 * u.AA) \
-                * ((self.wavelengths[line_index] * (1. + self.model_comp["redshift"]) \
-                * u.AA) ** 2) / const.c).to(u.nJy).value
+            # save continuum flux in f_nu in nJy
+            f_cont_line_Jy = (f_cont_line \
+                * (self.wavelengths[line_index] * (1. + self.model_comp["redshift"])) ** 2 \
+                / c_AA*10**32)
             setattr(self, f"{line}_cont", np.array([f_cont_line_Jy]))
 
             if frame == "rest":
                 f_cont_line *= (1. + self.model_comp["redshift"]) ** 2
-            EW_line = (line_flux * u.AA / f_cont_line).to(out_units).value
+            EW_line = line_flux / f_cont_line * _unit_conversion(u.AA, out_units)
             setattr(self, f"{line}_EW_{frame}", np.array([EW_line]))
 
 
@@ -838,33 +1257,31 @@ class model_galaxy(object):
     def _calculate_Ndot_ion_caseB(self, model_comp, out_units = u.Hz):
         self._calculate_dustcorr_em_lines(model_comp, frame = "obs")
         # calculate luminosity distance
-        d_L = utils.cosmo.luminosity_distance(model_comp["redshift"]).to(u.pc)
-        # extract Halpha line flux in appropriate frame
+        d_L_cm = self._get_ldist_pc(model_comp)*pc_cm
+        # extract Halpha line flux in erg/s/cm^2 in appropriate frame
         try:
-            Ha_flux = getattr(self, "line_fluxes_dustcorr_obs")[utils.lines_dict_alt['Halpha']] \
-                * (u.erg / (u.s * u.cm ** 2))
+            Ha_flux = getattr(self, "line_fluxes_dustcorr_obs")[utils.lines_dict_alt['Halpha']]
         except KeyError:
-            Ha_flux = getattr(self, "line_fluxes_dustcorr_obs")[utils.lines_dict['Halpha']] \
-                * (u.erg / (u.s * u.cm ** 2))
-        # convert line flux to line luminosity
-        Ha_lum = 4 * np.pi * Ha_flux * d_L ** 2
+            Ha_flux = getattr(self, "line_fluxes_dustcorr_obs")[utils.lines_dict['Halpha']]
+        # convert line flux to line luminosity in erg/s
+        Ha_lum = 4 * np.pi * Ha_flux * d_L_cm ** 2
         # extract f_esc from model_comp
         f_esc = model_comp["nebular"].get("fesc", 0.)
-        # conversion factor for case B Hydrogen recombination
-        conv = 7.28e11 / u.erg # (slightly different to 1 / 1.36e-12)
-        # calculate ndot_ion
-        ndot_ion = np.array([(Ha_lum * conv / (1. - f_esc)).to(out_units).value])
-        setattr(self, "Ndot_ion_caseB", ndot_ion)
+        # conversion factor for case B Hydrogen recombination, per erg
+        conv = 7.28e11 # (slightly different to 1 / 1.36e-12)
+        # calculate ndot_ion in Hz
+        ndot_ion = Ha_lum * conv / (1. - f_esc) * _unit_conversion(u.Hz, out_units)
+        setattr(self, "Ndot_ion_caseB", np.array([ndot_ion]))
 
     def _calculate_xi_ion_caseB(self, model_comp, out_units = u.Hz / u.erg):
-        # extract ndot_ion
+        # extract ndot_ion in Hz
         self._calculate_Ndot_ion_caseB(model_comp, out_units = u.Hz)
-        ndot_ion = getattr(self, "Ndot_ion_caseB") * u.Hz
-        # extract UV luminosity
+        ndot_ion = getattr(self, "Ndot_ion_caseB")
+        # extract UV luminosity in erg
         self._calculate_L_UV_dustcorr(model_comp)
-        L_UV = getattr(self, "L_UV_dustcorr") * u.erg
+        L_UV = getattr(self, "L_UV_dustcorr")
         # calculate xi_ion
-        xi_ion = np.array([(ndot_ion / L_UV).to(out_units).value])
+        xi_ion = np.array([ndot_ion / L_UV * _unit_conversion(u.Hz / u.erg, out_units)])
         setattr(self, "xi_ion_caseB", xi_ion)
     
     def _calculate_stellar_spectrum(self, model_comp):
@@ -932,117 +1349,155 @@ class model_galaxy(object):
         and absorption processes to generate the internal (dust free) 
         full galaxy spectrum held within the class. """
 
-        t_bc = 0.01
-        if "t_bc" in list(model_comp):
-            t_bc = model_comp["t_bc"]
+        key = "spectrum_full_dustcorr" if add_lines else "spectrum_full_cont_dustcorr"
 
-        spectrum_bc, spectrum = self.stellar.spectrum(self.sfh.ceh.grid, t_bc)
+        if key not in self.derived_cache:
+            spectrum = self._get_intrinsic_emission(model_comp)[0]
+            spectrum = spectrum[0 if add_lines else 1]*self.igm.trans(model_comp["redshift"])
 
-        if self.nebular:
-            grid = np.copy(self.sfh.ceh.grid)
+            # Convert from luminosity to observed flux at redshift z.
+            spectrum /= self._get_lum_flux(model_comp) * (1. + model_comp["redshift"])
 
-            if "metallicity" in list(model_comp["nebular"]):
-                nebular_metallicity = model_comp["nebular"]["metallicity"]
-                neb_comp = deepcopy(model_comp)
-                for comp in list(neb_comp):
-                    if isinstance(neb_comp[comp], dict):
-                        neb_comp[comp]["metallicity"] = nebular_metallicity
+            # convert to erg/s/A/cm^2, or erg/s/A if redshift = 0.
+            spectrum *= L_sun
 
-                self.neb_sfh.update(neb_comp)
-                grid = self.neb_sfh.ceh.grid
+            self.derived_cache[key] = spectrum
 
-            # All stellar emission below 912A goes into nebular emission
-            spectrum_bc[self.wavelengths < 912.] = 0.
-            if add_lines:
-                spectrum_bc += self.nebular.spectrum(grid, t_bc,
-                    model_comp["nebular"]["logU"]) * (1 - model_comp["nebular"].get("fesc", 0))
-            else:
-                spectrum_bc += self.nebular.continuum_spectrum(grid, t_bc,
-                    model_comp["nebular"]["logU"]) * (1 - model_comp["nebular"].get("fesc", 0))
-
-        spectrum += spectrum_bc # Add birth cloud spectrum to spectrum.
-        spectrum *= self.igm.trans(model_comp["redshift"])
-
-        # Convert from luminosity to observed flux at redshift z.
-        lum_flux = 1.
-        if model_comp["redshift"] > 0.:
-            ldist_cm = 3.086*10**24*np.interp(model_comp["redshift"],
-                                              utils.z_array, utils.ldist_at_z,
-                                              left=0, right=0)
-
-            lum_flux = 4*np.pi*ldist_cm**2
-
-        spectrum /= lum_flux * (1. + model_comp["redshift"])
-
-        # convert to erg/s/A/cm^2, or erg/s/A if redshift = 0.
-        spectrum *= 3.826*10**33
-
-        if add_lines:
-            self.spectrum_full_dustcorr = spectrum
-        else:
-            self.spectrum_full_cont_dustcorr = spectrum
-        return spectrum
+        setattr(self, key, self.derived_cache[key])
+        return self.derived_cache[key]
     
     def _calculate_dustcorr_em_lines(self, model_comp, frame = "rest"):
         """ This method computes dust corrected emission lines """
 
-        t_bc = 0.01
-        if "t_bc" in list(model_comp):
-            t_bc = model_comp["t_bc"]
-
-        em_lines = np.zeros(config.line_wavs.shape)
-
-        if self.nebular:
-            grid = np.copy(self.sfh.ceh.grid)
+        config = self.config
 
-            if "metallicity" in list(model_comp["nebular"]):
-                nebular_metallicity = model_comp["nebular"]["metallicity"]
-                neb_comp = deepcopy(model_comp)
-                for comp in list(neb_comp):
-                    if isinstance(neb_comp[comp], dict):
-                        neb_comp[comp]["metallicity"] = nebular_metallicity
+        save_name = f"line_fluxes_dustcorr_{frame}"
 
-                self.neb_sfh.update(neb_comp)
-                grid = self.neb_sfh.ceh.grid
+        if save_name not in self.derived_cache:
+            em_lines = self._get_intrinsic_emission(model_comp)[1]
 
-            em_lines += self.nebular.line_fluxes(
-                grid, t_bc,
-                model_comp["nebular"]["logU"]) * (1 - model_comp["nebular"].get("fesc", 0)
-            )
+            # convert to erg/s/cm^2, or erg/s if redshift = 0.
+            em_lines = em_lines * (L_sun / self._get_lum_flux(model_comp))
 
-        # Convert from luminosity to observed flux at redshift z.
-        lum_flux = 1.
-        if model_comp["redshift"] > 0.:
-            ldist_cm = 3.086*10**24*np.interp(model_comp["redshift"],
-                                              utils.z_array, utils.ldist_at_z,
-                                              left=0, right=0)
+            if frame == "rest":
+                em_lines *= (1. + model_comp["redshift"])
 
-            lum_flux = 4*np.pi*ldist_cm**2
-        # convert to erg/s/cm^2, or erg/s if redshift = 0.
-        em_lines *= 3.826*10**33 / lum_flux
+            self.derived_cache[save_name] = dict(zip(config.line_names, em_lines))
 
-        if frame == "rest":
-            em_lines *= (1. + model_comp["redshift"])
-        
-        save_name = f"line_fluxes_dustcorr_{frame}"
-        setattr(self, save_name, dict(zip(config.line_names, em_lines)))
+        setattr(self, save_name, self.derived_cache[save_name])
 
     def plot(self, show=True):
+        from .. import plotting
+
         return plotting.plot_model_galaxy(self, show=show)
 
     def plot_full_spectrum(self, show=True):
+        from .. import plotting
+
         return plotting.plot_full_spectrum(self, show=show)
 
 def beta_slope_power_law_func(wav_rest, A, beta):
     return (10 ** A) * (wav_rest ** beta)
 
-def crop_to_C94_filters(wav_rest, flux_obs, model_comp): # I think this funtion does not require model_comp['redshift'] due to incorrect spectrum scaling
+def get_C94_mask(wav_rest):
+    """ Returns a boolean mask selecting the wavelengths which fall in
+    the 10 Calzetti+1994 UV continuum windows. """
     # Calzetti 1994 filters
     lower_Calzetti_filt = [1268., 1309., 1342., 1407., 1562., 1677., 1760., 1866., 1930., 2400.]
     upper_Calzetti_filt = [1284., 1316., 1371., 1515., 1583., 1740., 1833., 1890., 1950., 2580.]
-    Calzetti94_filter_indices = np.logical_or.reduce([(wav_rest > low_lim) & (wav_rest < up_lim) \
+    return np.logical_or.reduce([(wav_rest > low_lim) & (wav_rest < up_lim) \
                     for low_lim, up_lim in zip(lower_Calzetti_filt, upper_Calzetti_filt)])
-    
+
+def get_C94_design(wav_rest):
+    """ Returns the Calzetti+1994 window mask for wav_rest and the design
+    matrix used by fit_beta_C94, which has columns of ones and of the
+    natural log of the selected wavelengths, minus their mean. """
+    mask = get_C94_mask(wav_rest)
+    log_wavs = np.log(wav_rest[mask])
+    design = np.c_[np.ones_like(log_wavs), log_wavs - np.mean(log_wavs)]
+    return mask, design
+
+def fit_beta_C94(fluxes, design, n_iter=5):
+    """ Fits power laws, f_lambda = A*lambda**beta, to spectra in the
+    Calzetti+1994 windows by least squares in f_lambda, returning beta.
+
+    This gives the same result as scipy.optimize.curve_fit with
+    beta_slope_power_law_func, but in closed form for any number of
+    spectra at once. A straight line is first fitted in log-log space,
+    weighted by f_lambda**2 to approximate the residuals in f_lambda,
+    then refined with n_iter Gauss-Newton steps, each of which is a 2x2
+    linear solve per spectrum. The slope does not depend on redshift,
+    so rest-frame wavelengths can be used.
+
+    parameters
+    ----------
+
+    fluxes : numpy.ndarray
+        f_lambda in the Calzetti+1994 windows, either 1D for a single
+        spectrum or with shape (n_spectra, n_window_pixels).
+
+    design : numpy.ndarray
+        Design matrix returned by get_C94_design.
+
+    n_iter : int - optional
+        Number of Gauss-Newton steps to take.
+    """
+
+    fluxes = np.atleast_2d(fluxes)
+    x = design[:, 1]
+
+    # Normalise each spectrum, the slope is unaffected.
+    norm = np.max(np.abs(fluxes), axis=1, keepdims=True)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fluxes = fluxes/norm
+
+        def solve(weights, y):
+            """ Weighted least squares for a line in x, for each row. """
+            s_w = weights.dot(design)
+            s_wx = (weights*x).dot(design)
+            s_y = np.c_[np.sum(weights*y, axis=1), (weights*y).dot(x)]
+
+            det = s_w[:, 0]*s_wx[:, 1] - s_w[:, 1]*s_wx[:, 0]
+            c = (s_y[:, 0]*s_wx[:, 1] - s_y[:, 1]*s_wx[:, 0])/det
+            beta = (s_w[:, 0]*s_y[:, 1] - s_w[:, 1]*s_y[:, 0])/det
+            return c, beta
+
+        positive = fluxes > 0.
+        log_fluxes = np.log(np.where(positive, fluxes, 1.))
+        c, beta = solve(np.where(positive, fluxes**2, 0.), log_fluxes)
+
+        for i in range(n_iter):
+            model = np.exp(c[:, np.newaxis] + beta[:, np.newaxis]*x)
+            d_c, d_beta = solve(model**2, (fluxes - model)/model)
+            c += d_c
+            beta += d_beta
+
+    return beta
+
+def fit_beta_C94_batch(spectra_full_cont, model):
+    """ Fits beta_C94 to many rest-frame continuum spectra at once, as
+    saved in spectrum_full_cont by model, the model_galaxy used to
+    generate them, e.g. for all posterior samples or prior draws.
+
+    parameters
+    ----------
+
+    spectra_full_cont : numpy.ndarray
+        Continuum spectra with shape (n_spectra, n_wavelengths), on the
+        wavelength sampling of model.
+
+    model : bagpipes.model_galaxy
+        The model_galaxy the spectra were generated with.
+    """
+
+    fluxes = spectra_full_cont[:, model.C94_mask]
+
+    return fit_beta_C94(fluxes, model.C94_design)
+
+def crop_to_C94_filters(wav_rest, flux_obs, model_comp): # I think this funtion does not require model_comp['redshift'] due to incorrect spectrum scaling
+    Calzetti94_filter_indices = get_C94_mask(wav_rest)
+
     wav_obs = wav_rest[Calzetti94_filter_indices] * (1 + model_comp["redshift"])
     flux_obs = flux_obs[Calzetti94_filter_indices]
     return wav_obs, flux_obs
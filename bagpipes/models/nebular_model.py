@@ -2,7 +2,7 @@ from __future__ import print_function, division, absolute_import
 
 import numpy as np
 
-from bagpipes import config
+from .grid_cache import cached_grid
 
 class nebular(object):
     """ Allows access to and maniuplation of nebular emission models.
@@ -15,18 +15,38 @@ class nebular(object):
 
     wavelengths : np.ndarray
         1D array of wavelength values desired for the stellar models.
+
+    config : module - optional
+        The config to use, e.g. from bagpipes.config_utils.load_config.
+        Defaults to the currently active config.
     """
 
-    def __init__(self, wavelengths, velshift):
+    def __init__(self, wavelengths, velshift, config=None):
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
+
         self.wavelengths = wavelengths
         self.velshift = velshift
-        self.combined_grid, self.line_grid, self.continuum_grid = self._setup_grids()
+        grids = cached_grid("nebular", wavelengths, self._setup_grids,
+                            velshift, grid_files=[config.neb_cont_file,
+                                                  config.neb_line_file,
+                                                  "cloudy_linewavs.txt"],
+                            config=config)
+
+        self.combined_grid, self.line_grid, self.continuum_grid = grids
+
+        # Age-truncated grids for the first value of t_bc requested.
+        self.t_bc_cache = None
 
     def _setup_grids(self):
         """ Loads Cloudy nebular continuum grid and resamples to the
         input wavelengths. Loads nebular line grids and adds line fluxes
         to the correct pixels in order to create a combined grid. """
 
+        config = self.config
+
         comb_grid = np.zeros((self.wavelengths.shape[0],
                               config.metallicities.shape[0],
                               config.logU.shape[0],
@@ -127,66 +147,209 @@ class nebular(object):
 
         return self._interpolate_grid(self.line_grid, sfh_ceh, t_bc, logU)
 
+    def line_fluxes_and_spectra(self, sfh_ceh, t_bc, logU, continuum=False):
+        """ Obtain line fluxes and the 1D spectrum, and optionally the 1D
+        continuum spectrum, from one contraction over the grids.
+
+        parameters
+        ----------
+
+        sfh_ceh : numpy.ndarray
+            2D array containing the desired star-formation and
+            chemical evolution history.
+
+        logU : float
+            Log10 of the ionization parameter.
+
+        t_bc : float
+            The maximum age at which to include nebular emission.
+
+        continuum : bool - optional
+            Whether to also return the continuum spectrum.
+        """
+
+        n_lines = self.line_grid.shape[0]
+        n_wavs = self.wavelengths.shape[0]
+
+        if self.t_bc_cache is None:
+            self._build_t_bc_cache(t_bc)
+
+        if self.t_bc_cache[0] != t_bc:
+            outputs = [self.line_fluxes(sfh_ceh, t_bc, logU),
+                       self.spectrum(sfh_ceh, t_bc, logU)]
+
+            if continuum:
+                outputs.append(self.continuum_spectrum(sfh_ceh, t_bc, logU))
+
+            return outputs
+
+        index, grids = self.t_bc_cache[1:]
+        n_rows = n_lines + (2 + int(continuum))*n_wavs
+
+        if index == 0:
+            outputs = np.zeros(n_rows)
+
+        else:
+            logU_ind, logU_weight = self._logU_index(logU)
+
+            sfh_flat = sfh_ceh[:, :index].flatten()
+            outputs = (logU_weight*np.dot(grids[logU_ind-1, :n_rows], sfh_flat)
+                       + (1 - logU_weight)*np.dot(grids[logU_ind, :n_rows],
+                                                  sfh_flat))
+
+        outputs = [outputs[:n_lines], outputs[n_lines:n_lines + n_wavs],
+                   outputs[n_lines + n_wavs:]]
+
+        if not continuum:
+            return outputs[:2]
+
+        return outputs
+
+    def _build_t_bc_cache(self, t_bc):
+        """ Stores the line, combined and continuum grids truncated to
+        ages younger than t_bc, with the partial final age bin already
+        weighted, as one contiguous array of shape (n_logU, n_rows,
+        n_metallicities*n_ages). """
+
+        index, weight = self._age_index(t_bc)
+
+        grids = np.concatenate((self.line_grid[:, :, :, :index],
+                                self.combined_grid[:, :, :, :index],
+                                self.continuum_grid[:, :, :, :index]), axis=0)
+
+        if index > 0:
+            grids[:, :, :, index-1] *= weight
+
+        grids = np.ascontiguousarray(np.transpose(grids, (2, 0, 1, 3)))
+        grids = grids.reshape(grids.shape[0], grids.shape[1], -1)
+
+        self.t_bc_cache = (t_bc, index, grids)
+
+    def _age_index(self, t_bc):
+        """ Returns the number of age bins younger than t_bc and the
+        weight of the final, partially included bin. """
+
+        config = self.config
+
+        t_bc *= 10**9
+
+        index = config.age_bins[config.age_bins < t_bc].shape[0]
+        weight = 1 - (config.age_bins[index] - t_bc)/config.age_widths[index-1]
+
+        return index, weight
+
+    def _logU_index(self, logU):
+        """ Returns the index of the upper bracketing logU grid point and
+        the weight of the lower one. Also accepts an array of logU. """
+
+        config = self.config
+
+        if np.any((logU < config.logU[0]) | (logU > config.logU[-1])):
+            raise ValueError("Bagpipes: logU must be between "
+                             + str(config.logU[0]) + " and "
+                             + str(config.logU[-1]) + ", the range of "
+                             + "the nebular grids.")
+
+        # Clipping only moves logU == config.logU[0] into the first bin.
+        logU_ind = np.searchsorted(config.logU, logU)
+        logU_ind = np.clip(logU_ind, 1, config.logU.shape[0] - 1)
+
+        logU_weight = ((config.logU[logU_ind] - logU)
+                       / (config.logU[logU_ind] - config.logU[logU_ind - 1]))
+
+        return logU_ind, logU_weight
+
     def _interpolate_grid(self, grid, sfh_ceh, t_bc, logU):
         """
         Interpolates a chosen grid in logU and collapses over star-
         formation and chemical enrichment history to get 1D models.
-        
-        This modified version handles cases where logU is an exact grid point
-        by skipping interpolation.
         """
 
-        t_bc *= 10**9
+        index, weight = self._age_index(t_bc)
 
-        # Check for an exact match in the logU grid using a small tolerance
-        match_indices = np.where(np.isclose(config.logU, logU))[0]
+        if index == 0:
+            return np.zeros(grid.shape[0])
 
-        # Find the index and weight for the age interpolation, which is
-        # needed in both cases.
-        index = config.age_bins[config.age_bins < t_bc].shape[0]
-        weight = 1 - (config.age_bins[index] - t_bc) / config.age_widths[index-1]
-        
-        # --- Path 1: logU is an exact grid point ---
-        if len(match_indices) > 0:
-            logU_ind = match_indices[0]
-            
-            spectrum = np.zeros_like(grid[:, 0, 0, 0])
-            for i in range(config.metallicities.shape[0]):
-                if sfh_ceh[i, :index].sum() > 0.:
-                    sfh_ceh[:, index-1] *= weight
-                    
-                    # Sum over age and metallicity for the single, exact logU slice
-                    spectrum += np.sum(grid[:, i, logU_ind, :index] * sfh_ceh[i, :index], axis=1)
-
-                    sfh_ceh[:, index-1] /= weight
-
-        # --- Path 2: Default behavior, logU is between grid points ---
-        else:
-            # This block is identical to the original function
-            if logU == config.logU[0]:
-                logU += 10**-10
+        logU_ind, logU_weight = self._logU_index(logU)
 
-            spectrum_low_logU = np.zeros_like(grid[:, 0, 0, 0])
-            spectrum_high_logU = np.zeros_like(grid[:, 0, 0, 0])
+        sfh = np.copy(sfh_ceh[:, :index])
+        sfh[:, index-1] *= weight
 
-            logU_ind = config.logU[config.logU < logU].shape[0]
-            logU_weight = ((config.logU[logU_ind] - logU) /
-                        (config.logU[logU_ind] - config.logU[logU_ind - 1]))
-            
-            for i in range(config.metallicities.shape[0]):
-                if sfh_ceh[i, :index].sum() > 0.:
-                    sfh_ceh[:, index-1] *= weight
+        spectrum_low_logU = np.tensordot(grid[:, :, logU_ind - 1, :index], sfh,
+                                         axes=([1, 2], [0, 1]))
 
-                    spectrum_low_logU += np.sum(grid[:, i, logU_ind - 1, :index] *
-                                                sfh_ceh[i, :index], axis=1)
+        spectrum_high_logU = np.tensordot(grid[:, :, logU_ind, :index], sfh,
+                                          axes=([1, 2], [0, 1]))
 
-                    spectrum_high_logU += np.sum(grid[:, i, logU_ind, :index] *
-                                                sfh_ceh[i, :index], axis=1)
+        spectrum = (spectrum_high_logU * (1 - logU_weight) +
+                    spectrum_low_logU * logU_weight)
 
-                    sfh_ceh[:, index-1] /= weight
+        return spectrum
 
-            spectrum = (spectrum_high_logU * (1 - logU_weight) +
-                        spectrum_low_logU * logU_weight)
+    def spectrum_batch(self, sfh_cehs, t_bc, logU):
+        """ Obtain 1D spectra for a stack of star-formation and chemical
+        enrichment histories, see _interpolate_grid_batch. """
+        return self._interpolate_grid_batch(self.combined_grid, sfh_cehs,
+                                            t_bc, logU)
+
+    def continuum_spectrum_batch(self, sfh_cehs, t_bc, logU):
+        """ Obtain 1D continuum spectra for a stack of star-formation
+        and chemical enrichment histories, see _interpolate_grid_batch. """
+        return self._interpolate_grid_batch(self.continuum_grid, sfh_cehs,
+                                            t_bc, logU)
+
+    def line_fluxes_batch(self, sfh_cehs, t_bc, logU):
+        """ Obtain line fluxes for a stack of star-formation and chemical
+        enrichment histories, see _interpolate_grid_batch. """
+        return self._interpolate_grid_batch(self.line_grid, sfh_cehs,
+                                            t_bc, logU)
+
+    def _interpolate_grid_batch(self, grid, sfh_cehs, t_bc, logU):
+        """ Batched version of _interpolate_grid. Interpolates a chosen
+        grid in logU and collapses over the star-formation and chemical
+        enrichment histories of n_models models in one matrix product.
 
-        return spectrum
+        parameters
+        ----------
+
+        sfh_cehs : numpy.ndarray
+            3D array of shape (n_models, n_metallicities, n_ages).
+
+        t_bc : float or numpy.ndarray
+            The maximum age(s) at which to include nebular emission.
+
+        logU : float or numpy.ndarray
+            Log10 of the ionization parameter(s).
+        """
+
+        config = self.config
+
+        n_models = sfh_cehs.shape[0]
+        n_ages = grid.shape[-1]
+        t_bc = np.zeros(n_models) + np.asarray(t_bc, dtype=float)*10**9
+        logU = np.zeros(n_models) + np.asarray(logU, dtype=float)
+
+        # Weights for the age bins younger than t_bc.
+        index = np.searchsorted(config.age_bins, t_bc)
+        weight = 1 - (config.age_bins[index] - t_bc)/config.age_widths[index-1]
+
+        age_weights = (np.arange(n_ages) < np.expand_dims(index, axis=1))
+        age_weights = age_weights.astype(float)
+        rows = np.arange(n_models)[index > 0]
+        age_weights[rows, index[rows]-1] = weight[rows]
+
+        # Weights for the bracketing logU grid points.
+        logU_weights = np.zeros((n_models, config.logU.shape[0]))
+        logU_ind, logU_weight = self._logU_index(logU)
+
+        logU_weights[np.arange(n_models), logU_ind - 1] = logU_weight
+        logU_weights[np.arange(n_models), logU_ind] = 1 - logU_weight
+
+        weights = sfh_cehs[:, :, :n_ages]*np.expand_dims(age_weights, axis=1)
+        weights = (np.expand_dims(weights, axis=2)
+                   * np.expand_dims(logU_weights, axis=(1, 3)))
+
+        grid = grid.reshape(grid.shape[0], -1)
+
+        return np.dot(weights.reshape(n_models, -1), grid.T)
 
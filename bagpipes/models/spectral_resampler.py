@@ -0,0 +1,255 @@
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import spectres
+
+from collections import OrderedDict
+from scipy.sparse import csr_matrix
+
+from .. import utils
+
+
+def resampling_matrix(new_wavs, old_wavs):
+    """ Returns the sparse matrix which performs the same flux-conserving
+    resampling from old_wavs onto new_wavs as spectres with fill=0, along
+    with the index of the first column of old_wavs it acts on. Only the
+    band of columns which contribute to the output is stored.
+
+    parameters
+    ----------
+
+    new_wavs : numpy.ndarray
+        Wavelengths of the resampled spectrum.
+
+    old_wavs : numpy.ndarray
+        Wavelengths of the input spectrum.
+    """
+
+    old_edges, old_widths = utils.make_bins(old_wavs, make_rhs=True)
+    new_edges = utils.make_bins(new_wavs, make_rhs=True)[0]
+
+    # New bins which extend outside the input spectrum are left empty.
+    in_range = ((new_edges[:-1] >= old_edges[0])
+                & (new_edges[1:] <= old_edges[-1]))
+
+    # First and last old bins which are partially covered by each new bin.
+    start = np.searchsorted(old_edges[1:], new_edges[:-1], side="right")
+    stop = np.searchsorted(old_edges[1:], new_edges[1:], side="left")
+    start = np.clip(start, 0, old_wavs.shape[0] - 1)
+    stop = np.clip(stop, start, old_wavs.shape[0] - 1)
+
+    n_cols = np.where(in_range, stop - start + 1, 0)
+
+    if not np.any(in_range):
+        return csr_matrix((new_wavs.shape[0], 0)), 0
+
+    indptr = np.zeros(new_wavs.shape[0] + 1, dtype=int)
+    indptr[1:] = np.cumsum(n_cols)
+
+    row_starts = np.repeat(start, n_cols)
+    cols = row_starts + np.arange(indptr[-1]) - np.repeat(indptr[:-1], n_cols)
+
+    # Weight each old bin by the fraction of it the new bin covers.
+    weights = old_widths[cols]
+
+    first = indptr[:-1][n_cols > 1]
+    last = indptr[1:][n_cols > 1] - 1
+    rows = np.flatnonzero(n_cols > 1)
+
+    weights[first] *= ((old_edges[start[rows] + 1] - new_edges[rows])
+                       / old_widths[start[rows]])
+
+    weights[last] *= ((new_edges[rows + 1] - old_edges[stop[rows]])
+                      / old_widths[stop[rows]])
+
+    row_sums = np.add.reduceat(weights, indptr[:-1][n_cols > 0])
+    weights /= np.repeat(row_sums, n_cols[n_cols > 0])
+
+    col_min = cols.min()
+    n_band = cols.max() - col_min + 1
+
+    matrix = csr_matrix((weights, cols - col_min, indptr),
+                        shape=(new_wavs.shape[0], n_band))
+
+    return matrix, col_min
+
+
+class spectral_resampler(object):
+    """ Resamples spectra from a fixed rest-frame wavelength sampling
+    onto a fixed set of observed wavelengths at a given redshift, giving
+    the same result as spectres with fill=0.
+
+    The resampling is done by a sparse matrix product. Matrices are
+    cached on a grid of redshifts at multiples of z_sampling, and the
+    resampled spectrum is linearly interpolated between the two nearest
+    grid points, so the result at each redshift does not depend on the
+    order of calls. If exact_redshift is set, spectra at that redshift
+    are instead resampled exactly with a single matrix, which makes
+    fixed-redshift fitting fast.
+
+    Parameters
+    ----------
+
+    new_wavs : numpy.ndarray
+        Observed wavelengths to resample onto.
+
+    wavelengths : numpy.ndarray
+        Rest-frame wavelengths of the spectra to be resampled.
+
+    z_sampling : float - optional
+        Spacing of the redshift grid on which matrices are cached.
+
+    max_cache_size : int - optional
+        Maximum memory in bytes used by the redshift grid cache, the
+        least recently used redshifts are discarded beyond this.
+
+    exact_redshift : float - optional
+        A redshift at which spectra are resampled exactly rather than
+        interpolated, e.g. the redshift of a fixed-redshift fit.
+
+    post_matrix : scipy.sparse matrix - optional
+        A fixed linear operation to apply after the resampling, which is
+        multiplied into the cached matrices, e.g. spectral broadening
+        followed by resampling onto the final output wavelengths.
+    """
+
+    def __init__(self, new_wavs, wavelengths, z_sampling=10**-5,
+                 max_cache_size=10**8, exact_redshift=None,
+                 post_matrix=None):
+
+        self.new_wavs = new_wavs
+        self.new_edges = utils.make_bins(new_wavs, make_rhs=True)[0]
+        self.wavelengths = wavelengths
+        self.z_sampling = z_sampling
+        self.max_cache_size = max_cache_size
+        self.post_matrix = post_matrix
+
+        self.exact_redshift = exact_redshift
+        self.exact_matrix = None
+        self.z_cache = OrderedDict()
+        self.z_cache_size = 0
+
+    def _calculate_matrix(self, redshift):
+        """ Returns the resampling matrix at a given redshift, with
+        post_matrix applied, and the first column it acts on. """
+
+        redshifted_wavs = (1. + redshift)*self.wavelengths
+        matrix, col_min = resampling_matrix(self.new_wavs, redshifted_wavs)
+
+        if self.post_matrix is not None:
+            matrix = csr_matrix(self.post_matrix.dot(matrix))
+
+        return matrix, col_min
+
+    def _z_position(self, redshift):
+        """ Returns the index of the redshift grid point at or below
+        redshift and the fractional distance to the next one. """
+
+        z_pos = redshift/self.z_sampling
+        z_ind = int(np.floor(z_pos))
+
+        return z_ind, z_pos - z_ind
+
+    def _get_exact_matrix(self):
+        """ Returns the matrix at exact_redshift, calculating it the
+        first time it is needed. """
+
+        if self.exact_matrix is None:
+            self.exact_matrix = self._calculate_matrix(self.exact_redshift)
+
+        return self.exact_matrix
+
+    def _get_cached_matrix(self, z_ind):
+        """ Returns the matrix at the z_ind-th point of the redshift grid,
+        calculating it and adding it to the cache if necessary. """
+
+        if z_ind in self.z_cache:
+            self.z_cache.move_to_end(z_ind)
+            return self.z_cache[z_ind]
+
+        matrix = self._calculate_matrix(z_ind*self.z_sampling)
+
+        self.z_cache[z_ind] = matrix
+        self.z_cache_size += (matrix[0].data.nbytes + matrix[0].indices.nbytes
+                              + matrix[0].indptr.nbytes)
+
+        while self.z_cache_size > self.max_cache_size and len(self.z_cache) > 2:
+            old_matrix = self.z_cache.popitem(last=False)[1][0]
+            self.z_cache_size -= (old_matrix.data.nbytes
+                                  + old_matrix.indices.nbytes
+                                  + old_matrix.indptr.nbytes)
+
+        return matrix
+
+    def window(self, redshift):
+        """ Returns the start and stop indices of the part of wavelengths
+        needed to resample a spectrum at redshift. This covers the two
+        nearest points of the redshift grid, or exact_redshift, plus a
+        margin of two pixels so the pixels at the edges of the window
+        are not used. """
+
+        if redshift == self.exact_redshift:
+            z_min = z_max = redshift
+
+        else:
+            z_min = self._z_position(redshift)[0]*self.z_sampling
+            z_max = z_min + self.z_sampling
+
+        start = np.searchsorted(self.wavelengths,
+                                self.new_edges[0]/(1. + z_max)) - 2
+
+        stop = np.searchsorted(self.wavelengths,
+                               self.new_edges[-1]/(1. + z_min)) + 2
+
+        return max(start, 0), min(stop, self.wavelengths.shape[0])
+
+    def _apply(self, matrix, spectrum, offset):
+        """ Applies a matrix to a spectrum which starts at index offset
+        of wavelengths, or returns None if the matrix needs pixels the
+        spectrum does not have. """
+
+        matrix, col_min = matrix
+        col_min -= offset
+
+        # Bins at the edges of the spectrum are not the same as those in
+        # the full wavelength sampling.
+        if col_min < 1 or col_min + matrix.shape[1] > spectrum.shape[0] - 1:
+            return None
+
+        return matrix.dot(spectrum[col_min:col_min + matrix.shape[1]])
+
+    def resample(self, spectrum, redshift, offset=0):
+        """ Resamples spectrum, which is sampled at wavelengths[offset:]
+        in the rest frame, onto new_wavs at the given redshift. """
+
+        if redshift == self.exact_redshift:
+            fluxes = self._apply(self._get_exact_matrix(), spectrum, offset)
+            z_frac = 0.
+
+        else:
+            z_ind, z_frac = self._z_position(redshift)
+            fluxes = self._apply(self._get_cached_matrix(z_ind), spectrum,
+                                 offset)
+
+        if fluxes is not None and z_frac > 0.:
+            fluxes_2 = self._apply(self._get_cached_matrix(z_ind+1),
+                                   spectrum, offset)
+
+            if fluxes_2 is not None:
+                fluxes = (1. - z_frac)*fluxes + z_frac*fluxes_2
+
+            else:
+                fluxes = None
+
+        # Fall back on spectres if the spectrum has been cut too short.
+        if fluxes is None:
+            redshifted_wavs = (1. + redshift)*self.wavelengths
+            redshifted_wavs = redshifted_wavs[offset:offset+spectrum.shape[0]]
+
+            fluxes = spectres.spectres(self.new_wavs, redshifted_wavs,
+                                       spectrum, fill=0)
+
+            if self.post_matrix is not None:
+                fluxes = self.post_matrix.dot(fluxes)
+
+        return fluxes
@@ -1,11 +1,10 @@
 from __future__ import print_function, division, absolute_import
 
 import numpy as np
-from scipy.optimize import fsolve
+from scipy.special import erf
+from scipy.sparse import csr_matrix
 
-from bagpipes import config
-
-from .. import plotting, utils
+from .. import utils
 
 from .chemical_enrichment_history import chemical_enrichment_history
 
@@ -37,21 +36,45 @@ class star_formation_history:
 
     log_sampling : float - optional
         the log of the age sampling of the SFH, defaults to 0.0025.
+
+    config : module - optional
+        The config to use, e.g. from bagpipes.config_utils.load_config.
+        Defaults to the currently active config.
+
+    If model_components contains an integer "sfh_quadrature" the fine
+    log age sampling is not used. Instead the mass formed in each of
+    the SSP age bins set in the config file is integrated directly,
+    analytically for the exponential, delayed, constant, burst,
+    const_exp and lognormal components and otherwise with this number
+    of Gauss-Legendre points per bin. This is much faster, but derived
+    quantities are then only resolved to the width of the SSP bins.
     """
 
-    def __init__(self, model_components, log_sampling=0.0025):
+    def __init__(self, model_components, log_sampling=0.0025,
+                 config=None):
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
 
         self.hubble_time = utils.age_at_z[utils.z_array == 0.]
 
         # Set up the age sampling for internal SFH calculations.
-        log_age_max = np.log10(self.hubble_time)+9. + 2*log_sampling
-        self.ages = np.arange(6., log_age_max, log_sampling)
-        self.age_lhs = utils.make_bins(self.ages, make_rhs=True)[0]
-        self.ages = 10**self.ages
-        self.age_lhs = 10**self.age_lhs
-        self.age_lhs[0] = 0.
-        self.age_lhs[-1] = 10**9*self.hubble_time
-        self.age_widths = self.age_lhs[1:] - self.age_lhs[:-1]
+        self.n_quad = None
+
+        if "sfh_quadrature" in list(model_components):
+            self.n_quad = int(model_components["sfh_quadrature"])
+            self._set_quadrature_sampling(self.n_quad)
+
+        else:
+            log_age_max = np.log10(self.hubble_time)+9. + 2*log_sampling
+            self.ages = np.arange(6., log_age_max, log_sampling)
+            self.age_lhs = utils.make_bins(self.ages, make_rhs=True)[0]
+            self.ages = 10**self.ages
+            self.age_lhs = 10**self.age_lhs
+            self.age_lhs[0] = 0.
+            self.age_lhs[-1] = 10**9*self.hubble_time
+            self.age_widths = self.age_lhs[1:] - self.age_lhs[:-1]
 
         # Detect SFH components
         comp_list = list(model_components)
@@ -62,20 +85,25 @@ class star_formation_history:
         self.component_weights = {}  # SSP weights for all components.
 
         self._resample_live_frac_grid()
+        self._build_rebin_matrix()
 
         self.update(model_components)
 
     def update(self, model_components):
 
+        config = self.config
+
         self.model_components = model_components
         self.redshift = self.model_components["redshift"]
 
-        self.sfh = np.zeros_like(self.ages)  # Star-formation history
-
         self.unphysical = False
         self.age_of_universe = 10**9*np.interp(self.redshift, utils.z_array,
                                                utils.age_at_z)
 
+        # One row per component, filled in place by the component methods.
+        sfrs = np.zeros((len(self.components), self.ages.shape[0]))
+        desired_mass = np.zeros(len(self.components))
+
         # Calculate the star-formation history for each of the components.
         for i in range(len(self.components)):
 
@@ -85,35 +113,57 @@ class star_formation_history:
             if name not in dir(self):
                 func = name[:-1]
 
-            self.component_sfrs[name] = np.zeros_like(self.ages)
-            self.component_weights[name] = np.zeros_like(config.age_sampling)
+            # Use the closed-form mass in each SSP bin where available.
+            if (self.n_quad is not None
+                    and hasattr(self, "_" + func + "_mass_formed")):
 
-            getattr(self, func)(self.component_sfrs[name],
-                                self.model_components[name])
+                mass_formed = getattr(self, "_" + func + "_mass_formed")
+                edges = np.append(config.age_bins, self.age_of_universe)
+                formed = mass_formed(edges, self.model_components[name])
 
-            # Normalise to the correct mass.
-            mass_norm = np.sum(self.component_sfrs[name]*self.age_widths)
-            desired_mass = 10**self.model_components[name]["massformed"]
+                # Mass formed before the Big Bang within the bin which
+                # contains it is not kept by _spread_bin_masses, so check
+                # for it here, as the fine age sampling does below.
+                if formed[-2] > formed[-1]:
+                    self.unphysical = True
 
-            self.component_sfrs[name] *= desired_mass/mass_norm
-            self.sfh += self.component_sfrs[name]
+                sfrs[i] = self._spread_bin_masses(np.diff(formed[:-1]))
+
+            else:
+                getattr(self, func)(sfrs[i], self.model_components[name])
+            desired_mass[i] = 10**self.model_components[name]["massformed"]
+
+        # Normalise to the correct mass.
+        masses = sfrs*self.age_widths
+        mass_norm = np.sum(masses, axis=1)
+
+        norm = np.expand_dims(desired_mass/mass_norm, axis=1)
+        sfrs *= norm
+        masses *= norm
+
+        self.sfh = np.sum(sfrs, axis=0)  # Star-formation history
+
+        # Sum up contributions to each age bin to create SSP weights
+        weights = self.rebin_matrix.dot(masses.T).T
+
+        for i in range(len(self.components)):
+            self.component_sfrs[self.components[i]] = sfrs[i]
+            self.component_weights[self.components[i]] = weights[i]
 
-            # Sum up contributions to each age bin to create SSP weights
-            weights = self.component_sfrs[name]*self.age_widths
-            self.component_weights[name] = np.histogram(self.ages,
-                                                        bins=config.age_bins,
-                                                        weights=weights)[0]
         # Check no stars formed before the Big Bang.
-        if self.sfh[self.ages > self.age_of_universe].max() > 0.:
+        if np.max(self.sfh[self.ages > self.age_of_universe], initial=0.) > 0.:
             self.unphysical = True
 
         # ceh: Chemical enrichment history object
         self.ceh = chemical_enrichment_history(self.model_components,
-                                               self.component_weights)
+                                               self.component_weights,
+                                               config=config)
 
         self._calculate_derived_quantities()
 
     def _calculate_derived_quantities(self):
+        config = self.config
+
         self.stellar_mass = np.log10(np.sum(self.live_frac_grid*self.ceh.grid))
         self.formed_mass = np.log10(np.sum(self.ceh.grid))
 
@@ -172,7 +222,64 @@ class star_formation_history:
             quench_ind = np.argmax(normed_sfrs > 0.1)
             self.tquench = tunivs[quench_ind]*10**-9
 
+    def _set_quadrature_sampling(self, n_quad):
+        """ Sets the internal age sampling to n_quad Gauss-Legendre
+        points within each SSP age bin, with the quadrature weights
+        used as the widths of each point. The mass formed in each bin
+        is then integrated directly, and the derived quantities are
+        calculated from the same reduced sampling. """
+
+        config = self.config
+
+        nodes, quad_weights = np.polynomial.legendre.leggauss(n_quad)
+
+        bin_lhs = np.expand_dims(config.age_bins[:-1], axis=1)
+        bin_widths = np.expand_dims(config.age_widths, axis=1)
+
+        self.ages = (bin_lhs + bin_widths*(nodes + 1.)/2.).flatten()
+        self.age_widths = (bin_widths*quad_weights/2.).flatten()
+        self.age_lhs = np.zeros(self.ages.shape[0] + 1)
+        self.age_lhs[1:] = np.cumsum(self.age_widths)
+
+    def _spread_bin_masses(self, mass):
+        """ Converts masses formed in each SSP age bin to SFRs at the
+        quadrature points, constant within each bin. In the bin which
+        contains the Big Bang only the points after it are used. """
+
+        widths = self.age_widths.reshape(-1, self.n_quad)
+        inside = (self.ages < self.age_of_universe).reshape(-1, self.n_quad)
+
+        # Bins entirely before the Big Bang keep all of their points so
+        # that any mass formed there marks the model as unphysical.
+        inside[np.sum(widths*inside, axis=1) == 0.] = True
+
+        bin_sfrs = mass/np.sum(widths*inside, axis=1)
+
+        return (inside*np.expand_dims(bin_sfrs, axis=1)).flatten()
+
+    def _build_rebin_matrix(self):
+        """ Builds the sparse matrix which sums the mass formed on the
+        fine internal age sampling into the SSP age bins set in the
+        config file, equivalent to np.histogram with these bins. """
+
+        config = self.config
+
+        bin_inds = np.searchsorted(config.age_bins, self.ages, side="right")-1
+
+        # The final bin edge is inclusive, as for np.histogram.
+        bin_inds[self.ages == config.age_bins[-1]] = config.age_bins.shape[0]-2
+
+        mask = (bin_inds >= 0) & (bin_inds < config.age_bins.shape[0] - 1)
+
+        self.rebin_matrix = csr_matrix((np.ones(mask.sum()),
+                                        (bin_inds[mask],
+                                         np.arange(self.ages.shape[0])[mask])),
+                                       shape=(config.age_bins.shape[0] - 1,
+                                              self.ages.shape[0]))
+
     def _resample_live_frac_grid(self):
+        config = self.config
+
         self.live_frac_grid = np.zeros((config.metallicities.shape[0],
                                         config.age_sampling.shape[0]))
 
@@ -197,17 +304,33 @@ class star_formation_history:
     def burst(self, sfr, param):
         """ A delta function burst of star-formation. """
 
+        age = self._burst_age(param)
+
+        sfr[np.argmin(np.abs(self.ages - age))] += 1
+
+    def _burst_age(self, param):
         if "age" in list(param):
-            age = param["age"]*10**9
+            return param["age"]*10**9
 
         elif "tform" in list(param):
-            age = self.age_of_universe - param["tform"]*10**9
+            return self.age_of_universe - param["tform"]*10**9
 
-        sfr[np.argmin(np.abs(self.ages - age))] += 1
+    def _burst_mass_formed(self, ages, param):
+        """ Mass formed more recently than each of ages (up to the
+        normalisation) for a burst. The _mass_formed methods are used
+        to integrate the SFH analytically within the SSP age bins. """
+
+        return (ages > self._burst_age(param)).astype(float)
 
     def constant(self, sfr, param):
         """ Constant star-formation between some limits. """
 
+        age_min, age_max = self._constant_limits(param)
+
+        mask = (self.ages > age_min) & (self.ages < age_max)
+        sfr[mask] += 1.
+
+    def _constant_limits(self, param):
         if "age_min" in list(param):
             if param["age_max"] == "age_of_universe":
                 age_max = self.age_of_universe
@@ -221,11 +344,22 @@ class star_formation_history:
             age_max = self.age_of_universe - param["tstart"]*10**9
             age_min = self.age_of_universe - param["tstop"]*10**9
 
-        mask = (self.ages > age_min) & (self.ages < age_max)
-        sfr[mask] += 1.
+        return age_min, age_max
+
+    def _constant_mass_formed(self, ages, param):
+        age_min, age_max = self._constant_limits(param)
+
+        return np.clip(ages, age_min, age_max) - age_min
 
     def exponential(self, sfr, param):
 
+        age, tau = self._exponential_params(param)
+
+        t = age - self.ages[self.ages < age]
+
+        sfr[self.ages < age] = np.exp(-t/tau)
+
+    def _exponential_params(self, param):
         if "age" in list(param):
             age = param["age"]*10**9
 
@@ -238,9 +372,14 @@ class star_formation_history:
         elif "efolds" in list(param):
             tau = (param["age"]/param["efolds"])*10**9
 
-        t = age - self.ages[self.ages < age]
+        return age, tau
 
-        sfr[self.ages < age] = np.exp(-t/tau)
+    def _exponential_mass_formed(self, ages, param):
+        age, tau = self._exponential_params(param)
+
+        t = age - np.minimum(ages, age)
+
+        return tau*(np.exp(-t/tau) - np.exp(-age/tau))
 
     def delayed(self, sfr, param):
 
@@ -251,6 +390,14 @@ class star_formation_history:
 
         sfr[self.ages < age] = t*np.exp(-t/tau)
 
+    def _delayed_mass_formed(self, ages, param):
+        age = param["age"]*10**9
+        tau = param["tau"]*10**9
+
+        t = age - np.minimum(ages, age)
+
+        return tau*((t + tau)*np.exp(-t/tau) - (age + tau)*np.exp(-age/tau))
+
     def const_exp(self, sfr, param):
 
         age = param["age"]*10**9
@@ -261,8 +408,27 @@ class star_formation_history:
         sfr[self.ages < age] = np.exp(-t/tau)
         sfr[(self.ages > age) & (self.ages < self.age_of_universe)] = 1.
 
+    def _const_exp_mass_formed(self, ages, param):
+        age = param["age"]*10**9
+
+        const_ages = np.clip(ages, age, np.max([age, self.age_of_universe]))
+
+        return (self._exponential_mass_formed(ages, param)
+                + const_ages - age)
+
     def lognormal(self, sfr, param):
+        tau, t0 = self._lognormal_params(param)
+
+        mask = self.ages < self.age_of_universe
+        t = self.age_of_universe - self.ages[mask]
+
+        sfr[mask] = ((1./np.sqrt(2.*np.pi*tau**2))*(1./t)
+                     * np.exp(-(np.log(t) - t0)**2/(2*tau**2)))
+
+    def _lognormal_params(self, param):
         if "tmax" in list(param) and "fwhm" in list(param):
+            from scipy.optimize import fsolve
+
             tmax, fwhm = param["tmax"]*10**9, param["fwhm"]*10**9
 
             tau_guess = fwhm/(2*tmax*np.sqrt(2*np.log(2)))
@@ -275,11 +441,19 @@ class star_formation_history:
             raise(Exception("Bagpipes error caught by austind 28/11/23"))
             tau, t0 = par_dict["tau"], par_dict["t0"]
 
-        mask = self.ages < self.age_of_universe
-        t = self.age_of_universe - self.ages[mask]
+        return tau, t0
 
-        sfr[mask] = ((1./np.sqrt(2.*np.pi*tau**2))*(1./t)
-                     * np.exp(-(np.log(t) - t0)**2/(2*tau**2)))
+    def _lognormal_mass_formed(self, ages, param):
+        tau, t0 = self._lognormal_params(param)
+
+        t = self.age_of_universe - np.minimum(ages, self.age_of_universe)
+
+        with np.errstate(divide="ignore"):
+            cdf = 0.5*erf((np.log(t) - t0)/(np.sqrt(2)*tau))
+            cdf_now = 0.5*erf((np.log(self.age_of_universe) - t0)
+                              / (np.sqrt(2)*tau))
+
+        return cdf_now - cdf
 
     def dblplaw(self, sfr, param):
         alpha = param["alpha"]
@@ -365,4 +539,6 @@ class star_formation_history:
         sfr[self.ages > self.age_of_universe] = 0.
 
     def plot(self, show=True):
+        from .. import plotting
+
         return plotting.plot_sfh(self, show=show)
@@ -3,9 +3,8 @@ from __future__ import print_function, division, absolute_import
 import numpy as np
 import os
 
-from bagpipes import config
-
 from .. import utils
+from .grid_cache import cached_grid
 
 
 class stellar(object):
@@ -16,18 +15,35 @@ class stellar(object):
 
     wavelengths : np.ndarray
         1D array of wavelength values desired for the stellar models.
+
+    config : module - optional
+        The config to use, e.g. from bagpipes.config_utils.load_config.
+        Defaults to the currently active config.
     """
 
-    def __init__(self, wavelengths):
+    def __init__(self, wavelengths, config=None):
+        if config is None:
+            from bagpipes import config
+
+        self.config = config
+
         self.wavelengths = wavelengths
+        self.grid = cached_grid("stellar", wavelengths, self._make_grid,
+                                grid_files=[config.stellar_file],
+                                config=config)
+
+    def _make_grid(self):
+        """ Resamples the grid in wavelength and then in age. """
 
-        # Resample the grid in wavelength and then in age.
         grid_raw_ages = self._resample_in_wavelength()
-        self.grid = self._resample_in_age(grid_raw_ages)
+
+        return self._resample_in_age(grid_raw_ages)
 
     def _resample_in_wavelength(self):
         """ Resamples the raw stellar grids to the input wavs. """
 
+        config = self.config
+
         grid_raw_ages = np.zeros((self.wavelengths.shape[0],
                                   config.metallicities.shape[0],
                                   config.raw_stellar_ages.shape[0]))
@@ -49,6 +65,8 @@ class stellar(object):
         as summing the contributions from different ages in the correct
         ratios is very important for obtaining realistic results. """
 
+        config = self.config
+
         grid = np.zeros((self.wavelengths.shape[0],
                          config.metallicities.shape[0],
                          config.age_sampling.shape[0]))
@@ -120,9 +138,9 @@ class stellar(object):
             The age at which to split the spectrum in Gyr.
         """
 
+        config = self.config
+
         t_bc *= 10**9
-        spectrum_young = np.zeros_like(self.wavelengths)
-        spectrum = np.zeros_like(self.wavelengths)
 
         index = config.age_bins[config.age_bins < t_bc].shape[0]
         old_weight = (config.age_bins[index] - t_bc)/config.age_widths[index-1]
@@ -130,24 +148,77 @@ class stellar(object):
         if index == 0:
             index += 1
 
-        for i in range(config.metallicities.shape[0]):
-            if sfh_ceh[i, :index].sum() > 0.:
-                sfh_ceh[:, index-1] *= (1. - old_weight)
+        # Weights of each age bin in the young and old populations.
+        age_weights = np.zeros((2, config.age_sampling.shape[0]))
+        age_weights[0, :index] = 1.
+        age_weights[0, index-1] = 1. - old_weight
+        age_weights[1, index-1] = old_weight
+        age_weights[1, index:] = 1.
 
-                spectrum_young += np.sum(self.grid[:, i, :index]
-                                         * sfh_ceh[i, :index], axis=1)
+        spectra = np.zeros((2, self.wavelengths.shape[0]))
 
-                sfh_ceh[:, index-1] /= (1. - old_weight)
+        # Only collapse the range of metallicities with stars in them.
+        nonzero = np.flatnonzero(np.any(sfh_ceh, axis=1))
 
-            if sfh_ceh[i, index-1:].sum() > 0.:
-                sfh_ceh[:, index-1] *= old_weight
+        if nonzero.shape[0] > 0:
+            Z_slice = slice(nonzero[0], nonzero[-1] + 1)
+            weights = (np.expand_dims(age_weights, axis=1)
+                       * np.expand_dims(sfh_ceh[Z_slice], axis=0))
 
-                spectrum += np.sum(self.grid[:, i, index-1:]
-                                   * sfh_ceh[i, index-1:], axis=1)
+            spectra = np.tensordot(weights, self.grid[:, Z_slice, :],
+                                   axes=([1, 2], [1, 2]))
 
-                sfh_ceh[:, index-1] /= old_weight
+        spectrum_young, spectrum = spectra
 
         if t_bc == 0.:
             return spectrum
 
         return spectrum_young, spectrum
+
+    def spectrum_batch(self, sfh_cehs, t_bc=0.):
+        """ Obtain split 1D spectra for a stack of star-formation and
+        chemical enrichment histories at once. The collapse over the
+        SSP grid is done as a single matrix product over all models.
+
+        parameters
+        ----------
+
+        sfh_cehs : numpy.ndarray
+            3D array of shape (n_models, n_metallicities, n_ages).
+
+        t_bc : float or numpy.ndarray
+            The age(s) at which to split the spectra in Gyr.
+
+        returns
+        -------
+
+        spectrum_young, spectrum : numpy.ndarray
+            2D arrays of shape (n_models, n_wavelengths).
+        """
+
+        config = self.config
+
+        n_models = sfh_cehs.shape[0]
+        t_bc = np.zeros(n_models) + np.asarray(t_bc, dtype=float)*10**9
+
+        index = np.searchsorted(config.age_bins, t_bc)
+        old_weight = (config.age_bins[index] - t_bc)/config.age_widths[index-1]
+        index[index == 0] = 1
+
+        # Weights of each age bin in the young and old populations.
+        age_inds = np.arange(config.age_sampling.shape[0])
+        young_weights = (age_inds < np.expand_dims(index, axis=1)).astype(float)
+        old_weights = (age_inds >= np.expand_dims(index-1, axis=1)).astype(float)
+
+        young_weights[np.arange(n_models), index-1] = 1. - old_weight
+        old_weights[np.arange(n_models), index-1] = old_weight
+
+        grid = self.grid.reshape(self.grid.shape[0], -1)
+
+        young = sfh_cehs*np.expand_dims(young_weights, axis=1)
+        old = sfh_cehs*np.expand_dims(old_weights, axis=1)
+
+        spectrum_young = np.dot(young.reshape(n_models, -1), grid.T)
+        spectrum = np.dot(old.reshape(n_models, -1), grid.T)
+
+        return spectrum_young, spectrum
@@ -1,8 +1,8 @@
 from __future__ import print_function, division, absolute_import
 
 import os
+import tempfile
 import numpy as np
-from astropy.cosmology import FlatLambdaCDM
 
 
 def make_dirs(run="."):
@@ -66,16 +66,88 @@ def make_bins(midpoints, make_rhs=False):
     return bin_lhs, bin_widths
 
 
+class lazy_cosmology(object):
+    """ Stands in for an astropy FlatLambdaCDM cosmology, which is only
+    created, importing astropy.cosmology, when it is first used. """
+
+    def __init__(self, H0, Om0):
+        self.H0_value = H0
+        self.Om0_value = Om0
+        self._cosmo = None
+
+    def __getattr__(self, name):
+        if name == "_cosmo":
+            raise AttributeError(name)
+
+        if self._cosmo is None:
+            from astropy.cosmology import FlatLambdaCDM
+            self._cosmo = FlatLambdaCDM(H0=self.H0_value, Om0=self.Om0_value)
+
+        return getattr(self._cosmo, name)
+
+
+def _load_cosmology_tables():
+    """ Returns tables of redshift, the age of the Universe in Gyr and
+    the luminosity distance in Mpc, which are used for interpolation.
+    These are calculated on first use and saved in cache_dir. """
+
+    path = (cache_dir + "/cosmology_H0_" + str(cosmo.H0_value) + "_Om0_"
+            + str(cosmo.Om0_value) + ".npy")
+
+    if os.path.exists(path):
+        return np.load(path)
+
+    z = np.arange(0., 100., 0.01)
+    tables = np.array([z, cosmo.age(z).value,
+                       cosmo.luminosity_distance(z).value])
+
+    # Write to a temporary file which is then renamed, so other
+    # processes never see a partly written table.
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".npy")
+
+        with os.fdopen(tmp_file, "wb") as f:
+            np.save(f, tables)
+
+        # mkstemp creates files which only the owner can read.
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+
+    except OSError:
+        pass  # The cache directory is not writeable.
+
+    return tables
+
+
+def __getattr__(name):
+    """ Sets up z_array, age_at_z and ldist_at_z the first time one of
+    them is accessed. """
+
+    global z_array, age_at_z, ldist_at_z
+
+    if name in ["z_array", "age_at_z", "ldist_at_z"]:
+        z_array, age_at_z, ldist_at_z = _load_cosmology_tables()
+        return globals()[name]
+
+    raise AttributeError("module '" + __name__ + "' has no attribute '"
+                         + name + "'")
+
+
 # Set up necessary variables for cosmological calculations.
-cosmo = FlatLambdaCDM(H0=70., Om0=0.3)
-z_array = np.arange(0., 100., 0.01)
-age_at_z = cosmo.age(z_array).value
-ldist_at_z = cosmo.luminosity_distance(z_array).value
+cosmo = lazy_cosmology(H0=70., Om0=0.3)
 
 install_dir = os.path.dirname(os.path.realpath(__file__))
 grid_dir = install_dir + "/models/grids"
 working_dir = os.getcwd()
 
+# Directory in which resampled grids and tables are cached on disk. This
+# is per-user by default, as the install directory may be read-only.
+user_cache_dir = os.environ.get("XDG_CACHE_HOME",
+                                os.path.expanduser("~/.cache"))
+
+cache_dir = os.environ.get("PIPES_CACHE_DIR", user_cache_dir + "/bagpipes")
+
 # A dictionary to convert between inputted line names and the cloudy output keys
 lines_dict = {
     "Halpha": "H  1  6562.81A",
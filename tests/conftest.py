@@ -0,0 +1,43 @@
+from __future__ import print_function, division, absolute_import
+
+import os
+import numpy as np
+import pytest
+
+test_dir = os.path.dirname(os.path.realpath(__file__))
+filter_dir = os.path.join(test_dir, os.pardir, "examples", "filters")
+
+
+def grids_available():
+    """ Whether the model grid files used by the active config exist. """
+
+    from bagpipes import config, utils
+    from bagpipes.making.pack_grids import config_grid_files
+
+    grid_files = [f for f in config_grid_files(config)
+                  if f != "d_igm_grid_inoue14.fits"]
+
+    return all(os.path.exists(utils.grid_dir + "/" + f) for f in grid_files)
+
+
+@pytest.fixture(scope="session")
+def model_grids():
+    """ Skips tests which need the model grids if they are missing. """
+
+    if not grids_available():
+        pytest.skip("Bagpipes model grids are not installed.")
+
+
+@pytest.fixture(scope="session")
+def filt_list():
+    """ A short list of filter curves from the examples directory. """
+
+    names = ["VIMOS_U", "f435w", "f606w", "f775w", "f125w", "f160w",
+             "HAWKI_K", "IRAC1"]
+
+    return [os.path.join(filter_dir, name) for name in names]
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(1)
@@ -0,0 +1,109 @@
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+import bagpipes as pipes
+
+model_comps = {"redshift": 1.,
+               "exponential": {"age": 2., "tau": 0.5, "massformed": 10.,
+                               "metallicity": 1.},
+               "dust": {"type": "Calzetti", "Av": 0.5},
+               "nebular": {"logU": -3.}}
+
+fit_instructions = {"redshift": (0.5, 2.),
+                    "exponential": {"age": (0.1, 4.), "tau": (0.1, 2.),
+                                    "massformed": (9., 11.),
+                                    "metallicity": (0.2, 2.)},
+                    "dust": {"type": "Calzetti", "Av": (0., 2.)},
+                    "nebular": {"logU": (-4., -2.)}}
+
+spec_wavs = np.arange(6000., 9000., 5.)
+
+
+@pytest.fixture(scope="module")
+def galaxy(model_grids, filt_list):
+    """ A galaxy with photometry and a spectrum from a known model. """
+
+    model = pipes.model_galaxy(model_comps, filt_list=filt_list,
+                               spec_wavs=spec_wavs)
+
+    spectrum = np.c_[spec_wavs, model.spectrum[:, 1],
+                     0.05*model.spectrum[:, 1]]
+
+    photometry = np.c_[model.photometry, 0.05*model.photometry]
+
+    def load_data(ID):
+        return spectrum, photometry
+
+    return pipes.galaxy("1", load_data, filt_list=filt_list,
+                        phot_units="ergscma")
+
+
+def draw_params(fitted_model, rng, n):
+    cubes = rng.random((n, fitted_model.ndim))
+    return fitted_model.prior.transform_batch(cubes)
+
+
+def test_update_batch_matches_update(model_grids, filt_list, rng):
+    model = pipes.model_galaxy(model_comps, filt_list=filt_list,
+                               spec_wavs=spec_wavs)
+
+    comps_list = []
+    for i in range(5):
+        comps = {"redshift": model_comps["redshift"] + 0.1*rng.random(),
+                 "exponential": dict(model_comps["exponential"],
+                                     age=rng.uniform(0.5, 3.)),
+                 "dust": dict(model_comps["dust"], Av=rng.uniform(0., 2.)),
+                 "nebular": {"logU": rng.uniform(-4., -2.)}}
+
+        comps_list.append(comps)
+
+    model.update_batch(comps_list)
+
+    for i in range(len(comps_list)):
+        model.update(comps_list[i])
+
+        np.testing.assert_allclose(model.photometry_batch[i],
+                                   model.photometry, rtol=1e-10)
+
+        np.testing.assert_allclose(model.spectrum_batch[i],
+                                   model.spectrum[:, 1], rtol=1e-10)
+
+        np.testing.assert_allclose(model.spectrum_full_batch[i],
+                                   model.spectrum_full, rtol=1e-10)
+
+
+def test_lnlike_batch_matches_lnlike(galaxy, rng):
+    fitted_model = pipes.fitting.fitted_model(galaxy, fit_instructions)
+    x = draw_params(fitted_model, rng, 10)
+
+    # Evaluate one model first so both methods share the same caches.
+    fitted_model.lnlike(x[0].copy())
+
+    lnlike = np.array([fitted_model.lnlike(x[i].copy())
+                       for i in range(x.shape[0])])
+
+    lnlike_batch = fitted_model.lnlike_batch(x.copy())
+
+    np.testing.assert_allclose(lnlike_batch, lnlike, rtol=1e-10)
+
+
+def test_lnlike_batch_rejects_unphysical_models(galaxy):
+    fitted_model = pipes.fitting.fitted_model(galaxy, fit_instructions)
+
+    params = {"redshift": 0.5, "exponential:age": 2.,
+              "exponential:tau": 0.5, "exponential:massformed": 10.,
+              "exponential:metallicity": 1., "dust:Av": 0.5,
+              "nebular:logU": -3.}
+
+    x = np.array([[params[name] for name in fitted_model.params]]*2)
+
+    # The second model is older than the Universe at its redshift.
+    x[1, fitted_model.params.index("exponential:age")] = 3.9
+    x[1, fitted_model.params.index("redshift")] = 2.
+
+    lnlike = fitted_model.lnlike_batch(x)
+
+    assert lnlike[0] > -9.99*10**99
+    assert lnlike[1] == -9.99*10**99
@@ -0,0 +1,88 @@
+from __future__ import print_function, division, absolute_import
+
+import types
+import numpy as np
+import pytest
+
+from bagpipes.models import grid_cache
+from bagpipes.models.dust_emission_model import dust_emission
+
+qpah_vals = np.array([0.47, 1.12, 1.77, 2.5])
+umin_vals = np.array([0.1, 0.5, 1., 2., 5.])
+
+raw_wavs = np.geomspace(10**3, 10**7, 300)
+wavelengths = np.geomspace(500., 2*10**7, 800)
+
+
+@pytest.fixture
+def fake_config(rng, monkeypatch):
+    """ A config holding random dust grids laid out like the DL07 files,
+    which start with an empty PrimaryHDU, so HDU 0 has no data. """
+
+    monkeypatch.setattr(grid_cache, "use_disk_cache", False)
+    grid_cache.clear_cache()
+
+    config = types.ModuleType("fake_dust_config")
+    config.qpah_vals = qpah_vals
+    config.umin_vals = umin_vals
+    config.dust_umin_only_file = "dl07_grids_umin_only.fits"
+    config.dust_umin_umax_file = "dl07_grids_umin_umax.fits"
+
+    for name in ["dust_grid_umin_only", "dust_grid_umin_umax"]:
+        grids = [None]
+        for i in range(qpah_vals.shape[0]):
+            grids.append(np.c_[raw_wavs, rng.random((raw_wavs.shape[0],
+                                                     umin_vals.shape[0]))])
+
+        setattr(config, name, grids)
+
+    yield config
+
+    grid_cache.clear_cache()
+
+
+def reference_spectrum(config, qpah, umin, gamma):
+    """ Interpolates the raw grids in qpah and umin, then resamples the
+    model onto the wavelengths, as before the grids were pre-resampled. """
+
+    qpah_ind = config.qpah_vals[config.qpah_vals < qpah].shape[0]
+    umin_ind = config.umin_vals[config.umin_vals < umin].shape[0]
+
+    qpah_fact = ((qpah - config.qpah_vals[qpah_ind-1])
+                 / (config.qpah_vals[qpah_ind] - config.qpah_vals[qpah_ind-1]))
+
+    umin_fact = ((umin - config.umin_vals[umin_ind-1])
+                 / (config.umin_vals[umin_ind] - config.umin_vals[umin_ind-1]))
+
+    umin_w = np.array([(1 - umin_fact), umin_fact])
+
+    models = []
+    for raw_grids in [config.dust_grid_umin_only, config.dust_grid_umin_umax]:
+        tqpah = (qpah_fact*raw_grids[qpah_ind+1][:, umin_ind:umin_ind+2]
+                 + (1-qpah_fact)*raw_grids[qpah_ind][:, umin_ind:umin_ind+2])
+
+        models.append(np.sum(umin_w*tqpah, axis=1))
+
+    model = gamma*models[1] + (1 - gamma)*models[0]
+
+    return np.interp(wavelengths, config.dust_grid_umin_only[1][:, 0], model,
+                     left=0., right=0.)
+
+
+@pytest.mark.parametrize("qpah, umin, gamma", [(0.5, 0.2, 0.01),
+                                               (1.5, 1., 0.5),
+                                               (2.49, 4.9, 0.99)])
+def test_spectrum_matches_reference(fake_config, qpah, umin, gamma):
+    dust = dust_emission(wavelengths, config=fake_config)
+
+    spectrum = dust.spectrum(qpah, umin, gamma)
+    reference = reference_spectrum(fake_config, qpah, umin, gamma)
+
+    assert np.allclose(spectrum, reference, rtol=1e-12, atol=0.)
+
+
+def test_empty_primary_hdu(fake_config):
+    dust = dust_emission(wavelengths, config=fake_config)
+
+    assert not np.any(dust.grid_umin_only[0])
+    assert not np.any(dust.grid_umin_umax[0])
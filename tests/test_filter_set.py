@@ -0,0 +1,57 @@
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from bagpipes.filters import filter_set
+
+wavs = np.cumprod(np.r_[100., np.full(20000, 1.+1./1000.)])
+
+
+@pytest.fixture(scope="module")
+def spectrum():
+    return np.exp(np.sin(20.*np.log(wavs)))
+
+
+def reference_photometry(filt_list, spectrum, redshift):
+    """ Integrates the spectrum over each redshifted filter curve. """
+
+    filters = filter_set(filt_list)
+    filters.resample_filter_curves(wavs)
+
+    matrix = filters._calculate_filter_matrix(redshift)
+
+    return matrix.dot(spectrum)
+
+
+def test_exact_at_exact_redshift(filt_list, spectrum):
+    redshift = 1.23456789
+
+    filters = filter_set(filt_list)
+    filters.resample_filter_curves(wavs, exact_redshift=redshift)
+
+    filters.get_photometry(spectrum, 1.)
+    photometry = filters.get_photometry(spectrum, redshift)
+
+    reference = reference_photometry(filt_list, spectrum, redshift)
+
+    assert np.allclose(photometry, reference, rtol=1e-12, atol=0.)
+
+
+def test_independent_of_call_history(filt_list, spectrum):
+    redshifts = [2.3456789, 0.5, 2.34568, 1.]
+
+    filters = filter_set(filt_list)
+    filters.resample_filter_curves(wavs)
+
+    reference = filter_set(filt_list)
+    reference.resample_filter_curves(wavs)
+
+    photometry = [filters.get_photometry(spectrum, z) for z in redshifts]
+    reverse = [reference.get_photometry(spectrum, z) for z in redshifts[::-1]]
+
+    for i in range(len(redshifts)):
+        assert np.array_equal(photometry[i], reverse[::-1][i])
+
+        exact = reference_photometry(filt_list, spectrum, redshifts[i])
+        assert np.allclose(photometry[i], exact, rtol=1e-5, atol=0.)
@@ -0,0 +1,128 @@
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from copy import deepcopy
+
+import bagpipes as pipes
+
+from bagpipes.fitting.prior import dirichlet
+
+# The nebular metallicity mirrors burst:metallicity, which itself
+# mirrors dblplaw:metallicity.
+mirror_instructions = {"redshift": (0.5, 3.),
+                       "dblplaw": {"alpha": (0.1, 100.), "beta": (0.1, 100.),
+                                   "tau": (0.3, 5.), "massformed": (8., 11.),
+                                   "metallicity": (0.1, 2.5)},
+                       "burst": {"age": (0.01, 0.5), "massformed": (6., 10.),
+                                 "metallicity": "dblplaw:metallicity"},
+                       "dust": {"type": "Calzetti", "Av": (0., 2.),
+                                "eta": 2.},
+                       "nebular": {"logU": (-4., -1.),
+                                   "metallicity": "burst:metallicity"}}
+
+dirichlet_instructions = {"redshift": 1.,
+                          "dirichlet": {"massformed": (8., 11.),
+                                        "metallicity": 0.7, "bins": 6,
+                                        "bins_prior": "dirichlet",
+                                        "alpha": 2.},
+                          "dust": {"type": "Calzetti", "Av": (0., 2.)},
+                          "nebular": {"logU": -3.,
+                                      "metallicity": "dirichlet:metallicity"}}
+
+
+@pytest.fixture(scope="module")
+def galaxy(model_grids, filt_list):
+    def load_data(ID):
+        return np.c_[np.linspace(1., 3., len(filt_list)),
+                     0.1*np.ones(len(filt_list))]
+
+    return pipes.galaxy("1", load_data, filt_list=filt_list,
+                        spectrum_exists=False)
+
+
+def reference_update(fitted_model, param):
+    """ Sets model_components from the parameter names on every call. """
+
+    model_comp = fitted_model.model_components
+    dirichlet_r = {}
+
+    for i in range(len(fitted_model.params)):
+        split = fitted_model.params[i].split(":")
+
+        if len(split) == 1:
+            model_comp[split[0]] = param[i]
+
+        elif "dirichlet" in split[1]:
+            dirichlet_r.setdefault(split[0], []).append(param[i])
+
+        else:
+            model_comp[split[0]][split[1]] = param[i]
+
+    # Follow chains of mirror params back to a fitted or fixed value.
+    for key in list(fitted_model.mirror_pars):
+        source = fitted_model.mirror_pars[key]
+        while source in list(fitted_model.mirror_pars):
+            source = fitted_model.mirror_pars[source]
+
+        source_comp, source_key = source.split(":")
+        comp, key = key.split(":")
+
+        model_comp[comp][key] = model_comp[source_comp][source_key]
+
+    for comp in list(dirichlet_r):
+        model_comp[comp]["r"] = np.array(dirichlet_r[comp])
+        model_comp[comp]["tx"] = dirichlet(model_comp[comp]["r"],
+                                           model_comp[comp]["alpha"])
+
+
+@pytest.mark.parametrize("fit_instructions", [mirror_instructions,
+                                              dirichlet_instructions])
+def test_update_matches_reference(galaxy, fit_instructions):
+    fitted_model = pipes.fitting.fitted_model(galaxy, fit_instructions)
+    reference = pipes.fitting.fitted_model(galaxy, fit_instructions)
+
+    np.random.seed(3)
+    for param in fitted_model.prior.sample_batch(20):
+        fitted_model._update_model_components(param)
+        reference_update(reference, param)
+
+        assert (repr(fitted_model.model_components)
+                == repr(reference.model_components))
+
+
+def test_mirror_chain(galaxy):
+    fitted_model = pipes.fitting.fitted_model(galaxy, mirror_instructions)
+
+    param = fitted_model.prior.sample()
+    fitted_model._update_model_components(param)
+
+    model_comp = fitted_model.model_components
+    metallicity = param[fitted_model.params.index("dblplaw:metallicity")]
+
+    assert model_comp["burst"]["metallicity"] == metallicity
+    assert model_comp["nebular"]["metallicity"] == metallicity
+
+
+def test_rebinds_when_components_replaced(galaxy):
+    fitted_model = pipes.fitting.fitted_model(galaxy, mirror_instructions)
+
+    np.random.seed(4)
+    params = fitted_model.prior.sample_batch(2)
+
+    fitted_model._update_model_components(params[0])
+    old_components = fitted_model.model_components
+
+    fitted_model.model_components = deepcopy(old_components)
+    fitted_model._update_model_components(params[1])
+
+    z_ind = fitted_model.params.index("redshift")
+    metallicity_ind = fitted_model.params.index("dblplaw:metallicity")
+
+    model_comp = fitted_model.model_components
+    assert model_comp["redshift"] == params[1][z_ind]
+    assert model_comp["nebular"]["metallicity"] == params[1][metallicity_ind]
+
+    # The previous components are no longer written to.
+    assert old_components["redshift"] == params[0][z_ind]
@@ -0,0 +1,93 @@
+from __future__ import print_function, division, absolute_import
+
+import os
+import numpy as np
+import pytest
+
+from bagpipes.models import grid_cache
+from bagpipes.models.stellar_model import stellar
+
+wavelengths = np.geomspace(100., 10**5, 500)
+
+
+@pytest.fixture
+def disk_cache(tmp_path, monkeypatch):
+    """ Uses an empty in-memory cache and a temporary disk cache. """
+
+    monkeypatch.setattr(grid_cache, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(grid_cache, "use_disk_cache", True)
+    grid_cache.clear_cache()
+
+    yield str(tmp_path)
+
+    grid_cache.clear_cache()
+
+
+class counter(object):
+    """ Makes a grid and counts how many times it was made. """
+
+    def __init__(self, value):
+        self.value = value
+        self.n_calls = 0
+
+    def __call__(self):
+        self.n_calls += 1
+        return self.value
+
+
+def test_memory_cache_is_shared_and_read_only(disk_cache, rng):
+    make_grid = counter(rng.random((4, 500)))
+
+    grid = grid_cache.cached_grid("test", wavelengths, make_grid)
+    grid_2 = grid_cache.cached_grid("test", wavelengths, make_grid)
+
+    assert grid is grid_2
+    assert make_grid.n_calls == 1
+
+    with pytest.raises(ValueError):
+        grid[0, 0] = 1.
+
+
+def test_disk_cache_round_trip(disk_cache, rng):
+    value = (rng.random((4, 500)), rng.random(500))
+    make_grid = counter(value)
+
+    grid_cache.cached_grid("test", wavelengths, make_grid, 1,
+                           grid_files=["cloudy_linewavs.txt"])
+
+    # A new process would only find the grid on disk.
+    grid_cache.clear_cache()
+    loaded = grid_cache.cached_grid("test", wavelengths, make_grid, 1,
+                                    grid_files=["cloudy_linewavs.txt"])
+
+    assert make_grid.n_calls == 1
+    assert isinstance(loaded[0], np.memmap)
+
+    for i in range(len(value)):
+        np.testing.assert_array_equal(loaded[i], value[i])
+
+    # Grids with different arguments are stored separately.
+    grid_cache.cached_grid("test", wavelengths, make_grid, 2,
+                           grid_files=["cloudy_linewavs.txt"])
+
+    assert make_grid.n_calls == 2
+
+
+def test_disk_cache_is_readable_by_others(disk_cache, rng):
+    grid_cache.cached_grid("test", wavelengths, counter(rng.random(500)),
+                           grid_files=["cloudy_linewavs.txt"])
+
+    for root, dirs, files in os.walk(disk_cache):
+        for name in dirs + files:
+            mode = os.stat(os.path.join(root, name)).st_mode
+            assert mode & 0o044 == 0o044
+
+
+def test_stellar_grid_from_disk_matches_resampling(model_grids, disk_cache):
+    resampled = np.array(stellar(wavelengths).grid)
+
+    grid_cache.clear_cache()
+    loaded = stellar(wavelengths).grid
+
+    assert isinstance(loaded, np.memmap)
+    np.testing.assert_array_equal(loaded, resampled)
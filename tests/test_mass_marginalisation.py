@@ -0,0 +1,188 @@
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from copy import deepcopy
+from scipy.special import erf, logsumexp
+
+import bagpipes as pipes
+
+model_comps = {"redshift": 1.2,
+               "exponential": {"age": 2., "tau": 0.7, "massformed": 10.3,
+                               "metallicity": 1.},
+               "dust": {"type": "Calzetti", "Av": 0.6},
+               "nebular": {"logU": -3.}}
+
+fit_instructions = {"redshift": (0.5, 2.),
+                    "exponential": {"age": (0.1, 3.), "tau": (0.1, 2.),
+                                    "massformed": (8., 12.),
+                                    "metallicity": (0.1, 2.5)},
+                    "dust": {"type": "Calzetti", "Av": (0., 2.)},
+                    "nebular": {"logU": -3.}}
+
+spec_wavs = np.arange(5200., 9000., 5.)
+
+
+@pytest.fixture(scope="module")
+def galaxy(model_grids, filt_list):
+    """ A galaxy with photometry and a spectrum from a known model. """
+
+    model = pipes.model_galaxy(model_comps, filt_list=filt_list,
+                               spec_wavs=spec_wavs)
+
+    photometry = np.c_[model.photometry, 0.1*model.photometry]
+    spectrum = np.c_[spec_wavs, model.spectrum[:, 1],
+                     0.05*model.spectrum[:, 1]]
+
+    def load_data(ID):
+        return spectrum, photometry
+
+    return pipes.galaxy("1", load_data, filt_list=filt_list,
+                        phot_units="ergscma")
+
+
+@pytest.fixture(scope="module")
+def fitted_model(galaxy):
+    return pipes.fitting.fitted_model(galaxy, fit_instructions,
+                                      marginalise_mass=True)
+
+
+def brute_force(fitted_model, c0, c1, c2, ln_prior, n=400001):
+    """ Integrates the likelihood over massformed on a fine grid with
+    the trapezium rule. """
+
+    mass = np.linspace(*fitted_model.mass_limits, n)
+    a = 10**(mass - fitted_model.mass_ref)
+
+    ln_integrand = c0 + c1*a + c2*a**2 + ln_prior(mass)
+
+    weights = np.full(n, mass[1] - mass[0])
+    weights[[0, -1]] /= 2.
+
+    return logsumexp(ln_integrand, b=weights)
+
+
+def uniform_prior(mass):
+    return np.full(mass.shape, -np.log(4.))
+
+
+# Likelihoods peaked inside the prior at several widths, and peaked
+# beyond each prior limit.
+coefs = [(-10., 2., -1.), (-10., 200., -100.), (5., 2.e4, -1.e4),
+         (-10., 0.2, -1.), (0., -1., -0.5), (0., 1000., -5.)]
+
+
+@pytest.mark.parametrize("c0, c1, c2", coefs)
+def test_marginalise_matches_brute_force(fitted_model, c0, c1, c2):
+    lnlike = fitted_model._marginalise_lnlike(c0, c1, c2)[0]
+    reference = brute_force(fitted_model, c0, c1, c2, uniform_prior)
+
+    assert np.isclose(lnlike, reference, rtol=0., atol=1e-5)
+
+
+def test_marginalise_gaussian_mass_prior(galaxy):
+    instructions = deepcopy(fit_instructions)
+    instructions["exponential"]["massformed_prior"] = "Gaussian"
+    instructions["exponential"]["massformed_prior_mu"] = 10.5
+    instructions["exponential"]["massformed_prior_sigma"] = 0.5
+
+    fitted_model = pipes.fitting.fitted_model(galaxy, instructions,
+                                              marginalise_mass=True)
+
+    def gaussian_prior(mass):
+        norm = (erf((12. - 10.5)/np.sqrt(2)/0.5)
+                - erf((8. - 10.5)/np.sqrt(2)/0.5))/2.
+
+        return (-0.5*((mass - 10.5)/0.5)**2 - np.log(np.sqrt(2*np.pi)*0.5)
+                - np.log(norm))
+
+    for c0, c1, c2 in coefs:
+        lnlike = fitted_model._marginalise_lnlike(c0, c1, c2)[0]
+        reference = brute_force(fitted_model, c0, c1, c2, gaussian_prior)
+
+        assert np.isclose(lnlike, reference, rtol=0., atol=1e-5)
+
+
+def test_marginalise_rejects_unbounded(fitted_model):
+    lnlike = fitted_model._marginalise_lnlike([0., 0., 0.], [1., 1., np.nan],
+                                              [-1., 0., -1.])
+
+    assert lnlike[0] > -9.99*10**99
+    assert np.all(lnlike[1:] == -9.99*10**99)
+
+
+def test_lnlike_quadratic_in_mass_scale(fitted_model, rng):
+    x = fitted_model.prior.transform(rng.random(fitted_model.prior.ndim))
+    param = fitted_model._insert_reference_mass(x)[0]
+
+    fitted_model._update_model_galaxy(param)
+    c0, c1, c2 = fitted_model._get_lnlike_coefs(fitted_model._lnlike_data)
+
+    for mass in [9., 10.5, 11.7]:
+        param[fitted_model.mass_index] = mass
+        a = 10**(mass - fitted_model.mass_ref)
+
+        assert np.isclose(fitted_model.lnlike(param), c0 + c1*a + c2*a**2,
+                          rtol=1e-8)
+
+
+def test_batch_matches_single(fitted_model, rng):
+    x = fitted_model.prior.transform_batch(
+        rng.random((5, fitted_model.prior.ndim)))
+
+    single = [fitted_model.lnlike_marginalised(np.copy(x_i)) for x_i in x]
+    batch = fitted_model.lnlike_marginalised_batch(x)
+
+    assert np.allclose(batch, single, rtol=1e-6)
+
+
+def test_draw_massformed(fitted_model, rng):
+    x = fitted_model.prior.transform(rng.random(fitted_model.prior.ndim))
+    param = fitted_model._insert_reference_mass(x)[0]
+
+    fitted_model._update_model_galaxy(param)
+    c0, c1, c2 = fitted_model._get_lnlike_coefs(fitted_model._lnlike_data)
+
+    mass = np.linspace(*fitted_model.mass_limits, 400001)
+    a = 10**(mass - fitted_model.mass_ref)
+    post = np.exp(c1*a + c2*a**2 - np.max(c1*a + c2*a**2))
+
+    mean = np.sum(post*mass)/np.sum(post)
+    std = np.sqrt(np.sum(post*(mass - mean)**2)/np.sum(post))
+
+    np.random.seed(5)
+    samples = fitted_model.draw_massformed(np.repeat(x[np.newaxis], 2000,
+                                                     axis=0))
+
+    draws = samples[:, fitted_model.mass_index]
+
+    assert np.array_equal(samples[:, fitted_model.sampled_indices],
+                          np.repeat(x[np.newaxis], 2000, axis=0))
+    assert np.abs(np.mean(draws) - mean) < 4*std/np.sqrt(2000)
+    assert np.isclose(np.std(draws), std, rtol=0.1)
+
+
+@pytest.mark.parametrize("change", ["fixed_mass", "two_components", "agn",
+                                    "max_like_calib"])
+def test_invalid_setups(galaxy, change):
+    instructions = deepcopy(fit_instructions)
+
+    if change == "fixed_mass":
+        instructions["exponential"]["massformed"] = 10.
+
+    elif change == "two_components":
+        instructions["burst"] = {"age": (0.01, 0.5), "massformed": (6., 10.),
+                                 "metallicity": 1.}
+
+    elif change == "agn":
+        instructions["agn"] = {"alphalam": -1., "betalam": 0.5,
+                               "hanorm": 1e-18, "sigma": 2000.,
+                               "f5100A": 1e-19}
+
+    elif change == "max_like_calib":
+        instructions["calib"] = {"type": "polynomial_max_like", "order": 2}
+
+    with pytest.raises(ValueError):
+        pipes.fitting.fitted_model(galaxy, instructions,
+                                   marginalise_mass=True)
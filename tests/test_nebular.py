@@ -0,0 +1,40 @@
+from __future__ import print_function, division, absolute_import
+
+import types
+import numpy as np
+import pytest
+
+from bagpipes.models.nebular_model import nebular
+
+
+@pytest.fixture
+def bare_nebular():
+    """ A nebular model with only the logU grid points set. """
+
+    config = types.ModuleType("fake_nebular_config")
+    config.logU = np.arange(-4., -1.99, 0.5)
+
+    model = nebular.__new__(nebular)
+    model.config = config
+
+    return model
+
+
+def test_logU_index(bare_nebular):
+    logU = bare_nebular.config.logU
+
+    for value in [-4., -3.7, -3., -2.2, -2.]:
+        ind, weight = bare_nebular._logU_index(value)
+
+        assert 1 <= ind < logU.shape[0]
+        assert 0. <= weight <= 1.
+        assert np.isclose(weight*logU[ind-1] + (1 - weight)*logU[ind], value)
+
+    ind, weight = bare_nebular._logU_index(np.array([-4., -3.7, -2.]))
+    assert np.array_equal(ind, [1, 1, logU.shape[0] - 1])
+
+
+@pytest.mark.parametrize("logU", [-4.01, -1.5, np.array([-3., -1.99])])
+def test_logU_outside_grid(bare_nebular, logU):
+    with pytest.raises(ValueError):
+        bare_nebular._logU_index(logU)
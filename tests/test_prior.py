@@ -0,0 +1,161 @@
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from scipy.stats import beta
+
+from bagpipes.fitting.prior import prior, dirichlet
+
+priors = [("uniform", (0.5, 2.), {}),
+          ("log_10", (0.01, 10.), {}),
+          ("exponential", (0., 10.), {"scale": 0.7}),
+          ("log_e", (0.1, 5.), {}),
+          ("pow_10", (-1., 1.), {}),
+          ("recip", (0.5, 4.), {}),
+          ("recipsq", (0.5, 4.), {}),
+          ("Gaussian", (-1., 3.), {"mu": 0.5, "sigma": 0.8}),
+          ("student_t", (-0.5, 0.5), {}),
+          ("student_t", (0., 3.), {"df": 3., "loc": 1., "scale": 0.5})]
+
+
+class extended_prior(prior):
+    """ Adds a prior type with no vectorised version. """
+
+    def half(self, value, limits, hyper_params):
+        return limits[0] + (limits[1] - limits[0])*value**0.5
+
+
+def make_prior(prior_class=prior):
+    pdfs = [p[0] for p in priors]
+    limits = [p[1] for p in priors]
+    hyper_params = [p[2] for p in priors]
+
+    # Interleave two of each type so parameters are grouped out of order.
+    return prior_class(limits + limits[::-1], pdfs + pdfs[::-1],
+                       hyper_params + hyper_params[::-1])
+
+
+def reference_transform(p, cube):
+    """ Calls the prior function for each parameter in turn. """
+
+    values = np.copy(cube)
+    for i in range(p.ndim):
+        prior_function = getattr(p, p.pdfs[i])
+        values[i] = prior_function(cube[i], p.limits[i], p.hyper_params[i])
+
+    return values
+
+
+def test_transform_matches_prior_functions(rng):
+    p = make_prior()
+    cubes = rng.random((50, p.ndim))
+
+    reference = np.array([reference_transform(p, c) for c in cubes])
+
+    batch = p.transform_batch(cubes)
+    single = np.array([p.transform(np.copy(c)) for c in cubes])
+
+    assert np.allclose(batch, reference, rtol=1e-12, atol=1e-14)
+    assert np.allclose(single, reference, rtol=1e-12, atol=1e-14)
+
+
+def test_transform_in_place(rng):
+    p = make_prior()
+    cube = rng.random(p.ndim)
+    original = np.copy(cube)
+
+    values = p.transform(cube)
+
+    assert values is cube
+    assert np.allclose(cube, reference_transform(p, original),
+                       rtol=1e-12, atol=1e-14)
+
+
+def test_transform_batch_copies(rng):
+    p = make_prior()
+    cubes = rng.random((5, p.ndim))
+    original = np.copy(cubes)
+
+    p.transform_batch(cubes)
+
+    assert np.array_equal(cubes, original)
+
+
+def test_transform_batch_single_point(rng):
+    p = make_prior()
+    cube = rng.random(p.ndim)
+
+    values = p.transform_batch(cube)
+
+    assert values.shape == (1, p.ndim)
+    assert np.allclose(values[0], reference_transform(p, cube),
+                       rtol=1e-12, atol=1e-14)
+
+
+def test_fallback_prior_type(rng):
+    p = extended_prior([(1., 3.), (0., 1.), (2., 4.)],
+                       ["half", "uniform", "half"], [{}, {}, {}])
+
+    cubes = rng.random((20, 3))
+    reference = np.array([reference_transform(p, c) for c in cubes])
+
+    assert np.allclose(p.transform_batch(cubes), reference, rtol=1e-14)
+    assert np.allclose([p.transform(np.copy(c)) for c in cubes], reference,
+                       rtol=1e-14)
+
+
+def test_sample_within_limits():
+    p = make_prior()
+
+    np.random.seed(2)
+    samples = p.sample_batch(1000)
+
+    assert samples.shape == (1000, p.ndim)
+
+    for i in range(p.ndim):
+        if p.pdfs[i] == "exponential":
+            continue
+
+        assert np.all(samples[:, i] >= p.limits[i][0])
+        assert np.all(samples[:, i] <= p.limits[i][1])
+
+
+def loop_dirichlet(r, alpha):
+    """ Dirichlet sampling one variable at a time, as it was before the
+    stick-breaking was vectorised. """
+
+    n = r.shape[0]+1
+    x = np.zeros(n)
+    z = np.zeros(n-1)
+    alpha_tilda = np.zeros(n-1)
+
+    if isinstance(alpha, (float, int)):
+        alpha = np.repeat(alpha, n)
+
+    for i in range(n-1):
+        alpha_tilda[i] = np.sum(alpha[i+1:])
+
+        z[i] = beta.ppf(r[i], alpha_tilda[i], alpha[i])
+
+    for i in range(n-1):
+        x[i] = np.prod(z[:i])*(1-z[i])
+
+    x[-1] = np.prod(z)
+
+    return np.cumsum(x)
+
+
+@pytest.mark.parametrize("alpha", [1., 5, np.array([0.5, 1., 2., 4., 8.])])
+def test_dirichlet_matches_loop(rng, alpha):
+    r = rng.random((100, 4))
+
+    reference = np.array([loop_dirichlet(r_i, alpha) for r_i in r])
+
+    single = np.array([dirichlet(r_i, alpha) for r_i in r])
+    batch = dirichlet(r, alpha)
+
+    assert batch.shape == (100, 5)
+    assert np.allclose(single, reference, rtol=1e-10, atol=1e-14)
+    assert np.allclose(batch, reference, rtol=1e-10, atol=1e-14)
+    assert np.allclose(batch[:, -1], 1.)
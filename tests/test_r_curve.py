@@ -0,0 +1,152 @@
+from __future__ import print_function, division, absolute_import
+
+import os
+import numpy as np
+import pytest
+import spectres
+
+from astropy.io import fits
+
+import bagpipes as pipes
+
+example_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                           os.pardir, "examples")
+
+oversample = 4
+
+# Rest frame sampling at R = 1000, as for R_spec.
+wavs = np.cumprod(np.r_[1., np.full(40000, 1.+0.5/1000.)])
+
+
+@pytest.fixture(scope="module")
+def prism():
+    """ The NIRSpec prism resolution curve and output wavelengths. """
+
+    disp_path = os.path.join(example_dir, "jwst_nirspec_prism_disp.fits")
+    wavs_path = os.path.join(example_dir,
+                             "nirspec_prism_pipeline_output_wavs.txt")
+
+    hdul = fits.open(disp_path)
+    R_curve = np.c_[10000*hdul[1].data["WAVELENGTH"], hdul[1].data["R"]]
+
+    return R_curve, np.loadtxt(wavs_path)
+
+
+@pytest.fixture(scope="module")
+def spectrum():
+    """ A power law continuum with two narrow emission lines. """
+
+    flux = wavs**-1.5*(1. + 5.*np.exp(-0.5*((wavs - 5007.)/1.)**2)
+                       + 3.*np.exp(-0.5*((wavs - 6563.)/1.)**2))
+
+    return flux/np.max(flux)
+
+
+def bare_model(spec_wavs, exact_redshift=None):
+    """ A model_galaxy with only the attributes R_curve broadening needs. """
+
+    model = pipes.model_galaxy.__new__(pipes.model_galaxy)
+    model.spec_wavs = spec_wavs
+    model.wavelengths = wavs
+    model.exact_redshift = exact_redshift
+    model.R_curve_key = None
+
+    return model
+
+
+def euler_sampling(R_curve, spec_wavs):
+    """ The R_curve sampling built by stepping one pixel at a time, as it
+    was before the cumulative number of points was inverted. """
+
+    x = [0.95*spec_wavs[0]]
+
+    while x[-1] < 1.05*spec_wavs[-1]:
+        R_val = np.interp(x[-1], R_curve[:, 0], R_curve[:, 1])
+        x.append(x[-1] + x[-1]/R_val/oversample)
+
+    return np.array(x)
+
+
+def explicit_broadening(new_wavs, spec_wavs, flux, redshift):
+    """ Resample onto new_wavs, convolve, then resample onto spec_wavs. """
+
+    flux = spectres.spectres(new_wavs, (1.+redshift)*wavs, flux, fill=0)
+
+    sigma_pix = oversample/2.35
+    k_size = 4*int(sigma_pix+1)
+    x_kernel_pix = np.arange(-k_size, k_size+1)
+
+    kernel = np.exp(-(x_kernel_pix**2)/(2*sigma_pix**2))
+    kernel /= np.trapz(kernel)
+
+    flux = np.convolve(flux, kernel, mode="valid")
+
+    return spectres.spectres(spec_wavs, new_wavs[k_size:-k_size], flux,
+                             fill=0)
+
+
+def test_sampling_points_per_fwhm(prism):
+    R_curve, spec_wavs = prism
+    new_wavs = bare_model(spec_wavs)._get_R_curve_wav_sampling(R_curve)
+
+    assert np.isclose(new_wavs[0], 0.95*spec_wavs[0], rtol=1e-12)
+    assert new_wavs[-2] < 1.05*spec_wavs[-1] <= new_wavs[-1]
+
+    mid_wavs = np.sqrt(new_wavs[1:]*new_wavs[:-1])
+    R_vals = np.interp(mid_wavs, R_curve[:, 0], R_curve[:, 1])
+
+    assert np.allclose(np.diff(np.log(new_wavs)),
+                       np.log(1. + 1./R_vals/oversample), rtol=1e-2)
+
+
+def test_sampling_shift_from_euler(prism):
+    R_curve, spec_wavs = prism
+    new_wavs = bare_model(spec_wavs)._get_R_curve_wav_sampling(R_curve)
+    old_wavs = euler_sampling(R_curve, spec_wavs)
+
+    assert np.abs(new_wavs.shape[0] - old_wavs.shape[0]) <= 1
+
+    # The Euler steps drift as R changes, by up to ~0.75 pixels across
+    # the prism curve.
+    n = np.min([new_wavs.shape[0], old_wavs.shape[0]])
+    shift = np.interp(new_wavs[:n], old_wavs, np.arange(old_wavs.shape[0]))
+
+    assert np.max(np.abs(shift - np.arange(n))) < 1.
+
+
+@pytest.mark.parametrize("redshift", [1., 3.21, 5.])
+def test_fused_matches_explicit(prism, spectrum, redshift):
+    R_curve, spec_wavs = prism
+    model = bare_model(spec_wavs, exact_redshift=redshift)
+
+    resampler = model._get_R_curve_resampler({"R_curve": R_curve,
+                                              "redshift": redshift})
+
+    new_wavs = model._get_R_curve_wav_sampling(R_curve)
+
+    fused = resampler.resample(spectrum, redshift)
+    explicit = explicit_broadening(new_wavs, spec_wavs, spectrum, redshift)
+
+    assert np.max(np.abs(fused - explicit)) < 1e-12*np.max(fused)
+
+    # The change from the old Euler sampling is up to ~0.5% of the peak.
+    old = explicit_broadening(euler_sampling(R_curve, spec_wavs), spec_wavs,
+                              spectrum, redshift)
+
+    assert np.max(np.abs(fused - old)) < 1e-2*np.max(fused)
+
+
+def test_resampler_kept_until_resolution_changes(prism):
+    R_curve, spec_wavs = prism
+    model = bare_model(spec_wavs)
+
+    model_comp = {"R_curve": R_curve, "redshift": 3.}
+    resampler = model._get_R_curve_resampler(model_comp)
+
+    assert model._get_R_curve_resampler(dict(model_comp)) is resampler
+
+    model_comp["resolution_p0"] = 1.1
+    scaled = model._get_R_curve_resampler(model_comp)
+
+    assert scaled is not resampler
+    assert model._get_R_curve_resampler(model_comp) is scaled
@@ -0,0 +1,91 @@
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from bagpipes import config
+from bagpipes.models.star_formation_history import star_formation_history
+
+sfh_comps = {"redshift": 0.5,
+             "exponential": {"age": 3., "tau": 0.7, "massformed": 10.,
+                             "metallicity": 1.},
+             "burst": {"age": 0.05, "massformed": 8., "metallicity": 0.5}}
+
+
+def test_rebin_matrix_matches_histogram(model_grids, rng):
+    sfh = star_formation_history(sfh_comps)
+
+    masses = rng.random((3, sfh.ages.shape[0]))
+    hist = np.array([np.histogram(sfh.ages, bins=config.age_bins,
+                                  weights=m)[0] for m in masses])
+
+    np.testing.assert_allclose(sfh.rebin_matrix.dot(masses.T).T, hist,
+                               rtol=1e-12)
+
+
+def test_component_weights_match_histogram(model_grids):
+    sfh = star_formation_history(sfh_comps)
+
+    for comp in ["exponential", "burst"]:
+        masses = sfh.component_sfrs[comp]*sfh.age_widths
+        hist = np.histogram(sfh.ages, bins=config.age_bins,
+                            weights=masses)[0]
+
+        np.testing.assert_allclose(sfh.component_weights[comp], hist,
+                                   rtol=1e-12, atol=0.)
+
+        total = 10**sfh_comps[comp]["massformed"]
+        assert sfh.component_weights[comp].sum() == pytest.approx(total)
+
+
+quadrature_comps = {"exponential": {"age": 3., "tau": 0.7},
+                    "delayed": {"age": 5., "tau": 2.},
+                    "constant": {"age_min": 0.1, "age_max": 2.},
+                    "burst": {"age": 0.5},
+                    "const_exp": {"age": 2., "tau": 0.5},
+                    "lognormal": {"tmax": 2., "fwhm": 1.5},
+                    "dblplaw": {"alpha": 2., "beta": 10., "tau": 3.}}
+
+
+@pytest.mark.parametrize("comp", list(quadrature_comps))
+def test_quadrature_matches_fine_sampling(model_grids, comp):
+    param = dict(quadrature_comps[comp], massformed=10., metallicity=1.)
+
+    fine = star_formation_history({"redshift": 0.5, comp: param})
+    quad = star_formation_history({"redshift": 0.5, comp: param,
+                                   "sfh_quadrature": 4})
+
+    fine_weights = fine.component_weights[comp]
+    quad_weights = quad.component_weights[comp]
+
+    assert quad_weights.sum() == pytest.approx(10**10, rel=1e-12)
+
+    # The fine sampling only approximates the mass in each SSP bin.
+    np.testing.assert_allclose(quad_weights, fine_weights, rtol=0.,
+                               atol=0.01*10**10)
+
+    assert quad.stellar_mass == pytest.approx(fine.stellar_mass, abs=10**-3)
+
+
+@pytest.mark.parametrize("comp", ["exponential", "delayed", "constant",
+                                  "burst"])
+def test_quadrature_rejects_mass_before_big_bang(model_grids, comp):
+    age = 3.5  # Slightly older than the Universe at z = 2.
+
+    if comp == "constant":
+        param = {"age_min": 0.1, "age_max": age}
+
+    elif comp == "burst":
+        param = {"age": age}
+
+    else:
+        param = {"age": age, "tau": 1.}
+
+    param.update(massformed=10., metallicity=1.)
+
+    fine = star_formation_history({"redshift": 2., comp: param})
+    quad = star_formation_history({"redshift": 2., comp: param,
+                                   "sfh_quadrature": 4})
+
+    assert fine.unphysical
+    assert quad.unphysical
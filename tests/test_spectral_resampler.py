@@ -0,0 +1,152 @@
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+import spectres
+
+from bagpipes.models.spectral_resampler import (resampling_matrix,
+                                                spectral_resampler)
+
+# Rest frame sampling at R = 1500 and observed pixels several times wider.
+wavs = np.cumprod(np.r_[1., np.full(36000, 1.+1./3000.)])
+new_wavs = np.linspace(6000., 52000., 2000)
+
+
+@pytest.fixture(scope="module")
+def spectrum():
+    """ A smooth spectrum, which the redshift grid interpolates well. """
+
+    return np.exp(np.sin(50.*np.log(wavs)))
+
+
+def apply(matrix, col_min, flux):
+    if matrix.shape[1] == 0:
+        return np.zeros(matrix.shape[0])
+
+    return matrix.dot(flux[col_min:col_min + matrix.shape[1]])
+
+
+@pytest.mark.parametrize("redshift", [0., 1., 2.3456, 5.])
+def test_matrix_matches_spectres(rng, redshift):
+    flux = rng.random(wavs.shape[0])
+
+    matrix, col_min = resampling_matrix(new_wavs, (1.+redshift)*wavs)
+
+    reference = spectres.spectres(new_wavs, (1.+redshift)*wavs, flux, fill=0)
+
+    assert np.allclose(apply(matrix, col_min, flux), reference,
+                       rtol=1e-12, atol=0.)
+
+
+@pytest.mark.parametrize("sampling", [np.linspace(0.5, 3., 50),
+                                      np.linspace(1.5, 1.6, 400),
+                                      np.linspace(20000., 3*10**8, 100)])
+def test_matrix_partial_overlap(rng, sampling):
+    flux = rng.random(wavs.shape[0])
+
+    matrix, col_min = resampling_matrix(sampling, wavs)
+
+    reference = spectres.spectres(sampling, wavs, flux, fill=0)
+
+    assert np.allclose(apply(matrix, col_min, flux), reference,
+                       rtol=1e-12, atol=0.)
+
+
+def test_exact_at_exact_redshift(spectrum):
+    redshift = 1.23456789
+    resampler = spectral_resampler(new_wavs, wavs, exact_redshift=redshift)
+
+    resampler.resample(spectrum, 1.)
+    fluxes = resampler.resample(spectrum, redshift)
+
+    reference = spectres.spectres(new_wavs, (1.+redshift)*wavs, spectrum,
+                                  fill=0)
+
+    assert np.allclose(fluxes, reference, rtol=1e-12, atol=0.)
+
+
+def test_interpolation_between_redshifts(spectrum):
+    resampler = spectral_resampler(new_wavs, wavs)
+    resampler.resample(spectrum, 1.)
+
+    for redshift in [1.0000037, 0.99999, 1.5432109]:
+        fluxes = resampler.resample(spectrum, redshift)
+
+        reference = spectres.spectres(new_wavs, (1.+redshift)*wavs,
+                                      spectrum, fill=0)
+
+        # Linear interpolation across a z_sampling of 1e-5 is good to
+        # ~2e-5 where pixel edges cross the rest frame bin edges.
+        assert np.allclose(fluxes, reference, rtol=5e-5, atol=0.)
+
+
+def test_independent_of_call_history(spectrum):
+    resampler = spectral_resampler(new_wavs, wavs)
+    reference = spectral_resampler(new_wavs, wavs)
+
+    redshifts = [2.3456789, 0.5, 2.34568, 1.]
+
+    fluxes = [resampler.resample(spectrum, z) for z in redshifts]
+    reverse = [reference.resample(spectrum, z) for z in redshifts[::-1]]
+
+    for i in range(len(redshifts)):
+        assert np.array_equal(fluxes[i], reverse[::-1][i])
+
+
+@pytest.mark.parametrize("exact_redshift", [None, 2.])
+def test_continuous_in_redshift(spectrum, exact_redshift):
+    resampler = spectral_resampler(new_wavs, wavs,
+                                   exact_redshift=exact_redshift)
+
+    redshift = 2.
+    fluxes = resampler.resample(spectrum, redshift)
+
+    # A step of eps in redshift changes the fluxes by of order eps.
+    eps = 10**-9
+    for step in [-eps, eps]:
+        change = resampler.resample(spectrum, redshift + step) - fluxes
+        assert np.max(np.abs(change)) < 10**4*eps*np.max(fluxes)
+
+
+def test_offset_window(spectrum):
+    resampler = spectral_resampler(new_wavs, wavs)
+
+    for redshift in [1., 1.2345678]:
+        start, stop = resampler.window(redshift)
+
+        assert 0 < start < stop < wavs.shape[0]
+
+        window = resampler.resample(spectrum[start:stop], redshift,
+                                    offset=start)
+
+        assert np.array_equal(window, resampler.resample(spectrum, redshift))
+
+
+def test_falls_back_on_spectres(spectrum):
+    resampler = spectral_resampler(new_wavs, wavs)
+
+    redshift = 1.
+    start, stop = resampler.window(redshift)
+    start += 100
+
+    fluxes = resampler.resample(spectrum[start:stop], redshift, offset=start)
+
+    reference = spectres.spectres(new_wavs, (1.+redshift)*wavs[start:stop],
+                                  spectrum[start:stop], fill=0)
+
+    assert np.array_equal(fluxes, reference)
+
+
+def test_cache_size_limit(spectrum):
+    resampler = spectral_resampler(new_wavs, wavs, max_cache_size=10**5)
+
+    for redshift in np.linspace(1., 1.001, 20):
+        resampler.resample(spectrum, redshift)
+
+    matrices = [m[0] for m in resampler.z_cache.values()]
+    size = np.sum([m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+                   for m in matrices])
+
+    assert resampler.z_cache_size == size
+    assert len(resampler.z_cache) >= 2
+    assert size <= 10**5 or len(resampler.z_cache) == 2
@@ -0,0 +1,113 @@
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+import bagpipes as pipes
+
+from bagpipes import config
+
+model_comps = {"redshift": 1.,
+               "exponential": {"age": 2., "tau": 0.5, "massformed": 10.,
+                               "metallicity": 1.},
+               "dust": {"type": "Calzetti", "Av": 0.5},
+               "nebular": {"logU": -3.}}
+
+spec_wavs = np.arange(6000., 9000., 5.)
+
+
+def loop_sampling(R, max_wavs):
+    """ The wavelength sampling built point by point, as it was before
+    the closed-form geometric sequences were used. """
+
+    x = [1.]
+
+    for i in range(len(R)):
+        if i == len(R)-1 or R[i] > R[i+1]:
+            while x[-1] < max_wavs[i]:
+                x.append(x[-1]*(1.+0.5/R[i]))
+
+        else:
+            while x[-1]*(1.+0.5/R[i]) < max_wavs[i]:
+                x.append(x[-1]*(1.+0.5/R[i]))
+
+    return np.array(x)
+
+
+def bare_model(redshift_range):
+    """ A model_galaxy with only the attributes the sampling needs. """
+
+    model = pipes.model_galaxy.__new__(pipes.model_galaxy)
+    model.config = config
+    model.redshift_range = redshift_range
+    model.spec_wavs = spec_wavs
+    model.filt_list = None
+
+    return model
+
+
+@pytest.mark.parametrize("redshift_range", [(0., config.max_redshift),
+                                            (0.5, 2.), (1., 1.)])
+def test_sampling_matches_loop(redshift_range):
+    model = bare_model(redshift_range)
+    wavs = model._get_wavelength_sampling()
+
+    assert np.array_equal(wavs, loop_sampling(model.R, model.max_wavs))
+
+
+def test_sampling_random_ranges(rng):
+    for i in range(100):
+        model = bare_model(tuple(np.sort(rng.uniform(0., 10., 2))))
+        model.spec_wavs = np.sort(rng.uniform(1000., 50000., 2))
+
+        wavs = model._get_wavelength_sampling()
+        assert np.array_equal(wavs, loop_sampling(model.R, model.max_wavs))
+
+
+def spacing_at(wavs, wav):
+    """ The log wavelength spacing of the sampling at wav. """
+
+    ind = np.searchsorted(wavs, wav)
+    return np.log(wavs[ind]/wavs[ind-1])
+
+
+def test_narrow_range_blue_end():
+    wide = bare_model((0., config.max_redshift))._get_wavelength_sampling()
+    narrow = bare_model((1., 1.))._get_wavelength_sampling()
+
+    assert narrow.shape[0] < wide.shape[0]
+
+    # R_spec sampling starts at spec_wavs[0]/(1 + z_max).
+    R_spec = np.log(1. + 0.5/config.R_spec)
+    R_other = np.log(1. + 0.5/config.R_other)
+
+    assert np.isclose(spacing_at(wide, spec_wavs[0]/3.), R_spec)
+    assert np.isclose(spacing_at(narrow, spec_wavs[0]/3.), R_other)
+    assert np.isclose(spacing_at(narrow, spec_wavs[0]/1.9), R_spec)
+
+
+def test_narrow_range_observables(model_grids, filt_list):
+    wide = pipes.model_galaxy(model_comps, filt_list=filt_list,
+                              spec_wavs=spec_wavs)
+
+    narrow = pipes.model_galaxy(model_comps, filt_list=filt_list,
+                                spec_wavs=spec_wavs,
+                                redshift_range=(1., 1.))
+
+    assert narrow.wavelengths.shape[0] < wide.wavelengths.shape[0]
+
+    # The region boundaries move, so the model points shift relative to
+    # the grids and filters. This changes the photometry by up to ~0.3%
+    # and the spectrum by up to ~1% for the same model.
+    assert np.allclose(narrow.photometry, wide.photometry,
+                       rtol=5e-3, atol=0.)
+
+    ratio = np.abs(narrow.spectrum[:, 1]/wide.spectrum[:, 1] - 1.)
+    assert np.max(ratio) < 2e-2
+    assert np.median(ratio) < 2e-3
+
+
+def test_redshift_outside_range(model_grids):
+    with pytest.raises(ValueError):
+        pipes.model_galaxy(model_comps, spec_wavs=spec_wavs,
+                           redshift_range=(1.5, 2.))